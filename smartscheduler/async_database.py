@@ -0,0 +1,355 @@
+import asyncio
+from time import perf_counter
+from smartscheduler.database import DBBase, SmartSchedulerDB, AccountSnapshot
+from smartscheduler.metrics import Metrics
+from smartscheduler.resilience import RetryPolicy, CircuitBreaker
+from smartscheduler.statements import Op
+from smartscheduler.transport import AsyncHTTPTransport, AsyncHTTPError, async_transport_for
+
+__all__ = ["AsyncSmartSchedulerDB"]
+
+
+class AsyncSmartSchedulerDB(DBBase):
+    """
+    The asyncio counterpart of SmartSchedulerDB.
+
+    Every method is a coroutine, and any number of them may be awaited concurrently from a single event loop: requests
+    share a bounded pool of keep-alive connections instead of each one occupying a thread.
+    """
+
+    def __init__(self, server: str = None, timeout: float = SmartSchedulerDB.DEF_TIMEOUT,
+                 transport: AsyncHTTPTransport = None, retry_policy: RetryPolicy = None,
+                 breaker: CircuitBreaker = None, metrics: Metrics = None):
+        """
+        Initialise database manager, use create() instead to also create the required tables.
+        :param server: address of the server that contains the database, or a "sqlite:///" address of a local
+        database file to run commands in process instead
+        :param timeout: optional, the maximum number of seconds to wait for a database command to complete, including
+        any retries, or None to wait indefinitely
+        :param transport: optional, a preconfigured transport to send commands through
+        :param retry_policy: optional, the policy for retrying idempotent requests that could not reach the server
+        :param breaker: optional, the circuit breaker that fails requests fast while the server is down
+        :param metrics: optional, records the latency and size of every request
+        """
+
+        self.server: str = server
+        self.timeout: float = timeout
+        self.transport: AsyncHTTPTransport = transport or async_transport_for(server)
+        self.retry_policy: RetryPolicy = retry_policy or RetryPolicy()
+        self.breaker: CircuitBreaker = breaker or CircuitBreaker()
+        self.metrics: Metrics or None = metrics
+
+    @classmethod
+    async def create(cls, server: str = None, timeout: float = SmartSchedulerDB.DEF_TIMEOUT,
+                     transport: AsyncHTTPTransport = None, retry_policy: RetryPolicy = None,
+                     breaker: CircuitBreaker = None, metrics: Metrics = None):
+        """
+        Initialise a database manager and create the required tables in the database, if they do not already exist.
+        :param server: address of the server that contains the database, or a "sqlite:///" address of a local
+        database file to run commands in process instead
+        :param timeout: optional, the maximum number of seconds to wait for a database command to complete
+        :param transport: optional, a preconfigured transport to send commands through
+        :param retry_policy: optional, the policy for retrying idempotent requests
+        :param breaker: optional, the circuit breaker that fails requests fast while the server is down
+        :param metrics: optional, records the latency and size of every request
+        :return: the new AsyncSmartSchedulerDB
+        """
+
+        db = cls(server, timeout, transport, retry_policy, breaker, metrics)
+        await db.__create_tables__()
+        return db
+
+    async def __create_tables__(self):
+        """Create the required tables in the database, if they do not already exist."""
+
+        for cmd, params in self.create_tables_stmts():
+            await self.__exec_cmd__(cmd, params)
+
+    async def __db_attempt__(self, request_json: dict, sizes: dict = None) -> tuple:
+        """
+        Make a single attempt at sending a request to the database and record its outcome with self.breaker.
+        :param request_json: the request body
+        :param sizes: optional, a dictionary the number of bytes sent and received are added to
+        :return: a tuple containing the response body, whose "db_unavailable" is true if the attempt failed without a
+        response from the server, and a boolean that is true if the server could not be reached
+        """
+
+        succeeded = False
+        try:
+            db_resp = await self.transport.post(request_json, sizes)
+            succeeded = True
+        except asyncio.TimeoutError:
+            return {"db_ret": "Database server took too long to respond.", "db_err": True, "db_unavailable": True}, True
+        except (OSError, EOFError):
+            return {"db_ret": "Cannot reach database (server connection failed).", "db_err": True,
+                    "db_unavailable": True}, True
+        except AsyncHTTPError as e:
+            succeeded = e.status < 500
+            return {"db_ret": e.args[0], "db_err": True, "db_unavailable": not succeeded}, False
+        except ValueError as e:
+            return {"db_ret": f"Database server response could not be decoded ({e}).", "db_err": True,
+                    "db_unavailable": True}, False
+        finally:
+            # also reached when the attempt is cancelled by the caller's deadline
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+        return db_resp, False
+
+    async def __db_request__(self, request_json: dict, idempotent: bool = False, sizes: dict = None) -> dict:
+        """
+        Send a request to the database, see SmartSchedulerDB.__db_request__(). Retries are bounded by the caller's
+        deadline through cancellation.
+        :param request_json: the request body
+        :param idempotent: optional, true if the request can safely be sent more than once, i.e. it is read only
+        :param sizes: optional, a dictionary the number of bytes sent and received are added to
+        :return: the response body, whose "db_ret" is the request's return value and whose "db_err" is true if the
+        request failed
+        """
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                return self.unavailable_resp(self.breaker)
+            db_resp, unreachable = await self.__db_attempt__(request_json, sizes)
+            if not unreachable or not idempotent:
+                return db_resp
+            delay = self.retry_policy.delay(attempt)
+            if delay is None:
+                self.retry_policy.record_giveup()
+                return db_resp
+            self.retry_policy.record_retry()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def __exec_request__(self, request_json: dict, idempotent: bool = False) -> dict:
+        """
+        Send a request to the database and wait until it completes or self.timeout expires.
+
+        A CommonDatabaseError is raised if the request fails, a DatabaseUnavailableError if it failed because the
+        server could not be reached or timed out. The request is recorded with self.metrics, if metrics are enabled.
+        :param request_json: the request body
+        :param idempotent: optional, true if the request can safely be retried
+        :return: the response body
+        """
+
+        sizes = {"sent": 0, "received": 0} if self.metrics is not None else None
+        start = perf_counter()
+        try:
+            db_resp = await asyncio.wait_for(self.__db_request__(request_json, idempotent, sizes), self.timeout)
+        except asyncio.TimeoutError:
+            db_resp = {"db_ret": f"Database request timed out after {self.timeout} seconds.", "db_err": True,
+                       "db_unavailable": True}
+        if sizes is not None:
+            self.record_request(request_json, perf_counter() - start, sizes, db_resp["db_err"])
+        if db_resp["db_err"]:
+            raise self.resp_error(db_resp)
+        return db_resp
+
+    async def __exec_cmd__(self, cmd: Op or str, params: list = None, upd_subs: bool = False, idempotent: bool = False):
+        """
+        Send a SQL command to the database and wait until it completes.
+        :param cmd: the registered operation or SQL command
+        :param params: optional parameters for the SQL command
+        :param upd_subs: a special flag that signals the server to update the list of available subjects
+        :param idempotent: optional, true if the command only reads, so it can safely be retried
+        :return: the command's return value
+        """
+
+        return (await self.__exec_request__(self.__cmd_json__(cmd, params, upd_subs), idempotent))["db_ret"]
+
+    async def batch(self, stmts: list, transaction: bool = False, idempotent: bool = False) -> list:
+        """
+        Execute an ordered list of SQL statements in a single round trip to the server, see SmartSchedulerDB.batch().
+        :param stmts: a list of (cmd, params) tuples, such as those returned by the *_stmt() methods
+        :param transaction: optional, execute all statements in a single transaction if true
+        :param idempotent: optional, true if all statements only read, so the batch can safely be retried
+        :return: a list containing a (db_ret, db_err) tuple for each statement, in the order they were given
+        """
+
+        if not stmts:
+            return []
+        db_ret = (await self.__exec_request__(self.batch_json(stmts, transaction), idempotent))["db_ret"]
+        return [tuple(stmt_ret) for stmt_ret in db_ret]
+
+    async def retrieve_all(self, table: str) -> list:
+        """
+        Retrieve all data from a specific table.
+        :param table: the table to retrieve data from
+        :return: a list containing tuples, one for each record in the table
+        """
+
+        return await self.__exec_cmd__(*self.retrieve_all_stmt(table), idempotent=True)
+
+    async def revalidate_all(self, table: str, etag: str or None) -> tuple:
+        """
+        Retrieve all data from a specific table, unless it is unchanged since it was last retrieved.
+        :param table: the table to retrieve data from
+        :param etag: the ETag of the previously retrieved data, or None if nothing has been retrieved yet
+        :return: a tuple containing the data (or None if it is unchanged) and its current ETag
+        """
+
+        cmd, params, etag = self.revalidate_all_stmt(table, etag)
+        db_resp = await self.__exec_request__(self.__etag_json__(self.__cmd_json__(cmd, params, False), etag), True)
+        return db_resp["db_ret"], db_resp["etag"]
+
+    async def retrieve_page(self, table: str, after: str = None, limit: int = DBBase.DEF_PAGE_SIZE) -> tuple:
+        """
+        Retrieve a page of a table's rows, in the order of its primary key, see SmartSchedulerDB.retrieve_page().
+        :param table: the table to retrieve data from
+        :param after: optional, the key returned with the previous page, or None for the first page
+        :param limit: optional, the maximum number of rows in the page
+        :return: a tuple containing the page's rows, and the key to retrieve the next page with (or None)
+        """
+
+        rows = await self.__exec_cmd__(*self.retrieve_page_stmt(table, after, limit), idempotent=True)
+        return rows, self.next_key(rows, limit)
+
+    async def iter_all(self, table: str, page_size: int = DBBase.DEF_PAGE_SIZE):
+        """
+        Iterate over all rows of a table one page at a time, so only a single page is held in memory at once.
+        :param table: the table to retrieve data from
+        :param page_size: optional, the number of rows retrieved per round trip
+        :return: an asynchronous generator that yields the table's rows, in the order of its primary key
+        """
+
+        after = None
+        while True:
+            rows, after = await self.retrieve_page(table, after, page_size)
+            for row in rows:
+                yield row
+            if after is None:
+                return
+
+    async def new_account(self, s_id: str, pass_hash: str, sch: str, subs: str):
+        """
+        Add a new account to accounts table in the database.
+        :param s_id: the student ID of the account holder
+        :param pass_hash: the account's password hash
+        :param sch: the account's schedule
+        :param subs: the account's registered subjects
+        """
+
+        await self.__exec_cmd__(*self.new_account_stmt(s_id, pass_hash, sch, subs))
+
+    async def query_account_info(self, s_id: str, query_col) -> tuple:
+        """
+        Retrieve a specific account information field in the accounts table via a SQL query.
+        :param s_id: the look up key for the SQL query
+        :param query_col: the account information column to query
+        :return: a tuple containing the field's information
+        """
+
+        return self.first_row(await self.__exec_cmd__(*self.query_account_info_stmt(s_id, query_col), idempotent=True))
+
+    async def query_account(self, s_id: str) -> AccountSnapshot or None:
+        """
+        Retrieve a snapshot of an account's entire row in the accounts table via a single SQL query.
+        :param s_id: the look up key for the SQL query
+        :return: an AccountSnapshot, or None if the account does not exist
+        """
+
+        return self.account_snapshot(await self.__exec_cmd__(*self.query_account_stmt(s_id), idempotent=True))
+
+    async def query_account_infos(self, s_id: str, query_cols: list) -> list:
+        """
+        Retrieve several account information fields in the accounts table in a single batched round trip.
+        :param s_id: the look up key for the SQL queries
+        :param query_cols: the account information columns to query
+        :return: a list containing a tuple for each field's information, in the order of query_cols
+        """
+
+        results = await self.batch([self.query_account_info_stmt(s_id, query_col) for query_col in query_cols],
+                                   transaction=True, idempotent=True)
+        return [self.first_row(db_ret) for db_ret, _ in results]
+
+    async def update_account_info(self, s_id: str, update_col: str, update_val: str):
+        """
+        Update a specific account information field in the accounts table via a SQL command.
+        :param s_id: the look up key for the SQL command
+        :param update_col: the account information column to update
+        :param update_val: the updated value
+        """
+
+        await self.__exec_cmd__(*self.update_account_info_stmt(s_id, update_col, update_val))
+
+    async def update_session_account_info(self, s_id: str, session_id: str, update_col: str, update_val: str) -> bool:
+        """
+        Update a specific account information field, only if a session is logged in to the account.
+        :param s_id: the look up key for the SQL command
+        :param session_id: the session's ID
+        :param update_col: the account information column to update
+        :param update_val: the updated value
+        :return: a boolean that is false if the session is not logged in, in which case nothing is updated
+        """
+
+        return self.changed(await self.batch([
+            self.update_session_account_info_stmt(s_id, session_id, update_col, update_val), self.changes_stmt()
+        ], transaction=True))
+
+    async def delete_account(self, s_id: str):
+        """
+        Remove an account from the accounts table in the database via an SQL command
+        :param s_id: the look up key for the SQL command
+        """
+
+        await self.__exec_cmd__(*self.delete_account_stmt(s_id))
+
+    async def delete_session_account(self, s_id: str, session_id: str) -> bool:
+        """
+        Remove an account from the accounts table, only if a session is logged in to the account.
+        :param s_id: the look up key for the SQL command
+        :param session_id: the session's ID
+        :return: a boolean that is false if the session is not logged in, in which case nothing is removed
+        """
+
+        return self.changed(await self.batch([self.delete_session_account_stmt(s_id, session_id), self.changes_stmt()],
+                                             transaction=True))
+
+    async def class_students(self, sub_code: str, class_type: str, day: str, start: str) -> list:
+        """
+        Retrieve the student IDs of the accounts with a class in their schedule, through the classes table's index.
+        :param sub_code: the class's subject code
+        :param class_type: the class's type
+        :param day: the class's day
+        :param start: the class's start time
+        :return: a sorted list of student IDs
+        """
+
+        return [row[0] for row in await self.__exec_cmd__(*self.class_students_stmt(sub_code, class_type, day, start),
+                                                          idempotent=True)]
+
+    async def subject_students(self, sub_code: str) -> list:
+        """
+        Retrieve the accounts registered to a subject, through the registrations table's index.
+        :param sub_code: the subject code
+        :return: a list of [student ID, class type] lists, sorted by student ID
+        """
+
+        return await self.__exec_cmd__(*self.subject_students_stmt(sub_code), idempotent=True)
+
+    async def student_classes(self, s_id: str) -> list:
+        """
+        Retrieve the classes in an account's schedule from the classes table.
+        :param s_id: the account's student ID
+        :return: a list of [student ID, subject code, class type, day, start time, end time] lists
+        """
+
+        return await self.__exec_cmd__(*self.student_classes_stmt(s_id), idempotent=True)
+
+    async def upd_sub_list(self):
+        """Request the server to update the current list of available subjects."""
+
+        await self.__exec_cmd__(self.upd_sub_list_stmt()[0], upd_subs=True)
+
+    async def close(self):
+        """Close all connections to the server."""
+
+        await self.transport.close()
+
+
+if __name__ == "__main__":
+    # for quick testing
+
+    pass
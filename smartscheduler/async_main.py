@@ -0,0 +1,317 @@
+import asyncio
+from ast import literal_eval
+from passlib.hash import pbkdf2_sha256
+
+from smartscheduler.async_database import AsyncSmartSchedulerDB
+from smartscheduler.cache import CatalogCache
+from smartscheduler.database import AccountSnapshot
+from smartscheduler.exceptions import CommonError, CommonDatabaseError, FatalError
+from smartscheduler.main import SmartScheduler, Schedule
+
+
+__all__ = ["AsyncSmartScheduler"]
+
+
+def catch_db_err_async(db_cmd):
+    """
+    The coroutine counterpart of main.catch_db_err(), re-raises database exceptions as CommonErrors.
+    :param db_cmd: the coroutine function which can potentially raise an exception
+    :return: the wrapper around db_cmd
+    """
+
+    async def wrapper(*args, **kwargs):
+        try:
+            return await db_cmd(*args, **kwargs)
+        except CommonDatabaseError as e:
+            raise CommonError("[DBErr] " + e.args[0])
+    return wrapper
+
+
+class AsyncSmartScheduler:
+    """
+    The asyncio counterpart of SmartScheduler's account and schedule operations.
+
+    Each instance holds a single session, and many instances may share one AsyncSmartSchedulerDB (and so its
+    connection pool) to drive many sessions concurrently from one event loop. Password hashing is moved off the event
+    loop into the default executor.
+    """
+
+    def __init__(self, db: AsyncSmartSchedulerDB):
+        """
+        Initialise instance variables, use create() instead to also connect to the database.
+        :param db: the database manager to send commands through
+        """
+
+        self.db: AsyncSmartSchedulerDB = db
+        self.subjects_cache = CatalogCache(db)
+        self.session_id = None
+        self.student_id = None
+        self.curr_class_link = None
+
+    @classmethod
+    async def create(cls, test_server: str = None, db: AsyncSmartSchedulerDB = None):
+        """
+        Initialise an AsyncSmartScheduler and update the list of subjects available for registration.
+        :param test_server: optional, test server address
+        :param db: optional, an existing database manager to share
+        :return: the new AsyncSmartScheduler
+        """
+
+        try:
+            db = db or await AsyncSmartSchedulerDB.create(test_server or SmartScheduler.DEF_SERVER)
+        except CommonDatabaseError as e:
+            raise FatalError("[DBErr] " + e.args[0])
+        smart_sch = cls(db)
+        await smart_sch.update_sub_list()
+        return smart_sch
+
+    @staticmethod
+    async def __in_executor__(func, *args):
+        """
+        Run a blocking function in the event loop's default executor.
+        :param func: the blocking function
+        :param args: the function's arguments
+        :return: the function's return value
+        """
+
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def __chk_account__(self, account: AccountSnapshot or None) -> AccountSnapshot:
+        """
+        Check that an account snapshot belongs to the current session, see SmartScheduler.__chk_account__().
+        :param account: an AccountSnapshot of the account
+        :return: account, if it belongs to the current session
+        """
+
+        return SmartScheduler.__chk_snapshot__(account, self.session_id)
+
+    def __chk_write__(self, written: bool):
+        """
+        Check the outcome of a write conditioned on the current session, see SmartScheduler.__chk_write__().
+        :param written: the return value of the conditional write
+        """
+
+        if not written:
+            raise CommonError(flag="l_out")
+
+    async def __chk_s_id__(self, student_id: str) -> bool:
+        """
+        Check if an account exists in the accounts table in the database.
+        :param student_id: the account's student ID
+        :return: a boolean to confirm the account's existence
+        """
+
+        SmartScheduler.__valid_s_id__(student_id)
+        return await self.db.query_account_info(student_id, self.db.COL_STU_ID) != []
+
+    async def __logged_in__(self, student_id: str) -> bool:
+        """
+        Check if current session is logged in, see SmartScheduler.__logged_in__().
+        :param student_id: the account's student ID
+        :return: a boolean to confirm if the current session is logged in
+        """
+
+        return (await self.db.query_account_info(student_id, self.db.COL_SESSION_ID))[0] == self.session_id
+
+    async def login(self, student_id: str, pswrd: str):
+        """
+        Login to an account, see SmartScheduler.login().
+        :param student_id: the account's student ID
+        :param pswrd: the account's password
+        """
+
+        try:
+            SmartScheduler.__valid_s_id__(student_id)
+            account = await self.db.query_account(student_id)
+            if account is None:
+                raise ValueError("Student ID not found.")
+            if not await self.__in_executor__(pbkdf2_sha256.verify, pswrd, account.pswrd_hash):
+                raise ValueError("Incorrect password.")
+            if account.session_id != "0":
+                raise CommonError("This account is already logged in through a device.", flag="l_in")
+            session_id = SmartScheduler.__new_session_id__()
+            await self.db.update_account_info(student_id, self.db.COL_SESSION_ID, session_id)
+        except ValueError as e:
+            raise CommonError(e.args[0])
+        except CommonDatabaseError as e:
+            raise CommonError("[DBErr] " + e.args[0])
+        else:
+            self.session_id = session_id
+            self.student_id = student_id
+
+    async def logout(self, remote_student_id: str = None):
+        """
+        Logout of an account, see SmartScheduler.logout().
+        :param remote_student_id: the account's student ID for logging out remotely
+        """
+
+        try:
+            if remote_student_id:
+                return await self.db.update_account_info(remote_student_id, self.db.COL_SESSION_ID, "0")
+            await self.db.update_session_account_info(self.student_id, self.session_id, self.db.COL_SESSION_ID, "0")
+        except CommonDatabaseError as e:
+            raise CommonError("[DBErr] " + e.args[0])
+        else:
+            self.student_id = None
+
+    async def change_pswrd(self, student_id: str, old_pswrd: str, new_pswrd: str, conf_pswrd: str):
+        """
+        Change an account's password, see SmartScheduler.change_pswrd().
+        :param student_id: the account's student ID
+        :param old_pswrd: the account's old password
+        :param new_pswrd: the account's new password
+        :param conf_pswrd: new password confirmation
+        """
+
+        try:
+            SmartScheduler.__valid_s_id__(student_id)
+            account = await self.db.query_account(student_id)
+            if account is None:
+                raise ValueError("Student ID not found.")
+            if not await self.__in_executor__(pbkdf2_sha256.verify, old_pswrd, account.pswrd_hash):
+                raise ValueError("Incorrect old password.")
+            if not new_pswrd == conf_pswrd:
+                raise ValueError("Password confirmation failed, please try again.")
+            pass_hash = await self.__in_executor__(pbkdf2_sha256.hash, new_pswrd)
+            await self.db.update_account_info(student_id, self.db.COL_PSWRD_HASH, pass_hash)
+        except ValueError as e:
+            raise CommonError(e.args[0])
+        except CommonDatabaseError as e:
+            raise CommonError("[DBErr] " + e.args[0])
+
+    async def sign_up(self, student_id: str, pswrd: str, conf_pswrd: str):
+        """
+        Create an account, see SmartScheduler.sign_up().
+        :param student_id: a student ID for the account
+        :param pswrd: a password for the account
+        :param conf_pswrd: confirmation for the password
+        """
+
+        try:
+            if await self.__chk_s_id__(student_id):
+                raise ValueError("Student ID already registered.")
+            if not pswrd == conf_pswrd:
+                raise ValueError("Password confirmation failed, please try again.")
+            pass_hash = await self.__in_executor__(pbkdf2_sha256.hash, pswrd)
+            await self.db.new_account(student_id, pass_hash, str(Schedule.empty_schedule()), str({}))
+        except ValueError as e:
+            raise CommonError(e.args[0])
+        except CommonDatabaseError as e:
+            raise CommonError("[DBErr] " + e.args[0])
+
+    @catch_db_err_async
+    async def delete_acc(self):
+        """
+        Delete the account corresponding to self.student_id from the database's accounts table.
+
+        Raises CommonError if current session is not logged in.
+        """
+
+        self.__chk_write__(await self.db.delete_session_account(self.student_id, self.session_id))
+
+    @catch_db_err_async
+    async def get_account_snapshot(self) -> AccountSnapshot:
+        """
+        Retrieve a snapshot of the account associated with self.student_id from the database in a single query.
+
+        Raises CommonError if current session is not logged in.
+        :return: an AccountSnapshot of the account
+        """
+
+        return self.__chk_account__(await self.db.query_account(self.student_id))
+
+    @catch_db_err_async
+    async def get_account_data(self) -> tuple:
+        """
+        Retrieve a snapshot of the account associated with self.student_id and the available subjects together.
+
+        Raises CommonError if current session is not logged in.
+        :return: a tuple containing an AccountSnapshot and the subjects info as a dictionary
+        """
+
+        stmts = [self.db.query_account_stmt(self.student_id)]
+        if not self.subjects_cache.fresh:
+            stmts.append(self.subjects_cache.revalidate_stmt())
+        (account_ret, _), *catalog_ret = await self.db.batch(stmts, transaction=True, idempotent=True)
+        account = self.__chk_account__(self.db.account_snapshot(account_ret))
+        if catalog_ret:
+            subs_info, _, etag = catalog_ret[0]
+            subjects_info = self.subjects_cache.update(subs_info, etag)
+            if subjects_info is not None:
+                return account, subjects_info
+        return account, await self.get_subjects_info()
+
+    async def get_schedule(self) -> dict:
+        """
+        Retrieve the schedule associated with self.student_id from the database.
+
+        Raises CommonError if current session is not logged in.
+        :return: the schedule as a dictionary
+        """
+
+        return literal_eval((await self.get_account_snapshot()).schedule)
+
+    async def get_reg_subjects(self) -> dict:
+        """
+        Retrieve the registered subjects associated with self.student_id from the database.
+
+        Raises CommonError if current session is not logged in.
+        :return: the registered subjects as a dictionary
+        """
+
+        return literal_eval((await self.get_account_snapshot()).reg_subjects)
+
+    @catch_db_err_async
+    async def update_reg_subjects(self, new_subs: dict):
+        """
+        Update the registered subjects associated with self.student_id from the database.
+
+        Raises CommonError if current session is not logged in.
+        :param new_subs: the updated subjects to store in the database
+        """
+
+        self.__chk_write__(await self.db.update_session_account_info(self.student_id, self.session_id,
+                                                                     self.db.COL_SUBJECTS, str(new_subs)))
+
+    @catch_db_err_async
+    async def update_schedule(self, new_sch: dict):
+        """
+        Update the schedule associated with self.student_id from the database.
+
+        Raises CommonError if current session is not logged in.
+        :param new_sch: the updated schedule to store in the database
+        """
+
+        self.__chk_write__(await self.db.update_session_account_info(self.student_id, self.session_id,
+                                                                     self.db.COL_SCHEDULE, str(new_sch)))
+
+    @catch_db_err_async
+    async def get_subjects_info(self) -> dict:
+        """
+        Retrieve the list of subjects available for registration, read through self.subjects_cache.
+        :return: A dictionary where the keys are the subject codes and the values are the corresponding subject names.
+        """
+
+        if self.subjects_cache.fresh:
+            return self.subjects_cache.get()
+        subjects_info = self.subjects_cache.update(*await self.db.revalidate_all(self.db.TAB_SUB_INFO,
+                                                                                 self.subjects_cache.etag))
+        if subjects_info is None:
+            subjects_info = self.subjects_cache.update(*await self.db.revalidate_all(self.db.TAB_SUB_INFO, None))
+        return subjects_info
+
+    async def update_sub_list(self):
+        """Update the list of subjects available for registration, and invalidate the cached list."""
+
+        try:
+            await self.db.upd_sub_list()
+        except CommonDatabaseError as e:
+            raise FatalError(e.args[0])
+        finally:
+            self.subjects_cache.invalidate()
+
+
+if __name__ == "__main__":
+    # for quick testing
+
+    pass
@@ -0,0 +1,101 @@
+from threading import Lock
+from time import monotonic
+
+from smartscheduler.database import DBBase
+
+
+__all__ = ["CatalogCache"]
+
+
+class CatalogCache:
+    """
+    A read-through cache of the subjects catalog, i.e. the list of subjects available for registration.
+
+    The cached catalog is revalidated against the ETag the server computes for it, so an unchanged catalog costs a
+    request whose response carries no rows. Within max_age seconds of the last revalidation the cache is trusted
+    without asking the server at all.
+    """
+
+    def __init__(self, db: DBBase, max_age: float = 0.0):
+        """
+        Initialise an empty cache.
+        :param db: the database manager the catalog is retrieved from
+        :param max_age: optional, the number of seconds a revalidated catalog is trusted without revalidating it
+        """
+
+        self.db: DBBase = db
+        self.max_age: float = max_age
+        self._subjects_info: dict or None = None
+        self._etag: str or None = None
+        self._validated: float = 0.0
+        self._lock: Lock = Lock()
+
+    @property
+    def fresh(self) -> bool:
+        """
+        Check if the cached catalog can be used without revalidating it.
+        :return: a boolean to confirm if the cached catalog is fresh
+        """
+
+        return self._subjects_info is not None and monotonic() - self._validated < self.max_age
+
+    @property
+    def etag(self) -> str or None:
+        return self._etag
+
+    def revalidate_stmt(self) -> tuple:
+        """
+        Build the conditional statement that revalidates the cached catalog, for sending in a batch.
+        :return: a (cmd, params, etag) tuple
+        """
+
+        return self.db.revalidate_all_stmt(self.db.TAB_SUB_INFO, self._etag)
+
+    def update(self, subs_info: list or None, etag: str) -> dict or None:
+        """
+        Update the cache with the result of a revalidation.
+
+        The catalog may have been invalidated while it was being revalidated, in which case an unchanged catalog leaves
+        nothing to return, and it must be retrieved again unconditionally, i.e. without an ETag.
+        :param subs_info: the retrieved subjects table, or None if it is unchanged
+        :param etag: the subjects table's current ETag
+        :return: the cached catalog, or None if it is unchanged but no catalog is cached
+        """
+
+        with self._lock:
+            if subs_info is None and self._subjects_info is None:
+                return None
+            if subs_info is not None:
+                self._subjects_info = {info[0]: info[1] for info in subs_info}
+            self._etag = etag
+            self._validated = monotonic()
+            return dict(self._subjects_info)
+
+    def get(self) -> dict:
+        """
+        Return the catalog, revalidating it with the server first unless it is fresh.
+
+        Revalidating blocks, so asyncio database managers should use revalidate_stmt() and update() instead.
+        :return: A dictionary where the keys are the subject codes and the values are the corresponding subject names.
+        """
+
+        if self.fresh:
+            return dict(self._subjects_info)
+        subjects_info = self.update(*self.db.revalidate_all(self.db.TAB_SUB_INFO, self._etag))
+        if subjects_info is None:
+            subjects_info = self.update(*self.db.revalidate_all(self.db.TAB_SUB_INFO, None))
+        return subjects_info
+
+    def invalidate(self):
+        """Discard the cached catalog, so the next access downloads it again."""
+
+        with self._lock:
+            self._subjects_info = None
+            self._etag = None
+            self._validated = 0.0
+
+
+if __name__ == "__main__":
+    # for quick testing
+
+    pass
@@ -0,0 +1,274 @@
+import json
+import struct
+
+
+__all__ = ["JSONCodec", "BinaryCodec", "codec_for", "CODECS"]
+
+
+class JSONCodec:
+    """Encodes request and response bodies as UTF-8 JSON, the default wire format."""
+
+    CONTENT_TYPE: str = "application/json"
+
+    @staticmethod
+    def encode(obj) -> bytes:
+        """
+        Encode a body.
+        :param obj: the JSON serialisable body
+        :return: the encoded body
+        """
+
+        return json.dumps(obj).encode("utf-8")
+
+    @staticmethod
+    def decode(data: bytes):
+        """
+        Decode a body.
+        :param data: the encoded body
+        :return: the decoded body
+        """
+
+        return json.loads(data)
+
+
+class BinaryCodec:
+    """
+    Encodes request and response bodies in a compact, length prefixed binary format.
+
+    The format is a subset of MessagePack: None, booleans, integers, floats, strings, lists (tuples are encoded as
+    lists) and dictionaries. Small integers, short strings and short lists take a single type byte.
+
+    It is extended with a string table type (type byte 0xc1, unused by MessagePack) for lists of equally long rows of
+    strings, such as the rows returned by SQL queries: the cells are stored as one NUL separated UTF-8 text, so the
+    whole table is encoded and decoded with a few bulk operations instead of one per cell. Tables whose cells contain
+    NUL characters are encoded as plain lists.
+    """
+
+    CONTENT_TYPE: str = "application/x-smartscheduler-bin"
+
+    _INT8, _INT16, _INT32, _INT64 = struct.Struct(">b"), struct.Struct(">h"), struct.Struct(">i"), struct.Struct(">q")
+    _UINT8, _UINT16, _UINT32 = struct.Struct(">B"), struct.Struct(">H"), struct.Struct(">I")
+    _FLOAT64 = struct.Struct(">d")
+    _TABLE = struct.Struct(">IHI")
+
+    @staticmethod
+    def __encode_table__(obj: list, out: bytearray) -> bool:
+        """
+        Append the encoding of a list as a string table to a buffer, if it is a list of equally long rows of strings.
+        :param obj: the list to encode
+        :param out: the buffer
+        :return: a boolean that is false if the list is not a table, in which case nothing is appended
+        """
+
+        if not set(map(type, obj)) <= {list, tuple} or len(set(map(len, obj))) != 1 or not obj[0]:
+            return False
+        cols = len(obj[0])
+        cells = [cell for row in obj for cell in row]
+        try:
+            text = "\0".join(cells)
+        except TypeError:
+            return False
+        if text.count("\0") != len(cells) - 1:
+            return False
+        blob = text.encode("utf-8")
+        out += b"\xc1" + BinaryCodec._TABLE.pack(len(obj), cols, len(blob))
+        out += blob
+        return True
+
+    @staticmethod
+    def __decode_table__(data: bytes, pos: int) -> tuple:
+        """
+        Decode the string table that starts at a position in a buffer.
+        :param data: the buffer
+        :param pos: the position after the table's type byte
+        :return: a tuple containing the decoded list of rows and the position after it
+        """
+
+        rows, cols, blob_len = BinaryCodec._TABLE.unpack_from(data, pos)
+        pos += BinaryCodec._TABLE.size
+        cells = data[pos:pos + blob_len].decode("utf-8").split("\0")
+        if len(cells) != rows * cols:
+            raise ValueError("string table size mismatch")
+        return list(map(list, zip(*[iter(cells)] * cols))), pos + blob_len
+
+    @staticmethod
+    def __encode_into__(obj, out: bytearray):
+        """
+        Append the encoding of an object to a buffer.
+        :param obj: the object to encode
+        :param out: the buffer
+        """
+
+        obj_type = type(obj)
+        if obj_type is str:
+            data = obj.encode("utf-8")
+            size = len(data)
+            if size < 32:
+                out.append(0xa0 | size)
+            elif size < 0x100:
+                out += b"\xd9" + BinaryCodec._UINT8.pack(size)
+            elif size < 0x10000:
+                out += b"\xda" + BinaryCodec._UINT16.pack(size)
+            else:
+                out += b"\xdb" + BinaryCodec._UINT32.pack(size)
+            out += data
+        elif obj_type is list or obj_type is tuple:
+            size = len(obj)
+            if size and BinaryCodec.__encode_table__(obj, out):
+                return
+            if size < 16:
+                out.append(0x90 | size)
+            elif size < 0x10000:
+                out += b"\xdc" + BinaryCodec._UINT16.pack(size)
+            else:
+                out += b"\xdd" + BinaryCodec._UINT32.pack(size)
+            for item in obj:
+                BinaryCodec.__encode_into__(item, out)
+        elif obj is None:
+            out.append(0xc0)
+        elif obj_type is bool:
+            out.append(0xc3 if obj else 0xc2)
+        elif obj_type is int:
+            if 0 <= obj < 0x80:
+                out.append(obj)
+            elif -32 <= obj < 0:
+                out.append(obj & 0xff)
+            elif -0x80 <= obj < 0x80:
+                out += b"\xd0" + BinaryCodec._INT8.pack(obj)
+            elif -0x8000 <= obj < 0x8000:
+                out += b"\xd1" + BinaryCodec._INT16.pack(obj)
+            elif -0x80000000 <= obj < 0x80000000:
+                out += b"\xd2" + BinaryCodec._INT32.pack(obj)
+            else:
+                out += b"\xd3" + BinaryCodec._INT64.pack(obj)
+        elif obj_type is float:
+            out += b"\xcb" + BinaryCodec._FLOAT64.pack(obj)
+        elif obj_type is dict:
+            size = len(obj)
+            if size < 16:
+                out.append(0x80 | size)
+            elif size < 0x10000:
+                out += b"\xde" + BinaryCodec._UINT16.pack(size)
+            else:
+                out += b"\xdf" + BinaryCodec._UINT32.pack(size)
+            for key, value in obj.items():
+                BinaryCodec.__encode_into__(key, out)
+                BinaryCodec.__encode_into__(value, out)
+        else:
+            raise TypeError(f"Object of type {obj_type.__name__} cannot be encoded.")
+
+    @staticmethod
+    def __decode_from__(data: bytes, pos: int) -> tuple:
+        """
+        Decode the object that starts at a position in a buffer.
+        :param data: the buffer
+        :param pos: the position of the object's type byte
+        :return: a tuple containing the decoded object and the position after it
+        """
+
+        tag = data[pos]
+        pos += 1
+        if tag < 0x80:
+            return tag, pos
+        if 0xa0 <= tag < 0xc0:
+            end = pos + (tag & 0x1f)
+            return data[pos:end].decode("utf-8"), end
+        if 0x90 <= tag < 0xa0:
+            size = tag & 0x0f
+        elif 0x80 <= tag < 0x90:
+            return BinaryCodec.__decode_map__(data, pos, tag & 0x0f)
+        elif tag >= 0xe0:
+            return tag - 0x100, pos
+        elif tag == 0xc0:
+            return None, pos
+        elif tag == 0xc2 or tag == 0xc3:
+            return tag == 0xc3, pos
+        elif 0xd9 <= tag <= 0xdb:
+            length = (BinaryCodec._UINT8, BinaryCodec._UINT16, BinaryCodec._UINT32)[tag - 0xd9]
+            size = length.unpack_from(data, pos)[0]
+            pos += length.size
+            return data[pos:pos + size].decode("utf-8"), pos + size
+        elif 0xd0 <= tag <= 0xd3:
+            number = (BinaryCodec._INT8, BinaryCodec._INT16, BinaryCodec._INT32, BinaryCodec._INT64)[tag - 0xd0]
+            return number.unpack_from(data, pos)[0], pos + number.size
+        elif tag == 0xcb:
+            return BinaryCodec._FLOAT64.unpack_from(data, pos)[0], pos + 8
+        elif tag == 0xdc or tag == 0xdd:
+            length = BinaryCodec._UINT16 if tag == 0xdc else BinaryCodec._UINT32
+            size = length.unpack_from(data, pos)[0]
+            pos += length.size
+        elif tag == 0xc1:
+            return BinaryCodec.__decode_table__(data, pos)
+        elif tag == 0xde or tag == 0xdf:
+            length = BinaryCodec._UINT16 if tag == 0xde else BinaryCodec._UINT32
+            return BinaryCodec.__decode_map__(data, pos + length.size, length.unpack_from(data, pos)[0])
+        else:
+            raise ValueError(f"Unknown type byte 0x{tag:02x} at position {pos - 1}.")
+        items = []
+        for _ in range(size):
+            item, pos = BinaryCodec.__decode_from__(data, pos)
+            items.append(item)
+        return items, pos
+
+    @staticmethod
+    def __decode_map__(data: bytes, pos: int, size: int) -> tuple:
+        """
+        Decode the entries of a dictionary that start at a position in a buffer.
+        :param data: the buffer
+        :param pos: the position of the first key
+        :param size: the number of entries
+        :return: a tuple containing the decoded dictionary and the position after it
+        """
+
+        obj = {}
+        for _ in range(size):
+            key, pos = BinaryCodec.__decode_from__(data, pos)
+            obj[key], pos = BinaryCodec.__decode_from__(data, pos)
+        return obj, pos
+
+    @staticmethod
+    def encode(obj) -> bytes:
+        """
+        Encode a body.
+        :param obj: the body
+        :return: the encoded body
+        """
+
+        out = bytearray()
+        BinaryCodec.__encode_into__(obj, out)
+        return bytes(out)
+
+    @staticmethod
+    def decode(data: bytes):
+        """
+        Decode a body, raising ValueError if it is malformed.
+        :param data: the encoded body
+        :return: the decoded body
+        """
+
+        try:
+            obj, pos = BinaryCodec.__decode_from__(data, 0)
+        except (IndexError, struct.error, UnicodeDecodeError) as e:
+            raise ValueError(f"Malformed binary body: {e}")
+        if pos != len(data):
+            raise ValueError("Malformed binary body: trailing data.")
+        return obj
+
+
+CODECS: dict = {JSONCodec.CONTENT_TYPE: JSONCodec, BinaryCodec.CONTENT_TYPE: BinaryCodec}
+
+
+def codec_for(content_type: str or None):
+    """
+    Return the codec for a Content-Type header.
+    :param content_type: the value of the Content-Type header, parameters such as charset are ignored
+    :return: the codec, or None if the content type is not supported
+    """
+
+    return CODECS.get((content_type or "").split(";")[0].strip().lower())
+
+
+if __name__ == "__main__":
+    # for quick testing
+
+    pass
@@ -1,99 +1,573 @@
 import requests
-from threading import Thread
-from smartscheduler.exceptions import CommonDatabaseError
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from time import monotonic, perf_counter, sleep
+from typing import NamedTuple
+from smartscheduler.exceptions import CommonDatabaseError, DatabaseUnavailableError
+from smartscheduler.metrics import Metrics
+from smartscheduler.resilience import RetryPolicy, CircuitBreaker
+from smartscheduler.statements import Op, Schema
+from smartscheduler.transport import HTTPTransport, transport_for
 
-__all__ = ["SmartSchedulerDB"]
+__all__ = ["DBBase", "SmartSchedulerDB", "AccountSnapshot"]
 
 
-class SmartSchedulerDB:
-    """Manages the database for the Smart Scheduler application."""
+class AccountSnapshot(NamedTuple):
+    """A typed record of a single row in the accounts table."""
 
-    TAB_ACCOUNTS = "Accounts"
-    COL_STU_ID = "Student_ID"
-    COL_PSWRD_HASH = "Pswrd_hash"
-    COL_SCHEDULE = "Schedule"
-    COL_SUBJECTS = "Reg_subjects"
-    COL_SESSION_ID = "Session_ID"
-    TAB_SUB_INFO = "Subjects"
-    COL_SUB_CODE = "Subject_code"
-    COL_SUB_NAME = "Subject_name"
+    student_id: str
+    pswrd_hash: str
+    schedule: str
+    reg_subjects: str
+    session_id: str
 
-    def __init__(self, server: str = None):
+
+class DBBase(Schema):
+    """
+    Builds the commands understood by the database server.
+
+    Commands refer to the server's statement registry (see smartscheduler.statements) by operation ID, so no SQL text
+    is built or sent per call. This class does no I/O itself, it is shared by the threaded and the asyncio database
+    managers.
+    """
+
+    DEF_PAGE_SIZE: int = 500
+    _NOT_TRACKED = nullcontext()
+
+    @staticmethod
+    def __cmd_json__(cmd: Op or str, params: list or None, upd_subs: bool) -> dict:
+        """
+        Build the JSON request body for a single command.
+        :param cmd: A registered operation, or the text of an ad hoc SQL command, which the server only executes if
+        it allows ad hoc SQL for maintenance
+        :param params: Any additional parameters for the command
+        :param upd_subs: A special flag that signals the server to update the list of available subjects
+        :return: the request body as a dictionary
+        """
+
+        if type(cmd) is not Op:
+            return {"cmd": cmd, "cmd_params": ["upd_subs"] if upd_subs else params}
+        request_json = {"op": cmd.op_id, "cmd_params": ["upd_subs"] if upd_subs else params}
+        if cmd.name is not None:
+            request_json["name"] = cmd.name
+        return request_json
+
+    def create_tables_stmts(self) -> list:
+        """
+        Build the SQL statements that create the required tables, if they do not already exist. The normalized
+        registrations and classes tables are created by the server, see MIGRATIONS.
+        :return: a list of (cmd, params) tuples
+        """
+
+        return [(Op("accounts.create"), None), (Op("subjects.create"), None)]
+
+    def batch_json(self, stmts: list, transaction: bool) -> dict:
+        """
+        Build the JSON request body for a batch of SQL statements.
+        :param stmts: a list of (cmd, params) or (cmd, params, etag) tuples
+        :param transaction: execute all statements in a single transaction if true
+        :return: the request body as a dictionary
+        """
+
+        batch = [self.__etag_json__(self.__cmd_json__(cmd, params, False), *etag) for cmd, params, *etag in stmts]
+        return {"batch": batch, "transaction": transaction}
+
+    @staticmethod
+    def __etag_json__(request_json: dict, etag: str = None) -> dict:
+        """
+        Make a request conditional on the ETag of its result, if an ETag is given.
+
+        The server then returns the result's current ETag along with it, and only returns the result itself if its
+        ETag is different from the given one. An empty ETag always matches nothing.
+        :param request_json: the request body
+        :param etag: optional, the ETag of a previously retrieved result
+        :return: the request body as a dictionary
+        """
+
+        if etag is not None:
+            request_json["etag"] = etag
+        return request_json
+
+    def retrieve_all_stmt(self, table: str) -> tuple:
+        """
+        Build the SQL statement that retrieves all data from a specific table.
+        :param table: the table to retrieve data from
+        :return: a (cmd, params) tuple
+        """
+
+        return Op(f"{table.lower()}.all"), None
+
+    def retrieve_page_stmt(self, table: str, after: str or None, limit: int) -> tuple:
+        """
+        Build the SQL statement that retrieves a page of a table's rows, in the order of its primary key.
+
+        Pages are keyset paginated: a page starts right after the key of the previous page's last row, so every page
+        is an index range scan and rows added or removed between pages do not shift the pages that follow.
+        :param table: the table to retrieve data from
+        :param after: the primary key of the last row of the previous page, or None for the first page
+        :param limit: the maximum number of rows in the page
+        :return: a (cmd, params) tuple
+        """
+
+        return Op(f"{table.lower()}.page"), [after or "", limit]
+
+    def stream_json(self, cmd: Op, params: list or None) -> dict:
+        """
+        Build the JSON request body for a query whose rows the server streams back as newline delimited JSON.
+        :param cmd: A registered operation
+        :param params: Any additional parameters for the operation
+        :return: the request body as a dictionary
+        """
+
+        request_json = self.__cmd_json__(cmd, params, False)
+        request_json["stream"] = True
+        return request_json
+
+    def revalidate_all_stmt(self, table: str, etag: str or None) -> tuple:
+        """
+        Build the conditional SQL statement that retrieves all data from a table only if it has changed.
+        :param table: the table to retrieve data from
+        :param etag: the ETag of the previously retrieved data, or None if nothing has been retrieved yet
+        :return: a (cmd, params, etag) tuple
+        """
+
+        return (*self.retrieve_all_stmt(table), etag or "")
+
+    def query_account_info_stmt(self, s_id: str, query_col: str) -> tuple:
+        """
+        Build the SQL statement that retrieves a specific account information field from the accounts table.
+        :param s_id: the look up key for the SQL query
+        :param query_col: the account information column to query
+        :return: a (cmd, params) tuple
+        """
+
+        return Op("account.get_col", query_col), [s_id]
+
+    def query_account_stmt(self, s_id: str) -> tuple:
+        """
+        Build the SQL statement that retrieves every account information field of an account in a single query.
+        :param s_id: the look up key for the SQL query
+        :return: a (cmd, params) tuple
+        """
+
+        return Op("account.get"), [s_id]
+
+    def update_account_info_stmt(self, s_id: str, update_col: str, update_val: str) -> tuple:
+        """
+        Build the SQL statement that updates a specific account information field in the accounts table.
+        :param s_id: the look up key for the SQL command
+        :param update_col: the account information column to update
+        :param update_val: the updated value
+        :return: a (cmd, params) tuple
+        """
+
+        return Op("account.set_col", update_col), [update_val, s_id]
+
+    def update_session_account_info_stmt(self, s_id: str, session_id: str, update_col: str, update_val: str) -> tuple:
+        """
+        Build the SQL statement that updates an account information field only if a session is logged in to it.
+        :param s_id: the look up key for the SQL command
+        :param session_id: the session's ID
+        :param update_col: the account information column to update
+        :param update_val: the updated value
+        :return: a (cmd, params) tuple
+        """
+
+        return Op("account.set_col_session", update_col), [update_val, s_id, session_id]
+
+    def replace_session_account_info_stmt(self, s_id: str, session_id: str, update_col: str, update_val: str,
+                                          base_val: str) -> tuple:
+        """
+        Build the SQL statement that updates an account information field only if a session is logged in to it and
+        the field still holds the value the update was based on.
+        :param s_id: the look up key for the SQL command
+        :param session_id: the session's ID
+        :param update_col: the account information column to update
+        :param update_val: the updated value
+        :param base_val: the value the update was based on
+        :return: a (cmd, params) tuple
+        """
+
+        return Op("account.replace_col_session", update_col), [update_val, s_id, session_id, base_val]
+
+    def new_account_stmt(self, s_id: str, pass_hash: str, sch: str, subs: str) -> tuple:
+        """
+        Build the SQL statement that adds a new, logged out account to the accounts table.
+        :param s_id: the student ID of the account holder
+        :param pass_hash: the account's password hash
+        :param sch: the account's schedule
+        :param subs: the account's registered subjects
+        :return: a (cmd, params) tuple
+        """
+
+        return Op("account.new"), [s_id, pass_hash, sch, subs, "0"]
+
+    def delete_account_stmt(self, s_id: str) -> tuple:
+        """
+        Build the SQL statement that removes an account from the accounts table.
+        :param s_id: the look up key for the SQL command
+        :return: a (cmd, params) tuple
+        """
+
+        return Op("account.delete"), [s_id]
+
+    def delete_session_account_stmt(self, s_id: str, session_id: str) -> tuple:
+        """
+        Build the SQL statement that removes an account from the accounts table only if a session is logged in to it.
+        :param s_id: the look up key for the SQL command
+        :param session_id: the session's ID
+        :return: a (cmd, params) tuple
+        """
+
+        return Op("account.delete_session"), [s_id, session_id]
+
+    def class_students_stmt(self, sub_code: str, class_type: str, day: str, start: str) -> tuple:
+        """
+        Build the SQL statement that retrieves the student IDs of the accounts with a class in their schedule.
+        :param sub_code: the class's subject code
+        :param class_type: the class's type
+        :param day: the class's day
+        :param start: the class's start time
+        :return: a (cmd, params) tuple
+        """
+
+        return Op("classes.at"), [day, start, sub_code, class_type]
+
+    def subject_students_stmt(self, sub_code: str) -> tuple:
+        """
+        Build the SQL statement that retrieves the accounts registered to a subject.
+        :param sub_code: the subject code
+        :return: a (cmd, params) tuple
+        """
+
+        return Op("registrations.subject"), [sub_code]
+
+    def student_classes_stmt(self, s_id: str) -> tuple:
+        """
+        Build the SQL statement that retrieves the classes in an account's schedule, from the classes table.
+        :param s_id: the account's student ID
+        :return: a (cmd, params) tuple
+        """
+
+        return Op("classes.student"), [s_id]
+
+    @staticmethod
+    def changes_stmt() -> tuple:
+        """
+        Build the SQL statement that returns the number of rows changed by the previous statement in the same batch.
+        :return: a (cmd, params) tuple
+        """
+
+        return Op("changes"), None
+
+    def upd_sub_list_stmt(self) -> tuple:
+        """
+        Build the SQL statement the server uses to update the list of available subjects.
+        :return: a (cmd, params) tuple, the server fills in the parameters itself
+        """
+
+        return Op("subjects.upsert"), None
+
+    @staticmethod
+    def account_snapshot(db_ret: list) -> AccountSnapshot or None:
+        """
+        Build an AccountSnapshot from the return value of a query built by query_account_stmt().
+        :param db_ret: the return value of the SQL query
+        :return: an AccountSnapshot, or None if the query returned no rows
+        """
+
+        return AccountSnapshot(*db_ret[0]) if db_ret else None
+
+    def snapshot_info(self, account: AccountSnapshot, col: str) -> str:
+        """
+        Return a specific account information field from an account snapshot.
+        :param account: an AccountSnapshot of the account
+        :param col: the account information column
+        :return: the field's information
+        """
+
+        return account[(self.COL_STU_ID, self.COL_PSWRD_HASH, self.COL_SCHEDULE, self.COL_SUBJECTS,
+                        self.COL_SESSION_ID).index(col)]
+
+    @staticmethod
+    def unavailable_resp(breaker: CircuitBreaker) -> dict:
+        """
+        Build the response for a request refused by an open circuit breaker, without it being sent.
+        :param breaker: the open circuit breaker
+        :return: the response body
+        """
+
+        return {"db_ret": f"Database server is unavailable, retrying in {breaker.retry_after:.0f} seconds.",
+                "db_err": True, "db_unavailable": True}
+
+    @staticmethod
+    def resp_error(db_resp: dict) -> CommonDatabaseError:
+        """
+        Build the exception raised for a failed request.
+        :param db_resp: the failed request's response body
+        :return: a DatabaseUnavailableError if the server could not be reached or did not respond, otherwise a
+        CommonDatabaseError
+        """
+
+        if db_resp.get("db_unavailable", False):
+            return DatabaseUnavailableError(db_resp["db_ret"])
+        return CommonDatabaseError(db_resp["db_ret"])
+
+    def resilience_stats(self) -> dict:
+        """
+        Return the state of the circuit breaker and the retry counters, for monitoring.
+        :return: a dictionary containing the circuit breaker's state and counters, and the retry counters
+        """
+
+        return {**self.breaker.stats(), **self.retry_policy.stats()}
+
+    def track(self, name: str):
+        """
+        Track a call made up of several requests, such as logging in, with self.metrics, see Metrics.track().
+        :param name: the name the call is recorded under
+        :return: a context manager that records the call when it exits, which does nothing if metrics are disabled
+        """
+
+        if self.metrics is None:
+            return self._NOT_TRACKED
+        return self.metrics.track(name)
+
+    def record_request(self, request_json: dict, latency: float, sizes: dict, failed: bool):
+        """
+        Record a completed request with self.metrics.
+        :param request_json: the request body
+        :param latency: the request's latency in seconds, including any retries
+        :param sizes: the number of bytes sent and received, as filled in by the transport
+        :param failed: true if the request failed
+        """
+
+        self.metrics.record(self.metrics.request_name(request_json), latency, sizes["sent"], sizes["received"],
+                            failed)
+
+    @staticmethod
+    def changed(results: list) -> bool:
+        """
+        Check if a conditional write changed any rows, given the results of a [write, changes_stmt()] batch.
+        :param results: the results of the batch
+        :return: a boolean to confirm if any rows were changed
+        """
+
+        return results[-1][0][0][0] > 0
+
+    @staticmethod
+    def next_key(rows: list, limit: int) -> str or None:
+        """
+        Return the key the page after a page built by retrieve_page_stmt() starts after.
+        :param rows: the rows of the page
+        :param limit: the maximum number of rows in the page
+        :return: the primary key of the page's last row, or None if the page is the last one
+        """
+
+        return rows[-1][0] if len(rows) == limit else None
+
+    @staticmethod
+    def first_row(db_ret: list) -> list:
+        """
+        Return the first row of a query's return value.
+        :param db_ret: the return value of a SQL query
+        :return: the first row, or an empty list if the query returned no rows
+        """
+
+        return db_ret[0] if db_ret else []
+
+
+class SmartSchedulerDB(DBBase):
+    """
+    Manages the database for the Smart Scheduler application.
+
+    Every request gets its own Future for its result, and no result state is kept on the instance, so one database
+    manager can safely be shared by several threads issuing overlapping commands, e.g. the GUI and a worker pool.
+    """
+
+    DEF_TIMEOUT: float = 15.0
+
+    def __init__(self, server: str = None, timeout: float = DEF_TIMEOUT, transport: HTTPTransport = None,
+                 retry_policy: RetryPolicy = None, breaker: CircuitBreaker = None, metrics: Metrics = None):
         """
         Initialise database manager
-        :param server: address of the server that contains the database
+        :param server: address of the server that contains the database, or a "sqlite:///" address of a local
+        database file to run commands in process instead
+        :param timeout: optional, the maximum number of seconds to wait for a database command to complete, including
+        any retries, or None to wait indefinitely
+        :param transport: optional, a preconfigured transport to send commands through
+        :param retry_policy: optional, the policy for retrying idempotent requests that could not reach the server
+        :param breaker: optional, the circuit breaker that fails requests fast while the server is down
+        :param metrics: optional, records the latency and size of every request, requests are not instrumented if it
+        is not given
         """
 
         self.server: str = server
-        self.db_ret: list = []
-        self.db_err: bool = False
-        self.db_wait: bool = False
+        self.timeout: float = timeout
+        self.transport: HTTPTransport = transport or transport_for(server)
+        self.retry_policy: RetryPolicy = retry_policy or RetryPolicy()
+        self.breaker: CircuitBreaker = breaker or CircuitBreaker()
+        self.metrics: Metrics or None = metrics
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=self.transport.pool_size,
+                                                                thread_name_prefix="SmartSchedulerDB")
         self.__create_tables__()
 
     def __create_tables__(self):
         """Create the required tables in the database, if they do not already exist."""
 
-        self.__send_cmd__(f'''
-        CREATE TABLE IF NOT EXISTS {self.TAB_ACCOUNTS} 
-        ({self.COL_STU_ID} text NOT NULL PRIMARY KEY,
-        {self.COL_PSWRD_HASH} text,
-        {self.COL_SCHEDULE} text,
-        {self.COL_SUBJECTS} text,
-        {self.COL_SESSION_ID} text)
-        ''')
-        while self.db_wait:
-            continue
-        if self.db_err:
-            raise CommonDatabaseError(self.db_ret)
-        self.__send_cmd__(f'''
-        CREATE TABLE IF NOT EXISTS {self.TAB_SUB_INFO}
-        ({self.COL_SUB_CODE} text NOT NULL PRIMARY KEY,
-        {self.COL_SUB_NAME} text)
-        ''')
-        while self.db_wait:
-            continue
-        if self.db_err:
-            raise CommonDatabaseError(self.db_ret)
-
-    def __db_cmd__(self, cmd: str, params: list or None, upd_subs: bool):
+        for cmd, params in self.create_tables_stmts():
+            self.__exec_cmd__(cmd, params)
+
+    def __db_attempt__(self, request_json: dict, sizes: dict = None) -> tuple:
+        """
+        Make a single attempt at sending a request to the database, encapsulated in a HTTP POST request made to
+        self.server, and record its outcome with self.breaker.
+
+        The request is sent in JSON format, over a persistent connection borrowed from self.transport. The outcome is
+        recorded however the attempt ends, a failure unless a response was received, so that a half-open breaker's
+        trial request always settles the breaker's state.
+        :param request_json: the request body
+        :param sizes: optional, a dictionary the number of bytes sent and received are added to
+        :return: a tuple containing the response body, whose "db_unavailable" is true if the attempt failed without a
+        response from the server, and a boolean that is true if the server could not be reached
+        """
+
+        succeeded = False
+        try:
+            db_resp = self.transport.post(request_json, sizes)
+            succeeded = True
+        except requests.HTTPError as e:
+            succeeded = e.response.status_code < 500
+            return {"db_ret": e.args[0], "db_err": True, "db_unavailable": not succeeded}, False
+        except requests.ConnectionError:
+            return {"db_ret": "Cannot reach database (server connection failed).", "db_err": True,
+                    "db_unavailable": True}, True
+        except requests.Timeout:
+            return {"db_ret": "Database server took too long to respond.", "db_err": True, "db_unavailable": True}, True
+        except requests.RequestException as e:
+            return {"db_ret": f"Database server response was cut short or corrupted ({e}).", "db_err": True,
+                    "db_unavailable": True}, True
+        except ValueError as e:
+            return {"db_ret": f"Database server response could not be decoded ({e}).", "db_err": True,
+                    "db_unavailable": True}, False
+        finally:
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+        return db_resp, False
+
+    def __db_request__(self, request_json: dict, idempotent: bool = False, deadline: float = None,
+                       sizes: dict = None) -> dict:
+        """
+        Send a request to the database, retrying it according to self.retry_policy if it is idempotent and the server
+        could not be reached. The request is not sent at all while self.breaker is open.
+        :param request_json: the request body
+        :param idempotent: optional, true if the request can safely be sent more than once, i.e. it is read only
+        :param deadline: optional, the monotonic() time after which the request is not retried
+        :param sizes: optional, a dictionary the number of bytes sent and received are added to
+        :return: the response body, whose "db_ret" is the request's return value and whose "db_err" is true if the
+        request failed
+        """
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                return self.unavailable_resp(self.breaker)
+            db_resp, unreachable = self.__db_attempt__(request_json, sizes)
+            if not unreachable or not idempotent:
+                return db_resp
+            delay = self.retry_policy.delay(attempt)
+            if delay is None or (deadline is not None and monotonic() + delay >= deadline):
+                self.retry_policy.record_giveup()
+                return db_resp
+            self.retry_policy.record_retry()
+            attempt += 1
+            sleep(delay)
+
+    def __db_cmd__(self, cmd: Op or str, params: list or None, upd_subs: bool) -> tuple:
         """
         Send a SQL command to the database, encapsulated in a HTTP POST request made to self.server.
 
         The SQL command and any additional command parameters are sent in JSON format.
-        :param cmd: A SQL command
+        :param cmd: A registered operation or a SQL command
         :param params: Any additional parameters for the SQL command
         :param upd_subs: A special flag that signals the server to update the list of available subjects
+        :return: a tuple containing the command's return value and a boolean that is true if the command failed
+        """
+
+        db_resp = self.__db_request__(self.__cmd_json__(cmd, params, upd_subs))
+        return db_resp["db_ret"], db_resp["db_err"]
+
+    def __send_request__(self, request_json: dict, idempotent: bool = False, deadline: float = None,
+                         sizes: dict = None) -> Future:
+        """
+        Send a request to the database from the worker pool, which is as large as the transport's connection pool.
+        :param request_json: the request body
+        :param idempotent: optional, true if the request can safely be retried
+        :param deadline: optional, the monotonic() time after which the request is not retried
+        :param sizes: optional, a dictionary the number of bytes sent and received are added to
+        :return: a Future that resolves to the response body once the request completes
+        """
+
+        return self._executor.submit(self.__db_request__, request_json, idempotent, deadline, sizes)
+
+    def __exec_request__(self, request_json: dict, idempotent: bool = False) -> dict:
         """
+        Send a request to the database and block until it completes or self.timeout expires.
 
+        The calling thread sleeps on the request's Future instead of polling, and a CommonDatabaseError is raised if
+        the request fails, a DatabaseUnavailableError if it failed because the server could not be reached or timed
+        out. The request is recorded with self.metrics, if metrics are enabled.
+        :param request_json: the request body
+        :param idempotent: optional, true if the request can safely be retried
+        :return: the response body
+        """
+
+        deadline = monotonic() + self.timeout if self.timeout is not None else None
+        sizes = {"sent": 0, "received": 0} if self.metrics is not None else None
+        start = perf_counter()
         try:
-            if upd_subs:
-                request_json = {"cmd": cmd, "cmd_params": ["upd_subs"]}
-            else:
-                request_json = {"cmd": cmd, "cmd_params": params}
-            server_resp: requests.Response = requests.post(self.server, json=request_json)
-            server_resp.raise_for_status()
-            db_resp = server_resp.json()
-            self.db_ret = db_resp["db_ret"]
-            self.db_err = db_resp["db_err"]
-        except requests.ConnectionError:
-            self.db_err = True
-            self.db_ret = "Cannot reach database (server connection failed)."
-        except requests.HTTPError as e:
-            self.db_err = True
-            self.db_ret = e.args[0]
-        finally:
-            self.db_wait = False
+            db_resp = self.__send_request__(request_json, idempotent, deadline, sizes).result(timeout=self.timeout)
+        except FutureTimeoutError:
+            db_resp = {"db_ret": f"Database request timed out after {self.timeout} seconds.", "db_err": True,
+                       "db_unavailable": True}
+        if sizes is not None:
+            self.record_request(request_json, perf_counter() - start, sizes, db_resp["db_err"])
+        if db_resp["db_err"]:
+            raise self.resp_error(db_resp)
+        return db_resp
 
-    def __send_cmd__(self, cmd: str, params: list = None, upd_subs: bool = False):
+    def __exec_cmd__(self, cmd: Op or str, params: list = None, upd_subs: bool = False, idempotent: bool = False):
         """
-        Initialise a new thread to send a SQL command to the database.
-        :param cmd: the SQL command
+        Send a SQL command to the database and block until it completes.
+        :param cmd: the registered operation or SQL command
         :param params: optional parameters for the SQL command
+        :param upd_subs: a special flag that signals the server to update the list of available subjects
+        :param idempotent: optional, true if the command only reads, so it can safely be retried
+        :return: the command's return value
+        """
+
+        return self.__exec_request__(self.__cmd_json__(cmd, params, upd_subs), idempotent)["db_ret"]
+
+    def batch(self, stmts: list, transaction: bool = False, idempotent: bool = False) -> list:
+        """
+        Execute an ordered list of SQL statements in a single round trip to the server.
+
+        If transaction is true, the statements are executed atomically and a CommonDatabaseError is raised (with all
+        changes rolled back) as soon as any of them fails. Otherwise each statement is committed on its own and its
+        failure is only reported in its own result.
+        :param stmts: a list of (cmd, params) tuples, such as those returned by the *_stmt() methods, conditional
+        statements are (cmd, params, etag) tuples
+        :param transaction: optional, execute all statements in a single transaction if true
+        :param idempotent: optional, true if all statements only read, so the batch can safely be retried
+        :return: a list containing a (db_ret, db_err) tuple for each statement, in the order they were given, the
+        tuple is (db_ret, db_err, etag) for conditional statements and db_ret is None if the result is unchanged
         """
 
-        self.db_err = False
-        self.db_wait = True
-        Thread(target=self.__db_cmd__, args=(cmd, params, upd_subs)).start()
+        if not stmts:
+            return []
+        db_ret = self.__exec_request__(self.batch_json(stmts, transaction), idempotent)["db_ret"]
+        return [tuple(stmt_ret) for stmt_ret in db_ret]
 
     def retrieve_all(self, table: str) -> list:
         """
@@ -102,12 +576,81 @@ class SmartSchedulerDB:
         :return: a list containing tuples, one for each record in the table
         """
 
-        self.__send_cmd__(f"SELECT * FROM {table}")
-        while self.db_wait:
-            continue
-        if self.db_err:
-            raise CommonDatabaseError(self.db_ret)
-        return self.db_ret
+        return self.__exec_cmd__(*self.retrieve_all_stmt(table), idempotent=True)
+
+    def revalidate_all(self, table: str, etag: str or None) -> tuple:
+        """
+        Retrieve all data from a specific table, unless it is unchanged since it was last retrieved.
+        :param table: the table to retrieve data from
+        :param etag: the ETag of the previously retrieved data, or None if nothing has been retrieved yet
+        :return: a tuple containing the data (or None if it is unchanged) and its current ETag
+        """
+
+        cmd, params, etag = self.revalidate_all_stmt(table, etag)
+        db_resp = self.__exec_request__(self.__etag_json__(self.__cmd_json__(cmd, params, False), etag), True)
+        return db_resp["db_ret"], db_resp["etag"]
+
+    def retrieve_page(self, table: str, after: str = None, limit: int = DBBase.DEF_PAGE_SIZE) -> tuple:
+        """
+        Retrieve a page of a table's rows, in the order of its primary key.
+        :param table: the table to retrieve data from
+        :param after: optional, the key returned with the previous page, or None for the first page
+        :param limit: optional, the maximum number of rows in the page
+        :return: a tuple containing the page's rows, and the key to retrieve the next page with (or None if this page
+        is the last one)
+        """
+
+        rows = self.__exec_cmd__(*self.retrieve_page_stmt(table, after, limit), idempotent=True)
+        return rows, self.next_key(rows, limit)
+
+    def iter_all(self, table: str, page_size: int = DBBase.DEF_PAGE_SIZE):
+        """
+        Iterate over all rows of a table one page at a time, so only a single page is held in memory at once.
+        :param table: the table to retrieve data from
+        :param page_size: optional, the number of rows retrieved per round trip
+        :return: a generator that yields the table's rows, in the order of its primary key
+        """
+
+        after = None
+        while True:
+            rows, after = self.retrieve_page(table, after, page_size)
+            yield from rows
+            if after is None:
+                return
+
+    def stream_all(self, table: str):
+        """
+        Retrieve all rows of a table in a single round trip, with the server streaming them back as it reads them, so
+        neither end holds the whole table in memory.
+
+        Raises CommonDatabaseError if the request fails, or the stream ends before the server has confirmed it.
+        :param table: the table to retrieve data from
+        :return: a generator that yields the table's rows
+        """
+
+        if not self.breaker.allow():
+            raise self.resp_error(self.unavailable_resp(self.breaker))
+        try:
+            for line in self.transport.stream(self.stream_json(*self.retrieve_all_stmt(table))):
+                if type(line) is dict:
+                    self.breaker.record_success()
+                    if line["db_err"]:
+                        raise CommonDatabaseError(line["db_ret"])
+                    return
+                yield line
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            self.breaker.record_failure()
+            raise DatabaseUnavailableError("Cannot reach database (server connection failed).")
+        except requests.Timeout:
+            self.breaker.record_failure()
+            raise DatabaseUnavailableError("Database server took too long to respond.")
+        except requests.HTTPError as e:
+            if e.response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise CommonDatabaseError(e.args[0])
+        raise CommonDatabaseError("Database server ended the row stream early.")
 
     def new_account(self, s_id: str, pass_hash: str, sch: str, subs: str):
         """
@@ -118,11 +661,7 @@ class SmartSchedulerDB:
         :param subs: the account's registered subjects
         """
 
-        self.__send_cmd__(f"INSERT INTO {self.TAB_ACCOUNTS} VALUES (?, ?, ?, ?, ?)", [s_id, pass_hash, sch, subs, "0"])
-        while self.db_wait:
-            continue
-        if self.db_err:
-            raise CommonDatabaseError(self.db_ret)
+        self.__exec_cmd__(*self.new_account_stmt(s_id, pass_hash, sch, subs))
 
     def query_account_info(self, s_id: str, query_col) -> tuple:
         """
@@ -132,12 +671,28 @@ class SmartSchedulerDB:
         :return: a tuple containing the field's information
         """
 
-        self.__send_cmd__(f"SELECT {query_col} FROM {self.TAB_ACCOUNTS} WHERE {self.COL_STU_ID}=?", [s_id])
-        while self.db_wait:
-            continue
-        if self.db_err:
-            raise CommonDatabaseError(self.db_ret)
-        return self.db_ret[0] if self.db_ret else []
+        return self.first_row(self.__exec_cmd__(*self.query_account_info_stmt(s_id, query_col), idempotent=True))
+
+    def query_account(self, s_id: str) -> AccountSnapshot or None:
+        """
+        Retrieve a snapshot of an account's entire row in the accounts table via a single SQL query.
+        :param s_id: the look up key for the SQL query
+        :return: an AccountSnapshot, or None if the account does not exist
+        """
+
+        return self.account_snapshot(self.__exec_cmd__(*self.query_account_stmt(s_id), idempotent=True))
+
+    def query_account_infos(self, s_id: str, query_cols: list) -> list:
+        """
+        Retrieve several account information fields in the accounts table in a single batched round trip.
+        :param s_id: the look up key for the SQL queries
+        :param query_cols: the account information columns to query
+        :return: a list containing a tuple for each field's information, in the order of query_cols
+        """
+
+        results = self.batch([self.query_account_info_stmt(s_id, query_col) for query_col in query_cols],
+                             transaction=True, idempotent=True)
+        return [self.first_row(db_ret) for db_ret, _ in results]
 
     def update_account_info(self, s_id: str, update_col: str, update_val: str):
         """
@@ -147,12 +702,42 @@ class SmartSchedulerDB:
         :param update_val: the updated value
         """
 
-        self.__send_cmd__(f"UPDATE {self.TAB_ACCOUNTS} SET {update_col}=? WHERE {self.COL_STU_ID}=?",
-                          [update_val, s_id])
-        while self.db_wait:
-            continue
-        if self.db_err:
-            raise CommonDatabaseError(self.db_ret)
+        self.__exec_cmd__(*self.update_account_info_stmt(s_id, update_col, update_val))
+
+    def update_session_account_info(self, s_id: str, session_id: str, update_col: str, update_val: str) -> bool:
+        """
+        Update a specific account information field, only if a session is logged in to the account.
+
+        The session check is done by the server as part of the update, in the same round trip.
+        :param s_id: the look up key for the SQL command
+        :param session_id: the session's ID
+        :param update_col: the account information column to update
+        :param update_val: the updated value
+        :return: a boolean that is false if the session is not logged in, in which case nothing is updated
+        """
+
+        return self.changed(self.batch([self.update_session_account_info_stmt(s_id, session_id, update_col, update_val),
+                                        self.changes_stmt()], transaction=True))
+
+    def replace_session_account_info(self, s_id: str, session_id: str, update_col: str, update_val: str,
+                                     base_val: str) -> tuple:
+        """
+        Update a specific account information field, only if a session is logged in to the account and the field still
+        holds base_val, i.e. nobody else has written to it since the update was made.
+
+        The account is read back in the same transaction, so the reason for a rejected update can be told apart.
+        :param s_id: the look up key for the SQL command
+        :param session_id: the session's ID
+        :param update_col: the account information column to update
+        :param update_val: the updated value
+        :param base_val: the value the update was based on
+        :return: a tuple containing a boolean that is false if nothing was updated, and an AccountSnapshot of the
+        account afterwards (or None if the account does not exist)
+        """
+
+        update_stmt = self.replace_session_account_info_stmt(s_id, session_id, update_col, update_val, base_val)
+        results = self.batch([update_stmt, self.changes_stmt(), self.query_account_stmt(s_id)], transaction=True)
+        return self.changed(results[:2]), self.account_snapshot(results[2][0])
 
     def delete_account(self, s_id: str):
         """
@@ -160,20 +745,60 @@ class SmartSchedulerDB:
         :param s_id: the look up key for the SQL command
         """
 
-        self.__send_cmd__(f"DELETE FROM {self.TAB_ACCOUNTS} WHERE {self.COL_STU_ID}=?", [s_id])
-        while self.db_wait:
-            continue
-        if self.db_err:
-            raise CommonDatabaseError(self.db_ret)
+        self.__exec_cmd__(*self.delete_account_stmt(s_id))
+
+    def delete_session_account(self, s_id: str, session_id: str) -> bool:
+        """
+        Remove an account from the accounts table, only if a session is logged in to the account.
+        :param s_id: the look up key for the SQL command
+        :param session_id: the session's ID
+        :return: a boolean that is false if the session is not logged in, in which case nothing is removed
+        """
+
+        return self.changed(self.batch([self.delete_session_account_stmt(s_id, session_id), self.changes_stmt()],
+                                       transaction=True))
+
+    def class_students(self, sub_code: str, class_type: str, day: str, start: str) -> list:
+        """
+        Retrieve the student IDs of the accounts with a class in their schedule, through the classes table's index.
+        :param sub_code: the class's subject code
+        :param class_type: the class's type
+        :param day: the class's day
+        :param start: the class's start time
+        :return: a sorted list of student IDs
+        """
+
+        return [row[0] for row in self.__exec_cmd__(*self.class_students_stmt(sub_code, class_type, day, start),
+                                                    idempotent=True)]
+
+    def subject_students(self, sub_code: str) -> list:
+        """
+        Retrieve the accounts registered to a subject, through the registrations table's index.
+        :param sub_code: the subject code
+        :return: a list of [student ID, class type] lists, sorted by student ID
+        """
+
+        return self.__exec_cmd__(*self.subject_students_stmt(sub_code), idempotent=True)
+
+    def student_classes(self, s_id: str) -> list:
+        """
+        Retrieve the classes in an account's schedule from the classes table.
+        :param s_id: the account's student ID
+        :return: a list of [student ID, subject code, class type, day, start time, end time] lists
+        """
+
+        return self.__exec_cmd__(*self.student_classes_stmt(s_id), idempotent=True)
 
     def upd_sub_list(self):
         """Request the server to update the current list of available subjects."""
-        self.__send_cmd__(f"INSERT OR REPLACE INTO {self.TAB_SUB_INFO} ({self.COL_SUB_CODE}, {self.COL_SUB_NAME}) "
-                          f"VALUES (?, ?)", upd_subs=True)
-        while self.db_wait:
-            pass
-        if self.db_err:
-            raise CommonDatabaseError(self.db_ret)
+
+        self.__exec_cmd__(self.upd_sub_list_stmt()[0], upd_subs=True)
+
+    def close(self):
+        """Stop the worker pool and close all connections to the server."""
+
+        self._executor.shutdown(wait=False)
+        self.transport.close()
 
 
 if __name__ == "__main__":
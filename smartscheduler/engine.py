@@ -0,0 +1,1010 @@
+import csv
+import hashlib
+import json
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from os import stat
+from queue import Empty, SimpleQueue
+from threading import Condition, Lock, Thread
+from time import monotonic, perf_counter
+
+from smartscheduler.metrics import ServerMetrics
+from smartscheduler.statements import (MIGRATIONS, NORMALIZE_TRIGGERS, REBUILD_NORMALIZED, SCHEMA_VERSION,
+                                       SQL_FUNCTIONS, STATEMENTS, Schema, access, resolve)
+
+
+__all__ = ["StorageProfile", "ConnectionPool", "ResultCache", "WriteCoalescer", "SQLiteEngine"]
+
+
+class StorageProfile:
+    """
+    The journaling, locking and caching settings of a SQLite database, applied to every connection when it is opened.
+
+    The defaults suit a server with many concurrent clients: in WAL mode readers do not block the writer and the writer
+    does not block readers, a busy timeout makes writers wait for each other instead of failing with "database is
+    locked", and NORMAL synchronisation only syncs the WAL file at checkpoints, which is still safe in WAL mode. Use
+    sqlite_defaults() for the settings SQLite starts with.
+    """
+
+    JOURNAL_MODES: tuple = ("delete", "truncate", "persist", "memory", "wal", "off")
+    SYNCHRONOUS_LEVELS: tuple = ("off", "normal", "full", "extra")
+    DEF_JOURNAL_MODE: str = "wal"
+    DEF_BUSY_TIMEOUT: int = 5000
+    DEF_SYNCHRONOUS: str = "normal"
+    DEF_CACHE_SIZE: int = -16000
+    DEF_MMAP_SIZE: int = 64 * 1024 * 1024
+
+    def __init__(self, journal_mode: str = DEF_JOURNAL_MODE, busy_timeout: int = DEF_BUSY_TIMEOUT,
+                 synchronous: str = DEF_SYNCHRONOUS, cache_size: int = DEF_CACHE_SIZE, mmap_size: int = DEF_MMAP_SIZE):
+        """
+        Initialise the profile, raising ValueError if the journal mode or synchronisation level is not recognised.
+        :param journal_mode: optional, the journal mode, one of JOURNAL_MODES
+        :param busy_timeout: optional, the number of milliseconds a connection waits for a lock before failing
+        :param synchronous: optional, the synchronisation level, one of SYNCHRONOUS_LEVELS
+        :param cache_size: optional, the page cache size of each connection, in pages if positive or in KiB if negative
+        :param mmap_size: optional, the maximum number of bytes of the database file accessed through memory mapping
+        """
+
+        if journal_mode.lower() not in self.JOURNAL_MODES:
+            raise ValueError(f"Unknown journal mode: {journal_mode}")
+        if synchronous.lower() not in self.SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Unknown synchronous level: {synchronous}")
+        self.journal_mode: str = journal_mode.lower()
+        self.busy_timeout: int = int(busy_timeout)
+        self.synchronous: str = synchronous.lower()
+        self.cache_size: int = int(cache_size)
+        self.mmap_size: int = int(mmap_size)
+
+    @classmethod
+    def sqlite_defaults(cls):
+        """
+        Return the profile of a database left with SQLite's default settings.
+        :return: a profile with a rollback journal, no busy timeout, FULL synchronisation, a 2 MiB cache and no memory
+        mapping
+        """
+
+        return cls("delete", 0, "full", -2000, 0)
+
+    def pragmas(self) -> list:
+        """
+        Return the statements that apply the profile to a connection.
+        :return: a list of PRAGMA statements, the journal mode is set last since it may need to wait for a lock
+        """
+
+        return [f"PRAGMA busy_timeout={self.busy_timeout}", f"PRAGMA synchronous={self.synchronous}",
+                f"PRAGMA cache_size={self.cache_size}", f"PRAGMA mmap_size={self.mmap_size}",
+                f"PRAGMA journal_mode={self.journal_mode}"]
+
+
+class ConnectionPool:
+    """
+    A bounded pool of persistent connections to a SQLite database file, shared by the threads of an engine.
+
+    Keeping connections open saves reopening the file, parsing the schema and warming the page cache on every request.
+    A connection is checked before it is handed out, and is replaced if the database file it was opened on has since
+    been deleted or replaced. A connection that is returned in the middle of a transaction is rolled back, or closed if
+    that fails. A pool of size 0 opens a new connection for every request and closes it afterwards.
+
+    Connections opened on a database file that has been replaced are closed as soon as the replacement is noticed,
+    before a connection to the new file is opened, so that a WAL file left by the old database is not mistaken for the
+    new one's.
+
+    The first connection the pool opens to a database file migrates it, or rebuilds its normalized tables if it is
+    already up to date, so that writes made while the server did not have it open are reflected (see
+    REBUILD_NORMALIZED).
+    """
+
+    DEF_SIZE: int = 8
+
+    def __init__(self, path: str, size: int = DEF_SIZE, profile: StorageProfile = None):
+        """
+        Initialise an empty pool, connections are opened lazily.
+        :param path: the path of the database file
+        :param size: optional, the maximum number of connections open at once, 0 disables pooling
+        :param profile: optional, the storage profile applied to every connection, SQLite's settings are left as they
+        are if no profile is given
+        """
+
+        self.path: str = path
+        self.size: int = size
+        self.profile: StorageProfile or None = profile
+        self._idle: list = []
+        self._open: int = 0
+        self._closed: bool = False
+        self._cond: Condition = Condition()
+        self._rebuilt: tuple or None = None
+        self._rebuild_lock: Lock = Lock()
+
+    def __file_id__(self) -> tuple or None:
+        """
+        Identify the database file currently at self.path.
+        :return: a tuple containing the file's device and inode numbers, or None if the file does not exist
+        """
+
+        try:
+            file_stat = stat(self.path)
+        except FileNotFoundError:
+            return None
+        return file_stat.st_dev, file_stat.st_ino
+
+    def __connect__(self) -> tuple:
+        """
+        Open a connection in autocommit mode, transactions are begun explicitly, whose rows are returned as lists like
+        they are after a round trip through the wire format. The database is migrated first if needed, or its
+        normalized tables are rebuilt if this is the pool's first connection to the file, and the triggers that keep
+        the normalized tables up to date, and the functions they call, are created on it.
+        :return: a tuple containing the connection and the identity of the database file it was opened on
+        """
+
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        for name, (n_args, func) in SQL_FUNCTIONS.items():
+            conn.create_function(name, n_args, func, deterministic=True)
+        try:
+            if self.profile is not None:
+                for pragma in self.profile.pragmas():
+                    conn.execute(pragma)
+            with self._rebuild_lock:
+                file_id = self.__file_id__()
+                self.__migrate__(conn, file_id != self._rebuilt)
+                self._rebuilt = file_id
+            for trigger in NORMALIZE_TRIGGERS:
+                conn.execute(trigger)
+        except sqlite3.Error:
+            conn.close()
+            raise
+        conn.row_factory = self.__list_row__
+        return conn, file_id
+
+    @staticmethod
+    def __migrate__(conn: sqlite3.Connection, rebuild: bool = False):
+        """
+        Migrate the database to SCHEMA_VERSION in a single transaction, if it is older, see MIGRATIONS. Once it is up
+        to date, only the database's user_version is read, so the write lock is not taken, unless the normalized
+        tables are to be rebuilt.
+        :param conn: a newly opened connection
+        :param rebuild: optional, rebuild the normalized tables from the accounts table if the database is up to date
+        """
+
+        if not rebuild and conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for next_version in range(version + 1, SCHEMA_VERSION + 1):
+                for cmd in MIGRATIONS[next_version]:
+                    conn.execute(cmd)
+            if version < SCHEMA_VERSION:
+                conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            elif rebuild:
+                for cmd in REBUILD_NORMALIZED:
+                    conn.execute(cmd)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def __list_row__(_: sqlite3.Cursor, row: tuple) -> list:
+        """
+        Convert a row returned by SQLite to a list.
+        :param _: the cursor that returned the row
+        :param row: the row
+        :return: the row as a list
+        """
+
+        return list(row)
+
+    def __acquire__(self) -> tuple:
+        """
+        Borrow a healthy idle connection, or open a new one, waiting while self.size connections are borrowed. Idle
+        connections to a database file that has since been replaced are closed.
+        :return: a tuple containing the connection and the identity of the database file it was opened on
+        """
+
+        file_id = self.__file_id__()
+        with self._cond:
+            while not self._idle and self.size and self._open >= self.size:
+                self._cond.wait()
+            stale = [entry for entry in self._idle if entry[1] != file_id]
+            if stale:
+                self._idle = [entry for entry in self._idle if entry[1] == file_id]
+                self._open -= len(stale)
+            entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                self._open += 1
+        for stale_entry in stale:
+            stale_entry[0].close()
+        if entry is not None:
+            return entry
+        try:
+            return self.__connect__()
+        except sqlite3.Error:
+            self.__discard__()
+            raise
+
+    def __discard__(self, conn: sqlite3.Connection = None):
+        """
+        Close a borrowed connection instead of returning it to the pool.
+        :param conn: optional, the connection, or None if it could not be opened
+        """
+
+        if conn is not None:
+            conn.close()
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def __release__(self, entry: tuple):
+        """
+        Return a borrowed connection to the pool, rolling back any transaction it was left in.
+        :param entry: the tuple returned by __acquire__()
+        """
+
+        conn: sqlite3.Connection = entry[0]
+        try:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        except sqlite3.Error:
+            return self.__discard__(conn)
+        with self._cond:
+            if self._closed or not self.size:
+                self._open -= 1
+                conn.close()
+            else:
+                self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a with block.
+        :return: a context manager that yields the connection and returns it to the pool on exit
+        """
+
+        entry = self.__acquire__()
+        try:
+            yield entry[0]
+        finally:
+            self.__release__(entry)
+
+    def stats(self) -> dict:
+        """
+        Return the pool's size and usage.
+        :return: a dictionary containing the pool's size, and the number of open and idle connections
+        """
+
+        with self._cond:
+            return {"pool_size": self.size, "open_connections": self._open, "idle_connections": len(self._idle)}
+
+    def close(self):
+        """Close all idle connections, borrowed connections are closed when they are returned."""
+
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop()[0].close()
+                self._open -= 1
+
+
+class ResultCache:
+    """
+    A bounded LRU cache of the results of read-only statements, keyed by the statement and its parameters.
+
+    The tables each statement reads or writes are declared in the statement registry (see Statement), so no SQL is
+    parsed. Every table has a generation that is advanced, and its cached results discarded, whenever a write touching
+    it is committed. A result is only cached if the generations of the tables it was read from have not advanced since
+    before it was read, so a result read before a concurrent write committed is never cached after the write. Ad hoc
+    SQL, whose tables are not known, is never cached and discards the whole cache when it is executed.
+
+    Memory is bounded by the size of the cached results' JSON encoding, the least recently used results are evicted
+    first. A cache of max_bytes 0 caches nothing.
+    """
+
+    DEF_MAX_BYTES: int = 16 * 1024 * 1024
+    ALL_TABLES: str = "*"
+
+    def __init__(self, max_bytes: int = DEF_MAX_BYTES):
+        """
+        Initialise an empty cache.
+        :param max_bytes: optional, the maximum total size of the cached results, 0 disables the cache
+        """
+
+        self.max_bytes: int = max_bytes
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.invalidations: int = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._generations: dict = {}
+        self._lock: Lock = Lock()
+
+    @staticmethod
+    def __key__(cmd: str, params: list or None) -> tuple or None:
+        """
+        Build the cache key of a statement.
+        :param cmd: the SQL statement
+        :param params: the statement's parameters, if any
+        :return: the key, or None if the parameters cannot be part of a key
+        """
+
+        key = (cmd, tuple(params or ()))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def generations(self) -> dict:
+        """
+        Return the current generation of every table, to be passed to put() along with a result read after this call.
+        :return: a dictionary where the keys are the table names and the values are their generations
+        """
+
+        with self._lock:
+            return dict(self._generations)
+
+    def get(self, cmd: str, params: list or None) -> list or None:
+        """
+        Look up the cached result of a read-only statement.
+        :param cmd: the SQL statement
+        :param params: the statement's parameters, if any
+        :return: a copy of the cached rows, or None if the result is not cached
+        """
+
+        key = self.__key__(cmd, params)
+        if key is None or not self.max_bytes:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [list(row) for row in entry[0]]
+
+    def put(self, cmd: str, params: list or None, tables: frozenset, rows: list, generations: dict):
+        """
+        Cache the result of a read-only statement, unless one of its tables has been written to since it was read.
+        :param cmd: the SQL statement
+        :param params: the statement's parameters, if any
+        :param tables: the tables the statement reads, see access(), a result read from no table is not cached
+        :param rows: the statement's rows
+        :param generations: the table generations returned by generations() before the statement was executed
+        """
+
+        key = self.__key__(cmd, params)
+        if key is None or not self.max_bytes or not tables:
+            return
+        try:
+            size = len(json.dumps(rows)) + len(cmd)
+        except TypeError:
+            return
+        if size > self.max_bytes:
+            return
+        entry = (tuple(map(tuple, rows)), size, tables)
+        with self._lock:
+            if any(self._generations.get(table, 0) != generations.get(table, 0)
+                   for table in (*tables, self.ALL_TABLES)):
+                return
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self.size -= old_entry[1]
+            self._entries[key] = entry
+            self.size += size
+            while self.size > self.max_bytes:
+                self.size -= self._entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def invalidate(self, tables: frozenset or None):
+        """
+        Advance the generations of the tables a committed write touched, and discard their cached results.
+        :param tables: the tables the write touched, see access(), or None to discard every cached result
+        """
+
+        with self._lock:
+            for table in tables if tables is not None else (self.ALL_TABLES,):
+                self._generations[table] = self._generations.get(table, 0) + 1
+            stale = [key for key, entry in self._entries.items() if tables is None or not entry[2].isdisjoint(tables)]
+            for key in stale:
+                self.size -= self._entries.pop(key)[1]
+            self.invalidations += len(stale)
+
+    def stats(self) -> dict:
+        """
+        Return the cache's counters.
+        :return: a dictionary containing the number of hits, misses, evictions and invalidated results, and the number
+        and total size of the cached results
+        """
+
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "invalidations": self.invalidations, "entries": len(self._entries), "bytes": self.size,
+                    "max_bytes": self.max_bytes}
+
+
+class WriteCoalescer:
+    """
+    Group commit for single statement writes: writes submitted by concurrent threads are executed by a writer thread
+    in batches of up to max_batch, each committed as a single transaction, so that they share one commit (and one sync
+    of the database file) instead of paying for one each.
+
+    A batch takes every write waiting when the previous batch is over, and then waits at most max_delay seconds for
+    more while it is not full, so a lone write is delayed by at most max_delay. Each write runs in its own savepoint,
+    so a write that fails is rolled back on its own and only its submitter gets the error, unless the whole batch
+    cannot be committed.
+    """
+
+    DEF_MAX_BATCH: int = 64
+    DEF_MAX_DELAY: float = 0.002
+
+    def __init__(self, pool: ConnectionPool, max_batch: int = DEF_MAX_BATCH, max_delay: float = DEF_MAX_DELAY,
+                 metrics: ServerMetrics = None):
+        """
+        Initialise the coalescer, its writer thread is started by the first write.
+        :param pool: the connection pool the writer thread borrows a connection from for each batch
+        :param max_batch: optional, the maximum number of writes committed together
+        :param max_delay: optional, the maximum number of seconds a batch waits for more writes
+        :param metrics: optional, the metrics database errors and waits for the write lock are recorded with
+        """
+
+        self.pool: ConnectionPool = pool
+        self.max_batch: int = max_batch
+        self.max_delay: float = max_delay
+        self.metrics: ServerMetrics = metrics or ServerMetrics()
+        self.batches: int = 0
+        self.writes: int = 0
+        self.largest_batch: int = 0
+        self._queue: SimpleQueue = SimpleQueue()
+        self._lock: Lock = Lock()
+        self._writer: Thread or None = None
+        self._closed: bool = False
+
+    def __collect__(self, first: tuple) -> list:
+        """
+        Collect the writes to commit along with the first one.
+        :param first: the first write of the batch
+        :return: the batch, ending with None if the coalescer was closed while it was collected
+        """
+
+        batch = [first]
+        deadline = monotonic() + self.max_delay
+        while len(batch) < self.max_batch and batch[-1] is not None:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except Empty:
+                    break
+        return batch
+
+    def __commit__(self, batch: list):
+        """
+        Execute and commit a batch of writes, and resolve each write's Future with its result.
+        :param batch: a list of (cmd, params, Future) tuples
+        """
+
+        results = []
+        try:
+            with self.pool.connection() as conn:
+                start = perf_counter()
+                conn.execute("BEGIN IMMEDIATE")
+                self.metrics.record_lock_wait(perf_counter() - start)
+                for cmd, params, _ in batch:
+                    conn.execute("SAVEPOINT coalesced_write")
+                    try:
+                        curs = conn.execute(cmd, params) if params is not None else conn.execute(cmd)
+                        results.append((curs.fetchall(), False))
+                    except sqlite3.Error as e:
+                        self.metrics.record_error(e)
+                        conn.execute("ROLLBACK TO coalesced_write")
+                        results.append((e.args[0], True))
+                    conn.execute("RELEASE coalesced_write")
+                conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self.metrics.record_error(e)
+            results = [(e.args[0], True)] * len(batch)
+        with self._lock:
+            self.batches += 1
+            self.writes += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def __run__(self):
+        """Commit batches of writes until the coalescer is closed."""
+
+        while True:
+            batch = self.__collect__(self._queue.get())
+            closed = batch[-1] is None
+            if closed:
+                batch.pop()
+            if batch:
+                self.__commit__(batch)
+            if closed:
+                return
+
+    def submit(self, cmd: str, params: list or None) -> tuple:
+        """
+        Execute a write as part of the next batch, and block until the batch is committed.
+        :param cmd: the SQL statement
+        :param params: the statement's parameters, if any
+        :return: a tuple containing the statement's return value and a boolean that is true if it failed
+        """
+
+        future = Future()
+        with self._lock:
+            if self._closed:
+                return "Database engine is closed.", True
+            if self._writer is None:
+                self._writer = Thread(target=self.__run__, name="WriteCoalescer", daemon=True)
+                self._writer.start()
+            self._queue.put((cmd, params, future))
+        return future.result()
+
+    def stats(self) -> dict:
+        """
+        Return the coalescer's counters.
+        :return: a dictionary containing the number of batches and writes committed, and the largest batch
+        """
+
+        with self._lock:
+            return {"batches": self.batches, "writes": self.writes, "largest_batch": self.largest_batch,
+                    "max_batch": self.max_batch, "max_delay": self.max_delay}
+
+    def close(self):
+        """Commit the writes already submitted and stop the writer thread."""
+
+        with self._lock:
+            self._closed = True
+            writer, self._writer = self._writer, None
+            if writer is not None:
+                self._queue.put(None)
+        if writer is not None:
+            writer.join()
+
+
+class SQLiteEngine:
+    """
+    Executes the requests of the Smart Scheduler database protocol against a SQLite database file.
+
+    This is what the database server runs for every request it receives, and it can also be run in process (see
+    EmbeddedTransport), so that single machine deployments and tests use a local database file without a server. An
+    engine may be shared by several threads, which borrow connections from its ConnectionPool.
+
+    Every request is recorded with the engine's ServerMetrics, along with database errors and the time spent waiting
+    for the write lock, which writes take explicitly with BEGIN IMMEDIATE so that it can be timed.
+    """
+
+    TAB_SYNC_STATE: str = "Sync_state"
+    UNKNOWN_OP: str = "unknown"
+    STREAM_BATCH_SIZE: int = 256
+    DB_ERRORS: tuple = (sqlite3.IntegrityError, sqlite3.OperationalError, sqlite3.ProgrammingError)
+
+    def __init__(self, path: str, subjects_file: str = None, pool_size: int = ConnectionPool.DEF_SIZE,
+                 profile: StorageProfile = None, cache_bytes: int = 0, group_commit: int = 0,
+                 group_commit_delay: float = WriteCoalescer.DEF_MAX_DELAY, allow_sql: bool = False):
+        """
+        Initialise the engine, the database file is created by the first request if it does not already exist.
+        :param path: the path of the database file
+        :param subjects_file: optional, the path of the CSV file the list of available subjects is synced from, the
+        list is left as it is if no file is given
+        :param pool_size: optional, the maximum number of connections kept open to the database file, 0 opens a new
+        connection for every request
+        :param profile: optional, the storage profile applied to the database's connections, SQLite's settings are
+        left as they are if no profile is given
+        :param cache_bytes: optional, the maximum total size of the ResultCache of read-only statements, which is only
+        kept coherent if nothing but this engine writes to the database file, 0 disables the cache
+        :param group_commit: optional, the maximum number of single statement writes committed together by a
+        WriteCoalescer, 0 commits every write on its own
+        :param group_commit_delay: optional, the maximum number of seconds a group commit waits for more writes
+        :param allow_sql: optional, for maintenance only, also execute statements sent as ad hoc SQL in a "cmd"
+        instead of a registered "op", which are rejected otherwise
+        """
+
+        self.path: str = path
+        self.subjects_file: str or None = subjects_file
+        self.pool: ConnectionPool = ConnectionPool(path, pool_size, profile)
+        self.cache: ResultCache = ResultCache(cache_bytes)
+        self.metrics: ServerMetrics = ServerMetrics()
+        self.coalescer: WriteCoalescer or None = None
+        if group_commit:
+            self.coalescer = WriteCoalescer(self.pool, group_commit, group_commit_delay, self.metrics)
+        self.allow_sql: bool = allow_sql
+        self._subjects_file_state: tuple = (None, None)
+
+    def __stmt_cmd__(self, stmt: dict) -> tuple:
+        """
+        Return the SQL statement of a request or a batched statement, and how it accesses the database, raising
+        ValueError for an unknown operation, or for ad hoc SQL unless self.allow_sql is true.
+        :param stmt: the request body or batched statement, containing either a registered "op" or an ad hoc "cmd"
+        :return: a tuple containing the SQL statement, a boolean that is true if it only reads, and the tables it
+        touches (see access()), or None for ad hoc SQL, which is treated as a write whose tables are not known
+        """
+
+        if "op" in stmt:
+            return (resolve(stmt["op"], stmt.get("name", None)), *access(stmt["op"]))
+        if not self.allow_sql:
+            raise ValueError("Ad hoc SQL commands are not allowed.")
+        return stmt.get("cmd", ""), False, None
+
+    def __db_error__(self, error: Exception) -> str:
+        """
+        Count a database error by its type.
+        :param error: the exception raised by the database
+        :return: the error's message
+        """
+
+        self.metrics.record_error(error)
+        return error.args[0]
+
+    def __begin_immediate__(self, curs: sqlite3.Cursor or sqlite3.Connection):
+        """
+        Begin a transaction holding the database's write lock, and record the time spent waiting for it.
+        :param curs: the cursor or connection to begin the transaction on
+        """
+
+        start = perf_counter()
+        curs.execute("BEGIN IMMEDIATE")
+        self.metrics.record_lock_wait(perf_counter() - start)
+
+    def __writes__(self, batch: list) -> bool:
+        """
+        Tell if a batch contains a write.
+        :param batch: the batched statements
+        :return: a boolean that is true if any statement of the batch is not read-only
+        """
+
+        for stmt in batch:
+            try:
+                if not self.__stmt_cmd__(stmt)[1]:
+                    return True
+            except ValueError:
+                continue
+        return False
+
+    @staticmethod
+    def __etag_resp__(db_resp: list, etag: str or None) -> list:
+        """
+        Make a statement's result conditional on its ETag, see DBBase.__etag_json__().
+        :param db_resp: the statement's [db_ret, db_err] result
+        :param etag: the ETag sent with the statement, or None if it is not conditional
+        :return: the result, with its current ETag appended and db_ret set to None if the ETag matches
+        """
+
+        if etag is None or db_resp[1]:
+            return db_resp
+        curr_etag: str = hashlib.sha1(json.dumps(db_resp[0]).encode("utf-8")).hexdigest()
+        return [None if curr_etag == etag else db_resp[0], False, curr_etag]
+
+    def __db_cmd__(self, cmd: str, params: list or None, read_only: bool, tables: frozenset or None) -> tuple:
+        """
+        Execute a single SQL statement and commit it. The results of read-only statements are served from, and added
+        to, self.cache, which a write invalidates once it is committed. Registered writes are committed in groups by
+        self.coalescer, if group commit is enabled.
+        :param cmd: the SQL statement
+        :param params: the statement's parameters, if any
+        :param read_only: true if the statement only reads
+        :param tables: the tables the statement touches, or None if they are not known
+        :return: a tuple containing the statement's return value and a boolean that is true if it failed
+        """
+
+        if read_only and tables:
+            db_ret = self.cache.get(cmd, params)
+            if db_ret is not None:
+                return db_ret, False
+        if not read_only and tables is not None and self.coalescer is not None:
+            try:
+                return self.coalescer.submit(cmd, params)
+            finally:
+                self.cache.invalidate(tables)
+        generations = self.cache.generations()
+        locked_write = not read_only and bool(tables)
+        try:
+            with self.pool.connection() as conn:
+                if locked_write:
+                    self.__begin_immediate__(conn)
+                curs = conn.execute(cmd, params) if params is not None else conn.execute(cmd)
+                db_ret = curs.fetchall()
+                if locked_write:
+                    conn.execute("COMMIT")
+        except self.DB_ERRORS as e:
+            return self.__db_error__(e), True
+        finally:
+            if not read_only:
+                self.cache.invalidate(tables)
+        if read_only:
+            self.cache.put(cmd, params, tables, db_ret, generations)
+        return db_ret, False
+
+    def __db_batch__(self, batch: list, transaction: bool) -> tuple:
+        """
+        Execute a batch of statements, see SmartSchedulerDB.batch().
+
+        Read-only statements are served from self.cache until the batch's first write, after which they must see the
+        batch's own changes. The tables the batch wrote to are invalidated once it is over.
+        :param batch: the batched statements
+        :param transaction: execute all statements in a single transaction if true
+        :return: a tuple containing the list of each statement's result (or the error, if the transaction failed) and
+        a boolean that is true if the transaction failed
+        """
+
+        db_ret = []
+        generations = self.cache.generations()
+        written: frozenset or None = frozenset()
+        wrote = False
+        try:
+            with self.pool.connection() as conn:
+                curs = conn.cursor()
+                if transaction and self.__writes__(batch):
+                    self.__begin_immediate__(curs)
+                elif transaction:
+                    curs.execute("BEGIN")
+                for stmt in batch:
+                    params: list = stmt.get("cmd_params", None)
+                    try:
+                        cmd, read_only, tables = self.__stmt_cmd__(stmt)
+                        if not read_only:
+                            wrote = True
+                            written = written | tables if written is not None and tables is not None else None
+                        cacheable = read_only and tables and not wrote
+                        rows = self.cache.get(cmd, params) if cacheable else None
+                        if rows is None:
+                            curs.execute(cmd, params) if params is not None else curs.execute(cmd)
+                            rows = curs.fetchall()
+                            if cacheable:
+                                self.cache.put(cmd, params, tables, rows, generations)
+                    except (*self.DB_ERRORS, ValueError) as e:
+                        if transaction:
+                            curs.execute("ROLLBACK")
+                            return self.__db_error__(e), True
+                        db_ret.append([self.__db_error__(e), True])
+                    else:
+                        db_ret.append(self.__etag_resp__([rows, False], stmt.get("etag", None)))
+                if transaction:
+                    curs.execute("COMMIT")
+        except self.DB_ERRORS as e:
+            return self.__db_error__(e), True
+        finally:
+            if wrote:
+                self.cache.invalidate(written)
+        return db_ret, False
+
+    def __subjects_file_digest__(self) -> str:
+        """
+        Return the SHA-1 digest of the subjects file, which is only read again when its size or mtime changes.
+        :return: the digest
+        """
+
+        file_stat = stat(self.subjects_file)
+        file_id: tuple = (file_stat.st_mtime_ns, file_stat.st_size)
+        if self._subjects_file_state[0] != file_id:
+            with open(self.subjects_file, "rb") as sub_f:
+                self._subjects_file_state = (file_id, hashlib.sha1(sub_f.read()).hexdigest())
+        return self._subjects_file_state[1]
+
+    def __synced_digest__(self, curs: sqlite3.Cursor) -> str or None:
+        """
+        Return the digest of the subjects file the list of available subjects was last synced from.
+        :param curs: a cursor of the database
+        :return: the digest, or None if the list has not been synced yet
+        """
+
+        curs.execute(f"CREATE TABLE IF NOT EXISTS {self.TAB_SYNC_STATE} "
+                     f"(Source text NOT NULL PRIMARY KEY, Digest text)")
+        row = curs.execute(f"SELECT Digest FROM {self.TAB_SYNC_STATE} WHERE Source=?", [self.subjects_file]).fetchone()
+        return row[0] if row is not None else None
+
+    def __upd_sub_list__(self, upd_cmd: str) -> tuple:
+        """
+        Sync the list of available subjects with the subjects file.
+
+        Nothing is written if the file is unchanged since the last sync. Otherwise only the subjects that were added,
+        changed or removed are written, in a single transaction.
+        :param upd_cmd: the SQL statement that inserts or replaces a subject
+        :return: a tuple containing the return value and a boolean that is true if the sync failed
+        """
+
+        if self.subjects_file is None:
+            return [], False
+        try:
+            digest: str = self.__subjects_file_digest__()
+            with self.pool.connection() as conn:
+                curs = conn.cursor()
+                if self.__synced_digest__(curs) == digest:
+                    return [], False
+                with open(self.subjects_file) as sub_f:
+                    sub_info = {sub["sub_code"]: sub["sub_name"] for sub in csv.DictReader(sub_f)}
+                self.__begin_immediate__(curs)
+                if self.__synced_digest__(curs) != digest:
+                    curs.execute(f"SELECT {Schema.COL_SUB_CODE}, {Schema.COL_SUB_NAME} FROM {Schema.TAB_SUB_INFO}")
+                    curr_info = dict(curs.fetchall())
+                    curs.executemany(upd_cmd, [(code, name) for code, name in sub_info.items()
+                                               if curr_info.get(code) != name])
+                    curs.executemany(f"DELETE FROM {Schema.TAB_SUB_INFO} WHERE {Schema.COL_SUB_CODE}=?",
+                                     [(code,) for code in curr_info if code not in sub_info])
+                    curs.execute(f"INSERT OR REPLACE INTO {self.TAB_SYNC_STATE} VALUES (?, ?)",
+                                 [self.subjects_file, digest])
+                curs.execute("COMMIT")
+                self.cache.invalidate(frozenset((Schema.TAB_SUB_INFO, self.TAB_SYNC_STATE)))
+        except csv.Error:
+            return "Subjects info file corrupted.", True
+        except FileNotFoundError:
+            return "Subjects info file not found.", True
+        except self.DB_ERRORS as e:
+            return self.__db_error__(e), True
+        return [], False
+
+    def __execute__(self, request_json: dict) -> dict:
+        """
+        Execute a request, see execute().
+        :param request_json: the request body, a single statement or a batch
+        :return: the response body
+        """
+
+        if "batch" in request_json:
+            db_resp = self.__db_batch__(request_json["batch"], request_json.get("transaction", False))
+        else:
+            cmd_params: list = request_json.get("cmd_params", None)
+            try:
+                cmd, read_only, tables = self.__stmt_cmd__(request_json)
+            except ValueError as e:
+                return {"db_ret": self.__db_error__(e), "db_err": True}
+            if cmd_params and cmd_params[0] == "upd_subs":
+                db_resp = self.__upd_sub_list__(cmd)
+            else:
+                db_resp = self.__etag_resp__(list(self.__db_cmd__(cmd, cmd_params, read_only, tables)),
+                                             request_json.get("etag", None))
+        resp_json: dict = {"db_ret": db_resp[0], "db_err": db_resp[1]}
+        if len(db_resp) > 2:
+            resp_json["etag"] = db_resp[2]
+        return resp_json
+
+    def __request_name__(self, request_json: dict) -> str:
+        """
+        Return the name a request is recorded under with self.metrics, see Metrics.request_name(). A request with an
+        operation that is not registered is recorded as UNKNOWN_OP, so that clients cannot add a metric per name.
+        :param request_json: the request body, a single statement or a batch
+        :return: the request's name
+        """
+
+        stmts = request_json["batch"] if "batch" in request_json else [request_json]
+        if type(stmts) is not list or not all(type(stmt) is dict and (
+                "op" not in stmt or type(stmt["op"]) is str and stmt["op"] in STATEMENTS) for stmt in stmts):
+            return self.UNKNOWN_OP
+        return self.metrics.request_name(request_json)
+
+    def accepts(self, request_json: dict) -> bool:
+        """
+        Tell if a request is made of statements the engine executes, so that a server can reject it before executing
+        any of it. Statements must refer to a registered operation, or may also be ad hoc SQL if self.allow_sql is true.
+        :param request_json: the request body, a single statement or a batch
+        :return: a boolean that is true if the request is accepted
+        """
+
+        if type(request_json) is not dict:
+            return False
+        stmts = request_json["batch"] if "batch" in request_json else [request_json]
+        return type(stmts) is list and all(type(stmt) is dict and ("op" in stmt or self.allow_sql and "cmd" in stmt)
+                                           for stmt in stmts)
+
+    def execute(self, request_json: dict) -> dict:
+        """
+        Execute a request, and record it with self.metrics.
+        :param request_json: the request body, a single statement or a batch
+        :return: the response body, whose "db_ret" is the request's return value and whose "db_err" is true if the
+        request failed, and which contains the result's "etag" if the request is conditional
+        """
+
+        start = self.metrics.start_request()
+        resp_json = None
+        try:
+            resp_json = self.__execute__(request_json)
+            return resp_json
+        finally:
+            self.metrics.finish_request(self.__request_name__(request_json), start,
+                                        resp_json is None or resp_json["db_err"])
+
+    def stream(self, request_json: dict):
+        """
+        Execute a query and return its rows a batch at a time as they are read, so they are never all held in memory.
+        :param request_json: the request body, a single statement
+        :return: a generator that yields lists of up to STREAM_BATCH_SIZE rows, followed by a trailer dictionary whose
+        "db_ret" is the number of rows (or the error, if the query failed) and whose "db_err" is true if it failed
+        """
+
+        start = self.metrics.start_request()
+        failed = True
+        row_count = 0
+        try:
+            cmd: str = self.__stmt_cmd__(request_json)[0]
+            params: list = request_json.get("cmd_params", None)
+            with self.pool.connection() as conn:
+                curs = conn.execute(cmd, params) if params is not None else conn.execute(cmd)
+                while True:
+                    rows: list = curs.fetchmany(self.STREAM_BATCH_SIZE)
+                    if not rows:
+                        break
+                    row_count += len(rows)
+                    yield rows
+            failed = False
+        except (*self.DB_ERRORS, ValueError) as e:
+            yield {"db_ret": self.__db_error__(e), "db_err": True}
+            return
+        finally:
+            self.metrics.finish_request(f"stream({self.__request_name__(request_json)})", start, failed)
+        yield {"db_ret": row_count, "db_err": False}
+
+    def stats(self) -> dict:
+        """
+        Return the engine's connection pool, result cache and group commit counters.
+        :return: a dictionary containing the ConnectionPool.stats() and ResultCache.stats() dictionaries, and the
+        WriteCoalescer.stats() dictionary if group commit is enabled
+        """
+
+        stats = {"pool": self.pool.stats(), "cache": self.cache.stats()}
+        if self.coalescer is not None:
+            stats["group_commit"] = self.coalescer.stats()
+        return stats
+
+    def exposition(self) -> str:
+        """
+        Render self.metrics, and the connection pool, result cache and group commit counters, in the Prometheus text
+        exposition format.
+        :return: the exposition text
+        """
+
+        stats = self.stats()
+        cache: dict = stats["cache"]
+        lookups = cache["hits"] + cache["misses"]
+        gauges = {
+            "cache_hits_total": ("counter", "Result cache hits.", cache["hits"]),
+            "cache_misses_total": ("counter", "Result cache misses.", cache["misses"]),
+            "cache_hit_ratio": ("gauge", "Result cache hits per lookup.", cache["hits"] / lookups if lookups else 0.0),
+            "cache_evictions_total": ("counter", "Results evicted from the result cache.", cache["evictions"]),
+            "cache_invalidations_total": ("counter", "Results invalidated by writes.", cache["invalidations"]),
+            "cache_entries": ("gauge", "Results in the result cache.", cache["entries"]),
+            "cache_bytes": ("gauge", "Size of the results in the result cache.", cache["bytes"]),
+            "pool_connections": ("gauge", "Database connections, by state.",
+                                 {'state="open"': stats["pool"]["open_connections"],
+                                  'state="idle"': stats["pool"]["idle_connections"]}),
+        }
+        if "group_commit" in stats:
+            gauges["group_commit_batches_total"] = ("counter", "Group commits.", stats["group_commit"]["batches"])
+            gauges["group_commit_writes_total"] = ("counter", "Writes committed in groups.",
+                                                   stats["group_commit"]["writes"])
+        return self.metrics.exposition(gauges)
+
+    def health(self) -> tuple:
+        """
+        Check that the database can be queried.
+        :return: a tuple containing a boolean that is true if the database is healthy, and a message
+        """
+
+        try:
+            with self.pool.connection() as conn:
+                conn.execute("SELECT 1").fetchall()
+        except sqlite3.Error as e:
+            return False, e.args[0]
+        return True, "ok"
+
+    def close(self):
+        """Commit any writes waiting for a group commit, and close the engine's pooled connections."""
+
+        if self.coalescer is not None:
+            self.coalescer.close()
+        self.pool.close()
+
+
+if __name__ == "__main__":
+    # for quick testing
+
+    pass
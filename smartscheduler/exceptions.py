@@ -14,3 +14,9 @@ class FatalError(Exception):
 
 class CommonDatabaseError(Exception):
     pass
+
+
+class DatabaseUnavailableError(CommonDatabaseError):
+    """Raised when a request fails because the database server could not be reached or did not respond."""
+
+    pass
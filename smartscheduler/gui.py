@@ -444,11 +444,11 @@ class ScheduleEditor:
         try:
             self.schedule = Schedule(self._smart_sch)
             self.disp_subs = {self.schedule.get_class_name(reg_code=reg_code): reg_code for reg_code in
-                              self._smart_sch.get_reg_subjects().keys()}
+                              self.schedule.reg_subjects.keys()}
         except CommonError:
             raise
 
-        self._reg_subs = self._smart_sch.get_reg_subjects()
+        self._reg_subs = self.schedule.reg_subjects
 
         if self.edit_mode:
             if not self._reg_subs:
@@ -1082,10 +1082,11 @@ class MainWindow(tk.Toplevel):
         """
 
         try:
-            editor = sch_editor or ScheduleEditor(self, edit_mode=False)
-            editor.edit_mode = False
-            new_schedule_n = editor.build_schedule(self.schedule_n, focus_day=Utils.curr_day())
-            self.__refresh_class_info__(editor.schedule)
+            with self.smart_sch.db.track("refresh"):
+                editor = sch_editor or ScheduleEditor(self, edit_mode=False)
+                editor.edit_mode = False
+                new_schedule_n = editor.build_schedule(self.schedule_n, focus_day=Utils.curr_day())
+                self.__refresh_class_info__(editor.schedule)
             self.__rem_loading__()
         except CommonError as e:
             if e.flag == "l_out":
@@ -1180,7 +1181,7 @@ def main():
     loading_win = GUtils.loading_win(root, "Starting")
     loading_win.update()
     try:
-        smart_sch = SmartScheduler()
+        smart_sch = SmartScheduler(journal_path=SmartScheduler.DEF_JOURNAL_FILE)
         LoginWindow(root, smart_sch)
         loading_win.destroy()
     except FatalError as e:
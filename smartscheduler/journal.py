@@ -0,0 +1,237 @@
+import sqlite3
+from threading import Event, Lock, Thread
+from typing import NamedTuple
+
+from smartscheduler.database import SmartSchedulerDB
+from smartscheduler.exceptions import CommonDatabaseError, DatabaseUnavailableError
+
+
+__all__ = ["WriteJournal", "JournalEntry"]
+
+
+class JournalEntry(NamedTuple):
+    """A pending account information update recorded in the journal."""
+
+    seq: int
+    student_id: str
+    session_id: str
+    column: str
+    value: str
+    base_value: str
+
+
+class WriteJournal:
+    """
+    A durable write-behind queue of account information updates, kept in a local SQLite database.
+
+    Updates are acknowledged as soon as they are recorded locally, and a background thread flushes them to the server
+    in the order they were made, retrying every retry_interval seconds while the server cannot be reached. Each update
+    remembers the value it was based on, and is only applied if the server still holds that value: an update that lost
+    to a write made elsewhere, or whose session was logged out, is rejected and moved to the conflicts table instead. So
+    is an update the server failed to apply, which would only fail again, so that it does not hold up the updates after
+    it.
+    """
+
+    DEF_RETRY_INTERVAL: float = 5.0
+    TAB_PENDING: str = "Pending"
+    TAB_CONFLICTS: str = "Conflicts"
+    CONFLICT: str = "conflict"
+    LOGGED_OUT: str = "l_out"
+    ERROR: str = "error"
+
+    def __init__(self, db: SmartSchedulerDB, path: str, retry_interval: float = DEF_RETRY_INTERVAL,
+                 on_reject=None):
+        """
+        Open the journal, creating it if it does not already exist. Updates left pending by a previous run are kept.
+        :param db: the database manager updates are flushed through
+        :param path: the path of the local journal file
+        :param retry_interval: optional, the number of seconds between flush attempts while the server is unreachable
+        :param on_reject: optional, called with a JournalEntry, the reason (CONFLICT, LOGGED_OUT or ERROR) and the
+        server's value, or error message, whenever an update is rejected
+        """
+
+        self.db: SmartSchedulerDB = db
+        self.path: str = path
+        self.retry_interval: float = retry_interval
+        self.on_reject = on_reject
+        self._conn: sqlite3.Connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock: Lock = Lock()
+        self._flush_lock: Lock = Lock()
+        self._wake: Event = Event()
+        self._stopped: Event = Event()
+        self._flusher: Thread or None = None
+        with self._lock, self._conn:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self.TAB_PENDING} (Seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                               f"Student_ID TEXT, Session_ID TEXT, Column TEXT, Value TEXT, Base_value TEXT)")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self.TAB_CONFLICTS} (Seq INTEGER PRIMARY KEY, "
+                               f"Student_ID TEXT, Session_ID TEXT, Column TEXT, Value TEXT, Base_value TEXT, "
+                               f"Server_value TEXT, Reason TEXT)")
+
+    def __entries__(self, table: str, s_id: str = None) -> list:
+        """
+        Read the entries of a journal table, oldest first.
+        :param table: the journal table
+        :param s_id: optional, only read the entries of this student ID
+        :return: a list of JournalEntry objects
+        """
+
+        cmd = f"SELECT Seq, Student_ID, Session_ID, Column, Value, Base_value FROM {table}"
+        with self._lock:
+            if s_id is None:
+                rows = self._conn.execute(cmd + " ORDER BY Seq").fetchall()
+            else:
+                rows = self._conn.execute(cmd + " WHERE Student_ID=? ORDER BY Seq", [s_id]).fetchall()
+        return [JournalEntry(*row) for row in rows]
+
+    def __reject__(self, entry: JournalEntry, reason: str, server_val: str or None):
+        """
+        Move a rejected update from the pending table to the conflicts table.
+        :param entry: the rejected update
+        :param reason: CONFLICT, LOGGED_OUT or ERROR
+        :param server_val: the server's value of the field, or None if the account does not exist, or the server's
+        error message if the reason is ERROR
+        """
+
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT OR REPLACE INTO {self.TAB_CONFLICTS} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               [*entry, server_val, reason])
+            self._conn.execute(f"DELETE FROM {self.TAB_PENDING} WHERE Seq=?", [entry.seq])
+        if self.on_reject is not None:
+            self.on_reject(entry, reason, server_val)
+
+    def __flush_entry__(self, entry: JournalEntry):
+        """
+        Apply a single pending update to the server, then remove it from the pending table.
+
+        Raises DatabaseUnavailableError if the server cannot be reached, in which case the update stays pending, or
+        CommonDatabaseError if the server failed to apply it.
+        :param entry: the pending update
+        """
+
+        applied, account = self.db.replace_session_account_info(entry.student_id, entry.session_id, entry.column,
+                                                                entry.value, entry.base_value)
+        server_val = self.db.snapshot_info(account, entry.column) if account is not None else None
+        if not applied and server_val != entry.value:
+            reason = self.LOGGED_OUT if account is None or account.session_id != entry.session_id else self.CONFLICT
+            self.__reject__(entry, reason, server_val)
+        else:
+            with self._lock, self._conn:
+                self._conn.execute(f"DELETE FROM {self.TAB_PENDING} WHERE Seq=?", [entry.seq])
+
+    def __run__(self):
+        """
+        Flush the journal whenever an update is recorded, and every self.retry_interval seconds. An unexpected error
+        only ends the current flush, the updates left pending are flushed again at the next attempt.
+        """
+
+        while not self._stopped.is_set():
+            self._wake.wait(self.retry_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:  # the flusher must outlive any single flush
+                continue
+
+    def record(self, s_id: str, session_id: str, update_col: str, update_val: str, base_val: str):
+        """
+        Durably record an account information update, to be flushed to the server in the background.
+        :param s_id: the account's student ID
+        :param session_id: the ID of the session making the update
+        :param update_col: the account information column to update
+        :param update_val: the updated value
+        :param base_val: the value the update was based on
+        """
+
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT INTO {self.TAB_PENDING} (Student_ID, Session_ID, Column, Value, Base_value) "
+                               f"VALUES (?, ?, ?, ?, ?)", [s_id, session_id, update_col, update_val, base_val])
+        self._wake.set()
+
+    def pending(self, s_id: str = None) -> list:
+        """
+        Return the updates that have not been flushed yet, oldest first.
+        :param s_id: optional, only return the updates of this student ID
+        :return: a list of JournalEntry objects
+        """
+
+        return self.__entries__(self.TAB_PENDING, s_id)
+
+    def pending_values(self, s_id: str) -> dict:
+        """
+        Return the newest pending value of each account information field of an account.
+        :param s_id: the account's student ID
+        :return: a dictionary where the keys are the columns and the values are the newest pending values
+        """
+
+        return {entry.column: entry.value for entry in self.pending(s_id)}
+
+    def conflicts(self, s_id: str = None) -> list:
+        """
+        Return the updates that were rejected, oldest first.
+        :param s_id: optional, only return the updates of this student ID
+        :return: a list of JournalEntry objects
+        """
+
+        return self.__entries__(self.TAB_CONFLICTS, s_id)
+
+    def adopt(self, s_id: str, session_id: str):
+        """
+        Hand the pending updates of an account over to a new session, e.g. after logging in again.
+        :param s_id: the account's student ID
+        :param session_id: the new session's ID
+        """
+
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE {self.TAB_PENDING} SET Session_ID=? WHERE Student_ID=?", [session_id, s_id])
+        self._wake.set()
+
+    def discard(self, s_id: str):
+        """
+        Discard the pending updates and conflicts of an account, e.g. after it has been deleted.
+        :param s_id: the account's student ID
+        """
+
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.TAB_PENDING} WHERE Student_ID=?", [s_id])
+            self._conn.execute(f"DELETE FROM {self.TAB_CONFLICTS} WHERE Student_ID=?", [s_id])
+
+    def flush(self) -> bool:
+        """
+        Flush the pending updates to the server in the order they were made, stopping at the first one that cannot
+        reach the server. An update the server fails to apply is rejected with the reason ERROR.
+        :return: a boolean that is true if no updates are left pending
+        """
+
+        with self._flush_lock:
+            for entry in self.pending():
+                try:
+                    self.__flush_entry__(entry)
+                except DatabaseUnavailableError:
+                    return False
+                except CommonDatabaseError as e:
+                    self.__reject__(entry, self.ERROR, str(e))
+            return True
+
+    def start(self):
+        """Start flushing the journal in a background thread."""
+
+        if self._flusher is None:
+            self._flusher = Thread(target=self.__run__, name="WriteJournal", daemon=True)
+            self._flusher.start()
+
+    def close(self):
+        """Stop the background thread and close the journal file, pending updates are kept for the next run."""
+
+        self._stopped.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    # for quick testing
+
+    pass
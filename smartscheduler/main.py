@@ -4,8 +4,11 @@ from copy import deepcopy
 from passlib.hash import pbkdf2_sha256
 from random import randint
 
-from smartscheduler.database import SmartSchedulerDB
+from smartscheduler.cache import CatalogCache
+from smartscheduler.database import SmartSchedulerDB, AccountSnapshot
 from smartscheduler.exceptions import CommonError, CommonDatabaseError, FatalError
+from smartscheduler.journal import WriteJournal, JournalEntry
+from smartscheduler.metrics import Metrics
 from smartscheduler.utils import Utils
 
 
@@ -34,29 +37,56 @@ def catch_db_err(db_cmd):
     return wrapper
 
 
+def track_call(method):
+    """
+    A decorator function to record the calls of a SmartScheduler method with the database manager's metrics, along
+    with the round trips made and bytes transferred by each call. Nothing is recorded if metrics are disabled.
+    :param method: the method to record
+    :return: the wrapper around method
+    """
+
+    def wrapper(self, *args, **kwargs):
+        with self.db.track(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class SmartScheduler:
     """Contains most of the core logic for the Smart Scheduler application."""
 
-    def __init__(self, test_server: str = None):
+    DEF_SERVER: str = "http://127.0.0.1:8000/"
+    DEF_JOURNAL_FILE: str = "./journal.db"
+
+    def __init__(self, test_server: str = None, journal_path: str = None, metrics: Metrics = None):
         """
         Initialise instance variables and get the database and subjects file path from the configuration file.
         :param test_server: test server address
+        :param journal_path: optional, the path of a local write-behind journal, if given schedule and registered
+        subjects updates are acknowledged once they are journaled and are flushed to the database in the background
+        :param metrics: optional, records the latency, round trips and bytes of every database request and of the
+        calls that make them, such as logging in
         """
 
         try:
-            self.db = SmartSchedulerDB(test_server or "http://127.0.0.1:8000/")
+            self.db = SmartSchedulerDB(test_server or self.DEF_SERVER, metrics=metrics)
         except CommonDatabaseError as e:
             raise FatalError("[DBErr] " + e.args[0])
+        self.subjects_cache = CatalogCache(self.db)
+        self.journal: WriteJournal or None = None
+        if journal_path is not None:
+            self.journal = WriteJournal(self.db, journal_path, on_reject=self.__journal_rejected__)
+            self.journal.start()
+        self.journal_bases: dict = {}
         self.session_id = None
         self.student_id = None
         self.curr_class_link = None
         self.update_sub_list()
 
-    def __chk_s_id__(self, student_id: str) -> bool:
+    @staticmethod
+    def __valid_s_id__(student_id: str):
         """
-        Check if an account exists in the accounts table in the database.
+        Check if a student ID is well formed, raising a ValueError if it is not.
         :param student_id: the account's student ID
-        :return: a boolean to confirm the account's existence
         """
 
         if not student_id:
@@ -65,27 +95,112 @@ class SmartScheduler:
             raise ValueError("Student ID must have exactly 10 digits.")
         if not student_id.isnumeric():
             raise ValueError("Student ID must contain only numbers.")
-        return self.db.query_account_info(student_id, self.db.COL_STU_ID) != []
 
-    def __chk_pswrd__(self, student_id: str, pswrd: str) -> bool:
+    @staticmethod
+    def __chk_snapshot__(account: AccountSnapshot or None, session_id: str) -> AccountSnapshot:
         """
-        Check if entered account password matches password stored in database, by comparing salted password hashes.
-        :param student_id: the account's student ID
-        :param pswrd: the entered password
-        :return: a boolean to confirm if the passwords match
+        Check that an account snapshot belongs to a session.
+
+        Raises CommonError if the account no longer exists or if the session is not logged in.
+        :param account: an AccountSnapshot of the account
+        :param session_id: the session's ID
+        :return: account, if it belongs to the session
+        """
+
+        if account is None or account.session_id != session_id:
+            raise CommonError(flag="l_out")
+        return account
+
+    @staticmethod
+    def __new_session_id__() -> str:
+        """
+        Generate a new session ID.
+        :return: a random 32 digit session ID
+        """
+
+        return "".join([str(randint(1, 9)) for _ in range(32)])
+
+    def __chk_account__(self, account: AccountSnapshot or None) -> AccountSnapshot:
+        """
+        Check that an account snapshot belongs to the current session.
+
+        Raises CommonError if the current session is not logged in.
+        :param account: an AccountSnapshot of the account
+        :return: account, if it belongs to the current session
+        """
+
+        return self.__merge_pending__(self.__chk_snapshot__(account, self.session_id))
+
+    def __merge_pending__(self, account: AccountSnapshot) -> AccountSnapshot:
         """
+        Overlay the account's journaled updates that have not been flushed yet onto a snapshot of the account.
 
-        pass_hash = self.db.query_account_info(student_id, self.db.COL_PSWRD_HASH)[0]
-        return pbkdf2_sha256.verify(pswrd, pass_hash)
+        The server's value of every field without pending updates becomes the base value of the next journaled update
+        to that field.
+        :param account: an AccountSnapshot of the account, as read from the database
+        :return: an AccountSnapshot of the account, as it will be once the journal is flushed
+        """
 
-    def __chk_s_in__(self, student_id: str) -> bool:
+        if self.journal is None:
+            return account
+        pending = self.journal.pending_values(account.student_id)
+        for col in (self.db.COL_SCHEDULE, self.db.COL_SUBJECTS):
+            if col not in pending:
+                self.journal_bases[col] = self.db.snapshot_info(account, col)
+        return account._replace(**{
+            "schedule": pending.get(self.db.COL_SCHEDULE, account.schedule),
+            "reg_subjects": pending.get(self.db.COL_SUBJECTS, account.reg_subjects)
+        })
+
+    def __journal_rejected__(self, entry: JournalEntry, reason: str, server_val: str or None):
+        """
+        Handle a journaled update rejected by the server, called from the journal's background thread.
+        :param entry: the rejected update
+        :param reason: WriteJournal.CONFLICT, WriteJournal.LOGGED_OUT or WriteJournal.ERROR
+        :param server_val: the server's value of the field
         """
-        Check if any session is currently logged in, i.e an account's session ID in database is not '0'.
+
+        if entry.student_id == self.student_id:
+            self.journal_bases.pop(entry.column, None)
+
+    def __write_account_info__(self, update_col: str, update_val: str):
+        """
+        Update an account information field of the current session's account.
+
+        If there is a journal and the field's current value is known, the update is journaled and flushed in the
+        background. Otherwise it is written through, raising CommonError if the current session is not logged in.
+        :param update_col: the account information column to update
+        :param update_val: the updated value
+        """
+
+        if self.journal is None or update_col not in self.journal_bases:
+            self.__chk_write__(self.db.update_session_account_info(self.student_id, self.session_id,
+                                                                   update_col, update_val))
+        elif update_val != self.journal_bases[update_col]:
+            self.journal.record(self.student_id, self.session_id, update_col, update_val,
+                                self.journal_bases[update_col])
+            self.journal_bases[update_col] = update_val
+
+    def __chk_write__(self, written: bool):
+        """
+        Check the outcome of a write conditioned on the current session.
+
+        Raises CommonError if the current session is not logged in, in which case nothing was written.
+        :param written: the return value of the conditional write
+        """
+
+        if not written:
+            raise CommonError(flag="l_out")
+
+    def __chk_s_id__(self, student_id: str) -> bool:
+        """
+        Check if an account exists in the accounts table in the database.
         :param student_id: the account's student ID
-        :return: a boolean to confirm if the session ID is '0'
+        :return: a boolean to confirm the account's existence
         """
 
-        return self.db.query_account_info(student_id, self.db.COL_SESSION_ID)[0] == "0"
+        self.__valid_s_id__(student_id)
+        return self.db.query_account_info(student_id, self.db.COL_STU_ID) != []
 
     def __create_acc__(self, student_id: str, pswrd: str):
         """
@@ -106,6 +221,7 @@ class SmartScheduler:
 
         return self.db.query_account_info(student_id, self.db.COL_SESSION_ID)[0] == self.session_id
 
+    @track_call
     def login(self, student_id: str, pswrd: str):
         """
         Login to an account.
@@ -117,11 +233,13 @@ class SmartScheduler:
         """
 
         try:
-            if not self.__chk_s_id__(student_id):
+            self.__valid_s_id__(student_id)
+            account = self.db.query_account(student_id)
+            if account is None:
                 raise ValueError("Student ID not found.")
-            if not self.__chk_pswrd__(student_id, pswrd):
+            if not pbkdf2_sha256.verify(pswrd, account.pswrd_hash):
                 raise ValueError("Incorrect password.")
-            if not self.__chk_s_in__(student_id):
+            if account.session_id != "0":
                 raise CommonError("This account is already logged in through a device.", flag="l_in")
         except ValueError as e:
             raise CommonError(e.args[0])
@@ -130,31 +248,38 @@ class SmartScheduler:
         except CommonError:
             raise
         else:
-            self.session_id = "".join([str(randint(1, 9)) for _ in range(32)])
+            self.session_id = self.__new_session_id__()
             self.student_id = student_id
             self.db.update_account_info(self.student_id, self.db.COL_SESSION_ID, self.session_id)
+            self.journal_bases.clear()
+            if self.journal is not None:
+                self.journal.adopt(self.student_id, self.session_id)
 
+    @track_call
     def logout(self, remote_student_id: str = None):
         """
         Logout of an account.
 
         Normally, the student ID of the account to logout from is stored in the variable self.student_id. However a
         remote student ID can be provided to logout remotely by disconnecting a session from the current session.
-        Intercepts database errors and raises a CommonError.
+        A local logout only takes effect if the current session is still logged in, and is preceded by flushing any
+        journaled updates. Intercepts database errors and raises a CommonError.
         :param remote_student_id: the account's student ID for logging out remotely
         """
 
         try:
+            if not remote_student_id and self.journal is not None and not self.journal.flush():
+                raise CommonDatabaseError("Cannot reach database to save pending changes.")
             if remote_student_id:
                 return self.db.update_account_info(remote_student_id, self.db.COL_SESSION_ID, "0")
             else:
-                if self.__logged_in__(self.student_id):
-                    self.db.update_account_info(self.student_id, self.db.COL_SESSION_ID, "0")
+                self.db.update_session_account_info(self.student_id, self.session_id, self.db.COL_SESSION_ID, "0")
         except CommonDatabaseError as e:
             raise CommonError("[DBErr] " + e.args[0])
         else:
             self.student_id = None
 
+    @track_call
     def change_pswrd(self, student_id: str, old_pswrd: str, new_pswrd: str, conf_pswrd: str):
         """
         Change an account's password.
@@ -168,9 +293,11 @@ class SmartScheduler:
         """
 
         try:
-            if not self.__chk_s_id__(student_id):
+            self.__valid_s_id__(student_id)
+            account = self.db.query_account(student_id)
+            if account is None:
                 raise ValueError("Student ID not found.")
-            if not self.__chk_pswrd__(student_id, old_pswrd):
+            if not pbkdf2_sha256.verify(old_pswrd, account.pswrd_hash):
                 raise ValueError("Incorrect old password.")
             if not new_pswrd == conf_pswrd:
                 raise ValueError("Password confirmation failed, please try again.")
@@ -180,6 +307,7 @@ class SmartScheduler:
         except CommonDatabaseError as e:
             raise CommonError("[DBErr] " + e.args[0])
 
+    @track_call
     def sign_up(self, student_id: str, pswrd: str, conf_pswrd: str):
         """
         Create an account.
@@ -203,18 +331,55 @@ class SmartScheduler:
             raise CommonError("[DBErr] " + e.args[0])
 
     @catch_db_err
+    @track_call
     def delete_acc(self):
         """
         Delete the account corresponding to self.student_id from the database's accounts table.
 
+        The account is only deleted if the current session is logged in to it, which the server checks as part of the
+        deletion. Raises CommonError if current session is not logged in.
+        """
+
+        self.__chk_write__(self.db.delete_session_account(self.student_id, self.session_id))
+        if self.journal is not None:
+            self.journal.discard(self.student_id)
+
+    @catch_db_err
+    def get_account_snapshot(self) -> AccountSnapshot:
+        """
+        Retrieve a snapshot of the account associated with self.student_id from the database in a single query.
+
+        The session check is done against the snapshot itself, so no separate query is needed for it.
         Raises CommonError if current session is not logged in.
+        :return: an AccountSnapshot of the account
         """
 
-        if not self.__logged_in__(self.student_id):
-            raise CommonError(flag="l_out")
-        self.db.delete_account(self.student_id)
+        return self.__chk_account__(self.db.query_account(self.student_id))
 
     @catch_db_err
+    @track_call
+    def get_account_data(self) -> tuple:
+        """
+        Retrieve a snapshot of the account associated with self.student_id and the available subjects together.
+
+        Both reads are sent in a single batched request and executed in one transaction, so the data is consistent. The
+        subjects info is read through self.subjects_cache, so it is only downloaded if it has changed.
+        Raises CommonError if current session is not logged in.
+        :return: a tuple containing an AccountSnapshot and the subjects info as a dictionary
+        """
+
+        stmts = [self.db.query_account_stmt(self.student_id)]
+        if not self.subjects_cache.fresh:
+            stmts.append(self.subjects_cache.revalidate_stmt())
+        (account_ret, _), *catalog_ret = self.db.batch(stmts, transaction=True, idempotent=True)
+        account = self.__chk_account__(self.db.account_snapshot(account_ret))
+        if catalog_ret:
+            subs_info, _, etag = catalog_ret[0]
+            subjects_info = self.subjects_cache.update(subs_info, etag)
+            if subjects_info is not None:
+                return account, subjects_info
+        return account, self.subjects_cache.get()
+
     def get_schedule(self) -> dict:
         """
         Retrieve the schedule associated with self.student_id from the database.
@@ -224,11 +389,8 @@ class SmartScheduler:
         :return: the schedule as a dictionary
         """
 
-        if not self.__logged_in__(self.student_id):
-            raise CommonError(flag="l_out")
-        return literal_eval(self.db.query_account_info(self.student_id, self.db.COL_SCHEDULE)[0])
+        return literal_eval(self.get_account_snapshot().schedule)
 
-    @catch_db_err
     def get_reg_subjects(self) -> dict:
         """
         Retrieve the registered subjects associated with self.student_id from the database.
@@ -238,47 +400,46 @@ class SmartScheduler:
         :return: the registered subjects as a dictionary
         """
 
-        if not self.__logged_in__(self.student_id):
-            raise CommonError(flag="l_out")
-        return literal_eval(self.db.query_account_info(self.student_id, self.db.COL_SUBJECTS)[0])
+        return literal_eval(self.get_account_snapshot().reg_subjects)
 
     @catch_db_err
+    @track_call
     def update_reg_subjects(self, new_subs: dict):
         """
         Update the registered subjects associated with self.student_id from the database.
 
         The subjects are converted from a dictionary into a string representation before being stored in the database.
+        The update is conditioned on the current session by the server, so no separate session check is needed.
         Raises CommonError if current session is not logged in.
         :param new_subs: the updated subjects to store in the database
         """
 
-        if not self.__logged_in__(self.student_id):
-            raise CommonError(flag="l_out")
-        self.db.update_account_info(self.student_id, self.db.COL_SUBJECTS, str(new_subs))
+        self.__write_account_info__(self.db.COL_SUBJECTS, str(new_subs))
 
     @catch_db_err
+    @track_call
     def update_schedule(self, new_sch: dict):
         """
         Update the schedule associated with self.student_id from the database.
 
         The schedule is converted from a dictionary into a string representation before being stored in the database.
+        The update is conditioned on the current session by the server, so no separate session check is needed.
         Raises CommonError if current session is not logged in.
         :param new_sch: the updated schedule to store in the database
         """
 
-        if not self.__logged_in__(self.student_id):
-            raise CommonError(flag="l_out")
-        self.db.update_account_info(self.student_id, self.db.COL_SCHEDULE, str(new_sch))
+        self.__write_account_info__(self.db.COL_SCHEDULE, str(new_sch))
 
     @catch_db_err
     def get_subjects_info(self) -> dict:
         """
         Retrieve the list of subjects available for registration.
+
+        The list is read through self.subjects_cache, so it is only downloaded if it has changed.
         :return: A dictionary where the keys are the subject codes and the values are the corresponding subject names.
         """
 
-        subs_info: list = self.db.retrieve_all(self.db.TAB_SUB_INFO)
-        return {info[0]: info[1] for info in subs_info}
+        return self.subjects_cache.get()
 
     def update_curr_link(self, class_link: str):
         """
@@ -288,31 +449,35 @@ class SmartScheduler:
 
         self.curr_class_link = class_link
 
+    @track_call
     def update_sub_list(self):
-        """Update the list of subjects available for registration."""
+        """Update the list of subjects available for registration, and invalidate the cached list."""
 
         try:
             self.db.upd_sub_list()
         except CommonDatabaseError as e:
             raise FatalError(e.args[0])
+        finally:
+            self.subjects_cache.invalidate()
 
 
 class Subjects:
     """Manages the registered subjects of an account."""
 
-    def __init__(self, smart_sch: SmartScheduler):
+    def __init__(self, smart_sch: SmartScheduler, account_data: tuple = None):
         """
         Initialise instance variables and get the current registered subjects for the account.
 
         The account's student ID is provided by self.smart_sch. A deepcopy is also made of the registered subjects to
         later help in checking if any changes were made.
         :param smart_sch: an instance of SmartScheduler that provides the account information
+        :param account_data: optional, an (AccountSnapshot, subjects info) tuple to build from instead of fetching one
         """
 
         self.smart_sch = smart_sch
-        self.reg_subjects = self.smart_sch.get_reg_subjects()
+        account, self.subjects_info = account_data or self.smart_sch.get_account_data()
+        self.reg_subjects = literal_eval(account.reg_subjects)
         self.orig_reg_subjects = deepcopy(self.reg_subjects)
-        self.subjects_info = self.smart_sch.get_subjects_info()
 
     def register_subject(self, reg_info: dict, old_reg_code: str = None):
         """
@@ -422,17 +587,18 @@ class Schedule:
     CLASS_HOURS = ("08", "09", "10", "11", "12", "13", "14", "15", "16", "17", "18", "19", "20", "21", "22")
     CLASS_MINS = ("00", "15", "30", "45")
 
-    def __init__(self, smart_sch: SmartScheduler):
+    def __init__(self, smart_sch: SmartScheduler, account_data: tuple = None):
         """
         Initialise instance variables, get the current schedule, and filter out classes of unregistered subjects.
         :param smart_sch: an instance of SmartScheduler that provides the account information
+        :param account_data: optional, an (AccountSnapshot, subjects info) tuple to build from instead of fetching one
         """
 
         self._smart_sch: SmartScheduler = smart_sch
-        self._schedule: dict = self.__parse__(self._smart_sch.get_schedule())
+        account, self._subjects_info = account_data or self._smart_sch.get_account_data()
+        self._reg_subjects: dict = literal_eval(account.reg_subjects)
+        self._schedule: dict = self.__parse__(literal_eval(account.schedule))
         self._orig_schedule: dict = {}
-        self._subjects_info: dict = self._smart_sch.get_subjects_info()
-        self._reg_subjects: dict = self._smart_sch.get_reg_subjects()
         self.__filter__()
 
     def __parse__(self, schedule: dict) -> dict:
@@ -461,6 +627,10 @@ class Schedule:
     def dict_schedule(self) -> dict:
         return self._schedule
 
+    @property
+    def reg_subjects(self) -> dict:
+        return self._reg_subjects
+
     @property
     def db_schedule(self) -> dict:
         """
@@ -0,0 +1,417 @@
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from math import log
+from threading import Event, Lock, Thread
+from time import monotonic, perf_counter, time
+
+
+__all__ = ["LatencyHistogram", "Metrics", "ServerMetrics"]
+
+
+class LatencyHistogram:
+    """
+    A fixed size histogram of latencies with logarithmic buckets.
+
+    Each bucket is GROWTH times wider than the one before it, so percentiles are estimated to within a few percent at
+    any scale, and recording a latency costs a single logarithm no matter how many have been recorded.
+    """
+
+    MIN_LATENCY: float = 1e-5
+    GROWTH: float = 2 ** 0.125
+    BUCKETS: int = 200
+
+    def __init__(self):
+        """Initialise an empty histogram."""
+
+        self.counts: list = [0] * self.BUCKETS
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    def record(self, latency: float):
+        """
+        Record a latency.
+        :param latency: the latency in seconds
+        """
+
+        if latency <= self.MIN_LATENCY:
+            bucket = 0
+        else:
+            bucket = min(self.BUCKETS - 1, int(log(latency / self.MIN_LATENCY, self.GROWTH)) + 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, pct: float) -> float:
+        """
+        Estimate a percentile of the recorded latencies, as the geometric middle of the bucket it falls in.
+        :param pct: the percentile, between 0 and 100
+        :return: the estimated latency in seconds, 0 if nothing has been recorded
+        """
+
+        rank = pct / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                if bucket == 0:
+                    return self.MIN_LATENCY
+                return min(self.max, self.MIN_LATENCY * self.GROWTH ** (bucket - 0.5))
+        return 0.0
+
+    def cumulative_counts(self, bounds: tuple) -> list:
+        """
+        Count the recorded latencies up to each of a list of bounds, to within the width of a bucket.
+        :param bounds: the bounds in seconds, in increasing order
+        :return: a list containing the number of latencies at most each bound
+        """
+
+        counts = []
+        seen = 0
+        bucket = 0
+        for bound in bounds:
+            while bucket < self.BUCKETS and self.MIN_LATENCY * self.GROWTH ** bucket <= bound * (1 + 1e-9):
+                seen += self.counts[bucket]
+                bucket += 1
+            counts.append(seen)
+        return counts
+
+
+class Metrics:
+    """
+    Records the call counts, round trips, bytes sent and received, and latency histograms of database operations.
+
+    Every request made by a database manager is recorded under the name of its operation (see
+    smartscheduler.statements), and a batch under the names of the operations it contains. Higher level calls, such as
+    logging in, are recorded with track(), along with the round trips and bytes of the requests made while they ran.
+
+    Snapshots can be taken with snapshot(), and appended to a local file as JSON lines with dump(), periodically if a
+    dump interval is given.
+    """
+
+    DEF_DUMP_INTERVAL: float = 60.0
+    _scopes: ContextVar = ContextVar("metrics_scopes", default=())
+
+    def __init__(self, dump_path: str = None, dump_interval: float = DEF_DUMP_INTERVAL):
+        """
+        Initialise empty metrics.
+        :param dump_path: optional, the path of the local file snapshots are appended to
+        :param dump_interval: optional, the number of seconds between snapshots once start() is called
+        """
+
+        self.dump_path: str or None = dump_path
+        self.dump_interval: float = dump_interval
+        self._ops: dict = {}
+        self._since: float = time()
+        self._started: float = perf_counter()
+        self._lock: Lock = Lock()
+        self._stopped: Event = Event()
+        self._dumper: Thread or None = None
+
+    @staticmethod
+    def request_name(request_json: dict) -> str:
+        """
+        Return the name a request is recorded under.
+        :param request_json: the request body
+        :return: the request's operation ID, "batch(op_1,op_2,...)" for a batch, or "sql" for an ad hoc SQL command
+        """
+
+        if "batch" in request_json:
+            ops = dict.fromkeys(stmt.get("op", "sql") for stmt in request_json["batch"])
+            return f"batch({','.join(ops)})"
+        return request_json.get("op", "sql")
+
+    def record(self, name: str, latency: float, sent: int = 0, received: int = 0, failed: bool = False,
+               round_trips: int = 1):
+        """
+        Record a completed operation, and add its round trips and bytes to the calls being tracked in this context.
+        :param name: the name of the operation
+        :param latency: the operation's latency in seconds
+        :param sent: optional, the number of bytes sent
+        :param received: optional, the number of bytes received
+        :param failed: optional, true if the operation failed
+        :param round_trips: optional, the number of round trips made to the server
+        """
+
+        self.__record__(name, latency, sent, received, failed, round_trips)
+        for metrics, scope in self._scopes.get():
+            if metrics is self:
+                scope[0] += round_trips
+                scope[1] += sent
+                scope[2] += received
+
+    def __record__(self, name: str, latency: float, sent: int, received: int, failed: bool, round_trips: int):
+        """
+        Record a completed operation, without adding it to the calls being tracked, see record().
+        :param name: the name of the operation
+        :param latency: the operation's latency in seconds
+        :param sent: the number of bytes sent
+        :param received: the number of bytes received
+        :param failed: true if the operation failed
+        :param round_trips: the number of round trips made to the server
+        """
+
+        with self._lock:
+            op = self._ops.get(name)
+            if op is None:
+                op = self._ops[name] = {"count": 0, "errors": 0, "round_trips": 0, "bytes_sent": 0,
+                                        "bytes_received": 0, "latency": LatencyHistogram()}
+            op["count"] += 1
+            op["errors"] += failed
+            op["round_trips"] += round_trips
+            op["bytes_sent"] += sent
+            op["bytes_received"] += received
+            op["latency"].record(latency)
+
+    @contextmanager
+    def track(self, name: str):
+        """
+        Record a call, such as logging in, along with the round trips and bytes of the requests made while it runs.
+
+        Tracking follows the current thread or asyncio task, calls may be nested.
+        :param name: the name the call is recorded under
+        :return: a context manager that records the call when it exits
+        """
+
+        scope = [0, 0, 0]
+        token = self._scopes.set(self._scopes.get() + ((self, scope),))
+        start = perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self._scopes.reset(token)
+            self.__record__(name, perf_counter() - start, scope[1], scope[2], failed, scope[0])
+
+    def snapshot(self) -> dict:
+        """
+        Return the recorded metrics.
+        :return: a dictionary containing the time the metrics were reset, the number of seconds since then, and the
+        metrics of each operation: its call count, errors, round trips, bytes, calls per second and latency
+        percentiles in milliseconds
+        """
+
+        with self._lock:
+            elapsed = perf_counter() - self._started
+            ops = {}
+            for name, op in self._ops.items():
+                latency: LatencyHistogram = op["latency"]
+                ops[name] = {**{key: value for key, value in op.items() if key != "latency"},
+                             "per_second": op["count"] / elapsed if elapsed else 0.0,
+                             "latency_ms": {"p50": latency.percentile(50) * 1000,
+                                            "p95": latency.percentile(95) * 1000,
+                                            "p99": latency.percentile(99) * 1000,
+                                            "mean": latency.total / latency.count * 1000,
+                                            "max": latency.max * 1000}}
+            return {"since": self._since, "elapsed_s": elapsed, "operations": ops}
+
+    def reset(self):
+        """Discard the recorded metrics."""
+
+        with self._lock:
+            self._ops = {}
+            self._since = time()
+            self._started = perf_counter()
+
+    def dump(self, path: str = None):
+        """
+        Append a snapshot to a local file as a single JSON line.
+        :param path: optional, the path of the file, self.dump_path is used if it is not given
+        """
+
+        with open(path or self.dump_path, "a") as dump_f:
+            dump_f.write(json.dumps({"time": time(), **self.snapshot()}) + "\n")
+
+    def __run__(self):
+        """Dump a snapshot every self.dump_interval seconds, and once more when stopped."""
+
+        while not self._stopped.wait(self.dump_interval):
+            self.dump()
+        self.dump()
+
+    def start(self):
+        """Start dumping snapshots to self.dump_path in a background thread."""
+
+        if self._dumper is None and self.dump_path is not None:
+            self._dumper = Thread(target=self.__run__, name="Metrics", daemon=True)
+            self._dumper.start()
+
+    def close(self):
+        """Stop dumping snapshots, after dumping a final one."""
+
+        self._stopped.set()
+        if self._dumper is not None:
+            self._dumper.join()
+            self._dumper = None
+
+
+class ServerMetrics(Metrics):
+    """
+    Metrics recorded by a database server: besides the call counts and latency histograms of each operation, the
+    number of requests in flight, the recent request rate, database errors by type and the time spent waiting for the
+    database's write lock.
+
+    The metrics are rendered in the Prometheus text exposition format by exposition(), for scraping over HTTP.
+    """
+
+    RATE_WINDOW: int = 10
+    BUCKET_BOUNDS: tuple = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                            2.5, 5.0, 10.0)
+    PREFIX: str = "smartscheduler"
+
+    def __init__(self):
+        """Initialise empty metrics, they are never dumped to a file."""
+
+        super().__init__()
+        self.in_flight: int = 0
+        self._errors: dict = {}
+        self._lock_wait: LatencyHistogram = LatencyHistogram()
+        self._rate_counts: list = [0] * (self.RATE_WINDOW + 1)
+        self._rate_seconds: list = [0] * (self.RATE_WINDOW + 1)
+
+    def start_request(self) -> float:
+        """
+        Count a request as in flight.
+        :return: the perf_counter() time the request started, to be passed to finish_request()
+        """
+
+        with self._lock:
+            self.in_flight += 1
+        return perf_counter()
+
+    def finish_request(self, name: str, start: float, failed: bool):
+        """
+        Record a request that is no longer in flight.
+        :param name: the name the request is recorded under, see Metrics.request_name()
+        :param start: the time returned by start_request()
+        :param failed: true if the request failed
+        """
+
+        self.__record__(name, perf_counter() - start, 0, 0, failed, 1)
+        second = int(monotonic())
+        slot = second % len(self._rate_counts)
+        with self._lock:
+            self.in_flight -= 1
+            if self._rate_seconds[slot] != second:
+                self._rate_seconds[slot] = second
+                self._rate_counts[slot] = 0
+            self._rate_counts[slot] += 1
+
+    def record_error(self, error: Exception):
+        """
+        Count a database error by its type.
+        :param error: the exception raised by the database
+        """
+
+        with self._lock:
+            self._errors[type(error).__name__] = self._errors.get(type(error).__name__, 0) + 1
+
+    def record_lock_wait(self, wait: float):
+        """
+        Record the time spent waiting for the database's write lock.
+        :param wait: the number of seconds waited
+        """
+
+        with self._lock:
+            self._lock_wait.record(wait)
+
+    def requests_per_second(self) -> float:
+        """
+        Return the request rate over the last RATE_WINDOW complete seconds.
+        :return: the number of requests per second
+        """
+
+        now = int(monotonic())
+        with self._lock:
+            count = sum(count for second, count in zip(self._rate_seconds, self._rate_counts)
+                        if now - self.RATE_WINDOW <= second < now)
+        return count / self.RATE_WINDOW
+
+    @staticmethod
+    def __label__(value: str) -> str:
+        """
+        Escape a label value for the exposition format.
+        :param value: the label value
+        :return: the value, with backslashes, double quotes and line feeds escaped
+        """
+
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def __histogram_lines__(self, name: str, histogram: LatencyHistogram, labels: str = "") -> list:
+        """
+        Render a latency histogram as the sample lines of a Prometheus histogram.
+        :param name: the metric's name
+        :param histogram: the histogram
+        :param labels: optional, the labels shared by every sample, e.g. 'op="account.get",'
+        :return: a list of sample lines
+        """
+
+        lines = [f'{name}_bucket{{{labels}le="{bound}"}} {count}'
+                 for bound, count in zip(self.BUCKET_BOUNDS, histogram.cumulative_counts(self.BUCKET_BOUNDS))]
+        lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {histogram.count}')
+        sample_labels = f"{{{labels.rstrip(',')}}}" if labels else ""
+        lines.append(f"{name}_sum{sample_labels} {histogram.total}")
+        lines.append(f"{name}_count{sample_labels} {histogram.count}")
+        return lines
+
+    def exposition(self, gauges: dict = None) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format (version 0.0.4).
+        :param gauges: optional, additional metrics to render, a dictionary where the keys are the metrics' names
+        without PREFIX and the values are (type, help, value) tuples, where the value is a number or a dictionary
+        mapping label strings such as 'state="idle"' to numbers
+        :return: the exposition text
+        """
+
+        def family(name: str, metric_type: str, help_text: str) -> list:
+            return [f"# HELP {self.PREFIX}_{name} {help_text}", f"# TYPE {self.PREFIX}_{name} {metric_type}"]
+
+        with self._lock:
+            errors = dict(self._errors)
+            in_flight = self.in_flight
+            uptime = perf_counter() - self._started
+            lines = family("requests_total", "counter", "Requests executed, by operation.")
+            lines += [f'{self.PREFIX}_requests_total{{op="{self.__label__(name)}"}} {op["count"]}'
+                      for name, op in self._ops.items()]
+            lines += family("request_failures_total", "counter", "Requests that failed, by operation.")
+            lines += [f'{self.PREFIX}_request_failures_total{{op="{self.__label__(name)}"}} {op["errors"]}'
+                      for name, op in self._ops.items()]
+            lines += family("request_duration_seconds", "histogram", "Request latency, by operation.")
+            for name, op in self._ops.items():
+                lines += self.__histogram_lines__(f"{self.PREFIX}_request_duration_seconds", op["latency"],
+                                                  f'op="{self.__label__(name)}",')
+            lines += family("lock_wait_seconds", "histogram", "Time spent waiting for the database write lock.")
+            lines += self.__histogram_lines__(f"{self.PREFIX}_lock_wait_seconds", self._lock_wait)
+        lines += family("requests_per_second", "gauge", f"Request rate over the last {self.RATE_WINDOW} seconds.")
+        lines.append(f"{self.PREFIX}_requests_per_second {self.requests_per_second()}")
+        lines += family("requests_in_flight", "gauge", "Requests being executed.")
+        lines.append(f"{self.PREFIX}_requests_in_flight {in_flight}")
+        lines += family("db_errors_total", "counter", "Database errors, by type.")
+        lines += [f'{self.PREFIX}_db_errors_total{{type="{self.__label__(error)}"}} {count}'
+                  for error, count in errors.items()]
+        lines += family("uptime_seconds", "gauge", "Seconds since the metrics were reset.")
+        lines.append(f"{self.PREFIX}_uptime_seconds {uptime}")
+        for name, (metric_type, help_text, value) in (gauges or {}).items():
+            lines += family(name, metric_type, help_text)
+            if type(value) is dict:
+                lines += [f"{self.PREFIX}_{name}{{{labels}}} {sample}" for labels, sample in value.items()]
+            else:
+                lines.append(f"{self.PREFIX}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Discard the recorded metrics, requests in flight are still counted."""
+
+        super().reset()
+        with self._lock:
+            self._errors = {}
+            self._lock_wait = LatencyHistogram()
+
+
+if __name__ == "__main__":
+    # for quick testing
+
+    pass
@@ -0,0 +1,168 @@
+from random import uniform
+from threading import Lock
+from time import monotonic
+
+
+__all__ = ["RetryPolicy", "CircuitBreaker"]
+
+
+class RetryPolicy:
+    """
+    Bounded retries with jittered exponential backoff.
+
+    Only idempotent requests (reads) should be retried, since a write whose response was lost may already have been
+    applied by the server.
+    """
+
+    DEF_MAX_RETRIES: int = 2
+    DEF_BASE_DELAY: float = 0.1
+    DEF_MAX_DELAY: float = 2.0
+
+    def __init__(self, max_retries: int = DEF_MAX_RETRIES, base_delay: float = DEF_BASE_DELAY,
+                 max_delay: float = DEF_MAX_DELAY):
+        """
+        Initialise the retry policy.
+        :param max_retries: optional, the maximum number of times a failed request is retried
+        :param base_delay: optional, the upper bound in seconds of the delay before the first retry
+        :param max_delay: optional, the upper bound in seconds of the delay before any retry
+        """
+
+        self.max_retries: int = max_retries
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self.retries: int = 0
+        self.giveups: int = 0
+        self._lock: Lock = Lock()
+
+    def delay(self, attempt: int) -> float or None:
+        """
+        Return the delay before retrying a request that failed, using "full jitter" so that clients which failed
+        together do not retry together.
+        :param attempt: the number of times the request has already been retried
+        :return: the number of seconds to wait before retrying, or None if the request should not be retried
+        """
+
+        if attempt >= self.max_retries:
+            return None
+        return uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def record_retry(self):
+        """Count a retried request."""
+
+        with self._lock:
+            self.retries += 1
+
+    def record_giveup(self):
+        """Count a request that failed after it was retried, or that could not be retried."""
+
+        with self._lock:
+            self.giveups += 1
+
+    def stats(self) -> dict:
+        """
+        Return the retry counters.
+        :return: a dictionary containing the number of retries and of requests that were given up on
+        """
+
+        return {"retries": self.retries, "retry_giveups": self.giveups}
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker that fails requests fast while the server is down.
+
+    After failure_threshold consecutive failures the circuit opens, and requests are refused without being sent. Once
+    reset_timeout seconds have passed a single trial request is let through (half open): the circuit closes again if it
+    succeeds, and reopens if it fails.
+    """
+
+    CLOSED: str = "closed"
+    OPEN: str = "open"
+    HALF_OPEN: str = "half_open"
+    DEF_FAILURE_THRESHOLD: int = 5
+    DEF_RESET_TIMEOUT: float = 10.0
+
+    def __init__(self, failure_threshold: int = DEF_FAILURE_THRESHOLD, reset_timeout: float = DEF_RESET_TIMEOUT):
+        """
+        Initialise a closed circuit breaker.
+        :param failure_threshold: optional, the number of consecutive failures that opens the circuit
+        :param reset_timeout: optional, the number of seconds the circuit stays open before a trial request is allowed
+        """
+
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.failures: int = 0
+        self.times_opened: int = 0
+        self._state: str = self.CLOSED
+        self._opened_at: float = 0.0
+        self._lock: Lock = Lock()
+
+    @property
+    def state(self) -> str:
+        """
+        Return the state of the circuit, an open circuit is reported as half open once reset_timeout has passed.
+        :return: one of CLOSED, OPEN or HALF_OPEN
+        """
+
+        if self._state == self.OPEN and monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    @property
+    def retry_after(self) -> float:
+        """
+        Return the number of seconds until an open circuit allows a trial request.
+        :return: the number of seconds, 0 if the circuit is not open
+        """
+
+        if self._state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        """
+        Check if a request may be sent, letting a single trial request through once an open circuit is half open.
+        :return: a boolean to confirm if the request may be sent
+        """
+
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        """Record a request that reached the server, closing the circuit."""
+
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        """Record a request that could not reach the server, opening the circuit if it is half open or too many
+        consecutive requests have failed."""
+
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = monotonic()
+
+    def stats(self) -> dict:
+        """
+        Return the circuit breaker's state and counters.
+        :return: a dictionary containing the state, the number of consecutive failures and the number of times the
+        circuit was opened
+        """
+
+        return {"breaker_state": self.state, "consecutive_failures": self.failures, "breaker_opened": self.times_opened}
+
+
+if __name__ == "__main__":
+    # for quick testing
+
+    pass
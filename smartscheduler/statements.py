@@ -0,0 +1,308 @@
+import json
+from ast import literal_eval
+from functools import lru_cache
+from typing import NamedTuple
+
+
+__all__ = ["Schema", "Op", "Statement", "STATEMENTS", "SQL_FUNCTIONS", "SCHEMA_VERSION", "MIGRATIONS",
+           "REBUILD_NORMALIZED", "NORMALIZE_TRIGGERS", "resolve", "access"]
+
+
+class Schema:
+    """
+    The names of the tables and columns of the Smart Scheduler database.
+
+    An account's schedule and registered subjects are stored as the string representations of dictionaries, which is
+    what clients read and write. Triggers on the accounts table keep a normalized copy of both in the registrations and
+    classes tables, one row per registered subject and per class, so that accounts can be looked up by subject or by
+    class time through an index. Writes to the accounts table therefore also change the tables in DERIVED_TABLES.
+
+    The normalized tables are created, and filled from the existing accounts, by the server when it first opens a
+    database older than SCHEMA_VERSION (see MIGRATIONS). The triggers are temporary triggers the server creates on each
+    of its own connections (see NORMALIZE_TRIGGERS), so only the server's writes keep the normalized tables up to date.
+    Writes made by any other connection leave them stale until the server next opens the database, when it rebuilds
+    them from the accounts table (see REBUILD_NORMALIZED). Nothing but the server may write to the accounts table of a
+    database the server has open.
+    """
+
+    TAB_ACCOUNTS = "Accounts"
+    COL_STU_ID = "Student_ID"
+    COL_PSWRD_HASH = "Pswrd_hash"
+    COL_SCHEDULE = "Schedule"
+    COL_SUBJECTS = "Reg_subjects"
+    COL_SESSION_ID = "Session_ID"
+    TAB_SUB_INFO = "Subjects"
+    COL_SUB_CODE = "Subject_code"
+    COL_SUB_NAME = "Subject_name"
+    TAB_REGISTRATIONS = "Registrations"
+    COL_CLASS_TYPE = "Class_type"
+    COL_CLASS_LINK = "Class_link"
+    TAB_CLASSES = "Classes"
+    COL_DAY = "Day"
+    COL_START = "Start_time"
+    COL_END = "End_time"
+    DERIVED_TABLES = {TAB_ACCOUNTS: (TAB_REGISTRATIONS, TAB_CLASSES)}
+
+
+class Op(NamedTuple):
+    """
+    A reference to a named operation in the statement registry, sent to the server instead of the SQL text.
+
+    Operations on one of several columns take the column's name, which the server checks against the names the
+    operation allows before substituting it into the statement.
+    """
+
+    op_id: str
+    name: str = None
+
+
+class Statement(NamedTuple):
+    """
+    A statement in the registry, along with how it accesses the database, so that the server can cache results and
+    invalidate them without parsing the SQL.
+
+    The tables of a read are those its result is read from, and a read without tables, such as one of the schema or of
+    the connection's state, is never cached. The tables of a write are those it changes. Creating a table changes no
+    table whose results can have been cached.
+    """
+
+    cmd: str
+    names: tuple = None
+    read_only: bool = True
+    tables: tuple = ()
+
+
+def _registration_rows(reg_subjects: str or None) -> str:
+    """
+    Decode an account's registered subjects into registrations table rows, skipping malformed registrations.
+    :param reg_subjects: the string representation of the registered subjects dictionary
+    :return: a JSON array of [subject code, class type, class link] arrays
+    """
+
+    try:
+        reg_subs = literal_eval(reg_subjects or "{}")
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return "[]"
+    if type(reg_subs) is not dict:
+        return "[]"
+    return json.dumps([[*str(reg_code).split("_"), str(link)] for reg_code, link in reg_subs.items()
+                       if str(reg_code).count("_") == 1])
+
+
+def _class_rows(schedule: str or None) -> str:
+    """
+    Decode an account's schedule into classes table rows, skipping malformed class IDs.
+    :param schedule: the string representation of the schedule dictionary
+    :return: a JSON array of [subject code, class type, day, start time, end time] arrays
+    """
+
+    try:
+        sch = literal_eval(schedule or "{}")
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return "[]"
+    if type(sch) is not dict:
+        return "[]"
+    return json.dumps([str(class_id).split("_") for classes in sch.values() if type(classes) is list
+                       for class_id in classes if str(class_id).count("_") == 4])
+
+
+# function name -> (number of arguments, function), registered on every server connection since the triggers call them
+SQL_FUNCTIONS: dict = {
+    "registration_rows": (1, _registration_rows),
+    "class_rows": (1, _class_rows),
+}
+
+_INFO_COLS = (Schema.COL_PSWRD_HASH, Schema.COL_SCHEDULE, Schema.COL_SUBJECTS, Schema.COL_SESSION_ID)
+_ACCOUNT_COLS = f"{Schema.COL_STU_ID}, {Schema.COL_PSWRD_HASH}, {Schema.COL_SCHEDULE}, {Schema.COL_SUBJECTS}, " \
+                f"{Schema.COL_SESSION_ID}"
+_REG_COLS = f"{Schema.COL_STU_ID}, {Schema.COL_SUB_CODE}, {Schema.COL_CLASS_TYPE}, {Schema.COL_CLASS_LINK}"
+_CLASS_COLS = f"{Schema.COL_STU_ID}, {Schema.COL_SUB_CODE}, {Schema.COL_CLASS_TYPE}, {Schema.COL_DAY}, " \
+              f"{Schema.COL_START}, {Schema.COL_END}"
+
+
+def _insert_rows(rows: tuple, stu_id: str, blob: str, from_clause: str = "") -> str:
+    """
+    Build the statement that inserts the normalized rows decoded from an account's schedule or registered subjects.
+    :param rows: a (table, columns, decoding function, blob column) tuple
+    :param stu_id: the expression of the account's student ID
+    :param blob: the expression of the account's string representation
+    :param from_clause: optional, the tables the expressions are selected from, followed by a comma
+    :return: the SQL statement
+    """
+
+    table, cols, func, _ = rows
+    values = ", ".join(f"json_extract(value, '$[{i}]')" for i in range(cols.count(",")))
+    return f"INSERT INTO {table} ({cols}) SELECT {stu_id}, {values} FROM {from_clause}json_each({func}({blob}))"
+
+
+def _migrate_rows(rows: tuple) -> str:
+    """
+    Build the statement that migrates every account's string representation to normalized rows.
+    :param rows: a (table, columns, decoding function, blob column) tuple
+    :return: the SQL statement
+    """
+
+    return _insert_rows(rows, f"{Schema.TAB_ACCOUNTS}.{Schema.COL_STU_ID}", f"{Schema.TAB_ACCOUNTS}.{rows[3]}",
+                        f"{Schema.TAB_ACCOUNTS}, ")
+
+
+def _normalize_trigger(name: str, event: str, rows: tuple, key_row: str = "OLD") -> str:
+    """
+    Build a temporary trigger on the accounts table that replaces an account's normalized rows.
+    :param name: the trigger's name
+    :param event: the event the trigger fires after
+    :param rows: the (table, columns, decoding function, blob column) tuples of the rows to replace
+    :param key_row: optional, the trigger row whose student ID the rows are deleted by
+    :return: the SQL statement, an update trigger only fires if the string representation changed, so that it is not
+    decoded again for nothing
+    """
+
+    body = [f"DELETE FROM {table} WHERE {Schema.COL_STU_ID}={key_row}.{Schema.COL_STU_ID};" for table, *_ in rows]
+    if event != "DELETE":
+        body += [_insert_rows(rows_, f"NEW.{Schema.COL_STU_ID}", f"NEW.{rows_[3]}") + ";" for rows_ in rows]
+    when = ""
+    if event.startswith("UPDATE"):
+        when = "WHEN " + " OR ".join(f"OLD.{rows_[3]} IS NOT NEW.{rows_[3]}" for rows_ in rows) + " "
+    return f"CREATE TEMP TRIGGER IF NOT EXISTS {name} AFTER {event} ON main.{Schema.TAB_ACCOUNTS} " \
+           f"{when}BEGIN {' '.join(body)} END"
+
+
+_REG_ROWS = (Schema.TAB_REGISTRATIONS, _REG_COLS, "registration_rows", Schema.COL_SUBJECTS)
+_CLASS_ROWS = (Schema.TAB_CLASSES, _CLASS_COLS, "class_rows", Schema.COL_SCHEDULE)
+
+# operation ID -> Statement, whose names are those allowed for {name}, or None if the statement takes no name
+STATEMENTS: dict = {
+    "accounts.create": Statement(f"CREATE TABLE IF NOT EXISTS {Schema.TAB_ACCOUNTS} ({Schema.COL_STU_ID} text NOT NULL "
+                                 f"PRIMARY KEY, {Schema.COL_PSWRD_HASH} text, {Schema.COL_SCHEDULE} text, "
+                                 f"{Schema.COL_SUBJECTS} text, {Schema.COL_SESSION_ID} text)", read_only=False),
+    "subjects.create": Statement(f"CREATE TABLE IF NOT EXISTS {Schema.TAB_SUB_INFO} ({Schema.COL_SUB_CODE} text NOT "
+                                 f"NULL PRIMARY KEY, {Schema.COL_SUB_NAME} text)", read_only=False),
+    "schema.tables": Statement("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"),
+    "schema.columns": Statement("SELECT name FROM pragma_table_info(?) ORDER BY cid"),
+    "accounts.all": Statement(f"SELECT * FROM {Schema.TAB_ACCOUNTS}", tables=(Schema.TAB_ACCOUNTS,)),
+    "subjects.all": Statement(f"SELECT * FROM {Schema.TAB_SUB_INFO}", tables=(Schema.TAB_SUB_INFO,)),
+    "accounts.page": Statement(f"SELECT * FROM {Schema.TAB_ACCOUNTS} WHERE {Schema.COL_STU_ID}>? "
+                               f"ORDER BY {Schema.COL_STU_ID} LIMIT ?", tables=(Schema.TAB_ACCOUNTS,)),
+    "subjects.page": Statement(f"SELECT * FROM {Schema.TAB_SUB_INFO} WHERE {Schema.COL_SUB_CODE}>? "
+                               f"ORDER BY {Schema.COL_SUB_CODE} LIMIT ?", tables=(Schema.TAB_SUB_INFO,)),
+    "subjects.upsert": Statement(f"INSERT OR REPLACE INTO {Schema.TAB_SUB_INFO} ({Schema.COL_SUB_CODE}, "
+                                 f"{Schema.COL_SUB_NAME}) VALUES (?, ?)", None, False, (Schema.TAB_SUB_INFO,)),
+    "account.get": Statement(f"SELECT {_ACCOUNT_COLS} FROM {Schema.TAB_ACCOUNTS} WHERE {Schema.COL_STU_ID}=?",
+                             tables=(Schema.TAB_ACCOUNTS,)),
+    "account.get_col": Statement(f"SELECT {{name}} FROM {Schema.TAB_ACCOUNTS} WHERE {Schema.COL_STU_ID}=?",
+                                 (Schema.COL_STU_ID, *_INFO_COLS), tables=(Schema.TAB_ACCOUNTS,)),
+    "account.set_col": Statement(f"UPDATE {Schema.TAB_ACCOUNTS} SET {{name}}=? WHERE {Schema.COL_STU_ID}=?",
+                                 _INFO_COLS, False, (Schema.TAB_ACCOUNTS,)),
+    "account.set_col_session": Statement(f"UPDATE {Schema.TAB_ACCOUNTS} SET {{name}}=? "
+                                         f"WHERE {Schema.COL_STU_ID}=? AND {Schema.COL_SESSION_ID}=?",
+                                         _INFO_COLS, False, (Schema.TAB_ACCOUNTS,)),
+    "account.replace_col_session": Statement(f"UPDATE {Schema.TAB_ACCOUNTS} SET {{name}}=? WHERE "
+                                             f"{Schema.COL_STU_ID}=? AND {Schema.COL_SESSION_ID}=? AND {{name}}=?",
+                                             _INFO_COLS, False, (Schema.TAB_ACCOUNTS,)),
+    "account.new": Statement(f"INSERT INTO {Schema.TAB_ACCOUNTS} VALUES (?, ?, ?, ?, ?)", None, False,
+                             (Schema.TAB_ACCOUNTS,)),
+    "account.delete": Statement(f"DELETE FROM {Schema.TAB_ACCOUNTS} WHERE {Schema.COL_STU_ID}=?", None, False,
+                                (Schema.TAB_ACCOUNTS,)),
+    "account.delete_session": Statement(f"DELETE FROM {Schema.TAB_ACCOUNTS} "
+                                        f"WHERE {Schema.COL_STU_ID}=? AND {Schema.COL_SESSION_ID}=?", None, False,
+                                        (Schema.TAB_ACCOUNTS,)),
+    "registrations.subject": Statement(f"SELECT {Schema.COL_STU_ID}, {Schema.COL_CLASS_TYPE} "
+                                       f"FROM {Schema.TAB_REGISTRATIONS} WHERE {Schema.COL_SUB_CODE}=? "
+                                       f"ORDER BY {Schema.COL_STU_ID}", tables=(Schema.TAB_REGISTRATIONS,)),
+    "classes.student": Statement(f"SELECT {_CLASS_COLS} FROM {Schema.TAB_CLASSES} WHERE {Schema.COL_STU_ID}=? "
+                                 f"ORDER BY {Schema.COL_START}", tables=(Schema.TAB_CLASSES,)),
+    "classes.at": Statement(f"SELECT {Schema.COL_STU_ID} FROM {Schema.TAB_CLASSES} WHERE {Schema.COL_DAY}=? AND "
+                            f"{Schema.COL_START}=? AND {Schema.COL_SUB_CODE}=? AND {Schema.COL_CLASS_TYPE}=? "
+                            f"ORDER BY {Schema.COL_STU_ID}", tables=(Schema.TAB_CLASSES,)),
+    "changes": Statement("SELECT changes()"),
+}
+
+_NORMALIZE_TRIGGERS = ("Accounts_normalize_insert", "Accounts_normalize_subjects", "Accounts_normalize_schedule",
+                       "Accounts_normalize_delete")
+
+# the server's connections create the triggers in NORMALIZE_TRIGGERS, which only work on a database of this version
+SCHEMA_VERSION: int = 1
+
+# the statements that rebuild the normalized tables from the accounts table, executed in one transaction by the server
+# whenever it opens a database, since the writes of connections without NORMALIZE_TRIGGERS leave them stale
+REBUILD_NORMALIZED: list = [
+    f"DELETE FROM {Schema.TAB_REGISTRATIONS}",
+    f"DELETE FROM {Schema.TAB_CLASSES}",
+    _migrate_rows(_REG_ROWS),
+    _migrate_rows(_CLASS_ROWS),
+]
+
+# schema version -> the statements that migrate a database from the previous version, executed in one transaction
+MIGRATIONS: dict = {
+    1: [
+        STATEMENTS["accounts.create"].cmd,
+        f"CREATE TABLE IF NOT EXISTS {Schema.TAB_REGISTRATIONS} ({Schema.COL_STU_ID} text NOT NULL, "
+        f"{Schema.COL_SUB_CODE} text NOT NULL, {Schema.COL_CLASS_TYPE} text NOT NULL, {Schema.COL_CLASS_LINK} text, "
+        f"PRIMARY KEY ({Schema.COL_STU_ID}, {Schema.COL_SUB_CODE}, {Schema.COL_CLASS_TYPE}))",
+        f"CREATE INDEX IF NOT EXISTS Registrations_subject ON {Schema.TAB_REGISTRATIONS} "
+        f"({Schema.COL_SUB_CODE}, {Schema.COL_CLASS_TYPE})",
+        f"CREATE TABLE IF NOT EXISTS {Schema.TAB_CLASSES} ({Schema.COL_STU_ID} text NOT NULL, {Schema.COL_SUB_CODE} "
+        f"text NOT NULL, {Schema.COL_CLASS_TYPE} text NOT NULL, {Schema.COL_DAY} text NOT NULL, {Schema.COL_START} "
+        f"text NOT NULL, {Schema.COL_END} text NOT NULL)",
+        f"CREATE INDEX IF NOT EXISTS Classes_student ON {Schema.TAB_CLASSES} ({Schema.COL_STU_ID})",
+        f"CREATE INDEX IF NOT EXISTS Classes_subject ON {Schema.TAB_CLASSES} "
+        f"({Schema.COL_SUB_CODE}, {Schema.COL_CLASS_TYPE})",
+        f"CREATE INDEX IF NOT EXISTS Classes_time ON {Schema.TAB_CLASSES} ({Schema.COL_DAY}, {Schema.COL_START})",
+        # triggers stored in the database, rather than created per connection, would fire along with the server's
+        *(f"DROP TRIGGER IF EXISTS main.{name}" for name in _NORMALIZE_TRIGGERS),
+        *REBUILD_NORMALIZED,
+    ],
+}
+
+NORMALIZE_TRIGGERS: list = [
+    _normalize_trigger(_NORMALIZE_TRIGGERS[0], "INSERT", (_REG_ROWS, _CLASS_ROWS), "NEW"),
+    _normalize_trigger(_NORMALIZE_TRIGGERS[1], f"UPDATE OF {Schema.COL_SUBJECTS}", (_REG_ROWS,)),
+    _normalize_trigger(_NORMALIZE_TRIGGERS[2], f"UPDATE OF {Schema.COL_SCHEDULE}", (_CLASS_ROWS,)),
+    _normalize_trigger(_NORMALIZE_TRIGGERS[3], "DELETE", (_REG_ROWS, _CLASS_ROWS)),
+]
+
+
+@lru_cache(maxsize=None)
+def resolve(op_id: str, name: str = None) -> str:
+    """
+    Return the SQL statement of a registered operation, raising ValueError if the operation is not registered or
+    does not allow the given name.
+    :param op_id: the operation's ID
+    :param name: the column name the operation is applied to, if it takes one
+    :return: the SQL statement
+    """
+
+    if op_id not in STATEMENTS:
+        raise ValueError(f"Unknown operation: {op_id}")
+    cmd, names = STATEMENTS[op_id][:2]
+    if names is None:
+        if name is not None:
+            raise ValueError(f"Operation {op_id} does not take a name.")
+        return cmd
+    if name not in names:
+        raise ValueError(f"Operation {op_id} cannot be applied to {name}.")
+    return cmd.format(name=name)
+
+
+@lru_cache(maxsize=None)
+def access(op_id: str) -> tuple:
+    """
+    Return how a registered operation accesses the database, raising ValueError if the operation is not registered. A
+    write also changes the tables derived from the tables it writes (see Schema.DERIVED_TABLES).
+    :param op_id: the operation's ID
+    :return: a tuple containing a boolean that is true if the operation only reads, and a frozenset of the tables it
+    reads from or writes to
+    """
+
+    if op_id not in STATEMENTS:
+        raise ValueError(f"Unknown operation: {op_id}")
+    stmt: Statement = STATEMENTS[op_id]
+    if stmt.read_only:
+        return True, frozenset(stmt.tables)
+    return False, frozenset(stmt.tables).union(*(Schema.DERIVED_TABLES.get(table, ()) for table in stmt.tables))
+
+
+if __name__ == "__main__":
+    # for quick testing
+
+    pass
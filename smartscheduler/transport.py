@@ -0,0 +1,488 @@
+import asyncio
+import gzip
+import requests
+import zlib
+from requests.adapters import HTTPAdapter
+from threading import Lock
+from time import monotonic
+from urllib.parse import parse_qs, urlsplit
+
+from smartscheduler.codec import JSONCodec, codec_for
+from smartscheduler.engine import SQLiteEngine, StorageProfile
+
+
+__all__ = ["TransportBase", "HTTPTransport", "AsyncHTTPTransport", "AsyncHTTPError", "EmbeddedTransport",
+           "AsyncEmbeddedTransport", "transport_for", "async_transport_for"]
+
+
+class TransportBase:
+    """
+    The configuration and payload encoding shared by the threaded and the asyncio transports, without any I/O.
+
+    Request bodies are encoded with the configured codec (JSON by default) and labelled with its Content-Type, and the
+    server answers in the same format.
+
+    Payloads are negotiated for gzip compression: responses are compressed by the server when the request accepts it,
+    and requests of at least compress_threshold bytes are compressed once the server has advertised (with an
+    Accept-Encoding response header) that it accepts compressed requests.
+    """
+
+    DEF_POOL_SIZE: int = 4
+    DEF_KEEP_ALIVE: float = 50.0
+    DEF_CONNECT_TIMEOUT: float = 3.05
+    DEF_READ_TIMEOUT: float = 30.0
+    DEF_COMPRESS_THRESHOLD: int = 1024
+    COMPRESS_LEVEL: int = 6
+    STREAM_CONTENT_TYPE: str = "application/x-ndjson"
+
+    def __init__(self, server: str, pool_size: int = DEF_POOL_SIZE, keep_alive: float = DEF_KEEP_ALIVE,
+                 connect_timeout: float = DEF_CONNECT_TIMEOUT, read_timeout: float = DEF_READ_TIMEOUT,
+                 compress_threshold: int or None = DEF_COMPRESS_THRESHOLD, codec=JSONCodec):
+        """
+        Initialise the transport's configuration.
+        :param server: address of the server that contains the database
+        :param pool_size: optional, the maximum number of persistent connections kept open to the server
+        :param keep_alive: optional, the number of seconds an idle connection is kept before it is recycled
+        :param connect_timeout: optional, the number of seconds to wait while establishing a connection
+        :param read_timeout: optional, the number of seconds to wait for the server to send a response
+        :param compress_threshold: optional, the size in bytes from which requests are compressed, or None to disable
+        compression in both directions
+        :param codec: optional, the codec bodies are encoded with, see smartscheduler.codec
+        """
+
+        self.server: str = server
+        self.pool_size: int = pool_size
+        self.keep_alive: float = keep_alive
+        self.connect_timeout: float = connect_timeout
+        self.read_timeout: float = read_timeout
+        self.compress_threshold: int or None = compress_threshold
+        self.codec = codec
+        self.server_accepts_gzip: bool = False
+
+    def __encode__(self, request_json: dict) -> tuple:
+        """
+        Encode a request body, compressing it if it is large enough and the server accepts compressed requests.
+        :param request_json: the request body
+        :return: a tuple containing the encoded body and its headers as a dictionary
+        """
+
+        body = self.codec.encode(request_json)
+        headers = {"Content-Type": self.codec.CONTENT_TYPE,
+                   "Accept-Encoding": "identity" if self.compress_threshold is None else "gzip"}
+        if self.compress_threshold is not None and self.server_accepts_gzip and len(body) >= self.compress_threshold:
+            body = gzip.compress(body, self.COMPRESS_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+        return body, headers
+
+    def __negotiate__(self, accept_encoding: str or None):
+        """
+        Remember whether the server accepts compressed requests, from the Accept-Encoding header of its response.
+        :param accept_encoding: the value of the response's Accept-Encoding header, if any
+        """
+
+        self.server_accepts_gzip = "gzip" in (accept_encoding or "").lower()
+
+    @staticmethod
+    def __decode__(content_type: str or None, body: bytes) -> dict:
+        """
+        Decode a response body with the codec for its Content-Type.
+
+        Raises ValueError if the content type is not supported or the body is malformed.
+        :param content_type: the value of the response's Content-Type header
+        :param body: the decompressed response body
+        :return: the decoded response body
+        """
+
+        codec = codec_for(content_type)
+        if codec is None:
+            raise ValueError(f"Unsupported response content type: {content_type}")
+        return codec.decode(body)
+
+
+class HTTPTransport(TransportBase):
+    """A pooled HTTP transport that keeps connections to the database server alive across commands."""
+
+    def __init__(self, server: str, pool_size: int = TransportBase.DEF_POOL_SIZE,
+                 keep_alive: float = TransportBase.DEF_KEEP_ALIVE,
+                 connect_timeout: float = TransportBase.DEF_CONNECT_TIMEOUT,
+                 read_timeout: float = TransportBase.DEF_READ_TIMEOUT,
+                 compress_threshold: int or None = TransportBase.DEF_COMPRESS_THRESHOLD, codec=JSONCodec):
+        """
+        Initialise the transport, the connection pool itself is created lazily on the first request.
+        :param server: address of the server that contains the database
+        :param pool_size: optional, the maximum number of persistent connections kept open to the server
+        :param keep_alive: optional, the number of seconds an idle pool is kept before its connections are recycled
+        :param connect_timeout: optional, the number of seconds to wait while establishing a connection
+        :param read_timeout: optional, the number of seconds to wait for the server to send a response
+        :param compress_threshold: optional, the size in bytes from which requests are compressed, or None to disable
+        compression in both directions
+        :param codec: optional, the codec bodies are encoded with, see smartscheduler.codec
+        """
+
+        super().__init__(server, pool_size, keep_alive, connect_timeout, read_timeout, compress_threshold, codec)
+        self._session: requests.Session or None = None
+        self._last_used: float = 0.0
+        self._lock: Lock = Lock()
+
+    def __new_session__(self) -> requests.Session:
+        """
+        Create a session whose adapter pools up to self.pool_size connections to the server.
+        :return: a new requests.Session object
+        """
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        Return the pooled session, recycling it first if it has been idle for longer than self.keep_alive seconds.
+
+        Recycling idle pools avoids reusing connections that the server (or a proxy in between) has already dropped.
+        :return: the pooled requests.Session object
+        """
+
+        with self._lock:
+            now = monotonic()
+            if self._session is not None and now - self._last_used > self.keep_alive:
+                self._session.close()
+                self._session = None
+            if self._session is None:
+                self._session = self.__new_session__()
+            self._last_used = now
+            return self._session
+
+    def post(self, request_json: dict, sizes: dict = None) -> dict:
+        """
+        Send a request to the server over a pooled connection, compressed responses are decompressed by requests.
+
+        Raises requests.ConnectionError, requests.Timeout or requests.HTTPError if the request fails.
+        :param request_json: the request body
+        :param sizes: optional, a dictionary whose "sent" and "received" byte counts are increased by the size of the
+        request and response bodies, as sent over the wire
+        :return: the decoded response body
+        """
+
+        body, headers = self.__encode__(request_json)
+        server_resp: requests.Response = self.session.post(self.server, data=body, headers=headers,
+                                                           timeout=(self.connect_timeout, self.read_timeout))
+        if sizes is not None:
+            sizes["sent"] += len(body)
+            sizes["received"] += int(server_resp.headers.get("Content-Length", len(server_resp.content)))
+        server_resp.raise_for_status()
+        self.__negotiate__(server_resp.headers.get("Accept-Encoding"))
+        return self.__decode__(server_resp.headers.get("Content-Type"), server_resp.content)
+
+    def stream(self, request_json: dict):
+        """
+        Send a request for a streamed response to the server over a pooled connection, and decode the response one
+        line at a time as it arrives. The connection stays borrowed until the generator is exhausted or closed.
+
+        Raises requests.ConnectionError, requests.Timeout or requests.HTTPError if the request fails.
+        :param request_json: the request body
+        :return: a generator that yields each decoded line of a newline delimited JSON response, or the decoded
+        response body if the server did not stream it
+        """
+
+        body, headers = self.__encode__(request_json)
+        headers["Accept"] = f"{self.STREAM_CONTENT_TYPE}, {self.codec.CONTENT_TYPE}"
+        with self.session.post(self.server, data=body, headers=headers, stream=True,
+                               timeout=(self.connect_timeout, self.read_timeout)) as server_resp:
+            server_resp.raise_for_status()
+            self.__negotiate__(server_resp.headers.get("Accept-Encoding"))
+            content_type = server_resp.headers.get("Content-Type")
+            if (content_type or "").split(";")[0].strip().lower() != self.STREAM_CONTENT_TYPE:
+                yield self.__decode__(content_type, server_resp.content)
+                return
+            for line in server_resp.iter_lines():
+                if line:
+                    yield JSONCodec.decode(line)
+
+    def close(self):
+        """Close all pooled connections."""
+
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+class AsyncHTTPError(Exception):
+    """Raised by AsyncHTTPTransport when the server responds with an error status code."""
+
+    def __init__(self, message: str, status: int):
+        self.status = status
+        super().__init__(message)
+
+
+class AsyncHTTPTransport(TransportBase):
+    """
+    An asyncio HTTP/1.1 transport that multiplexes requests over a bounded pool of keep-alive connections.
+
+    Any number of coroutines may call post() concurrently, at most pool_size requests are in flight at once and the
+    rest wait for a connection to be returned to the pool.
+    """
+
+    def __init__(self, server: str, pool_size: int = TransportBase.DEF_POOL_SIZE,
+                 keep_alive: float = TransportBase.DEF_KEEP_ALIVE,
+                 connect_timeout: float = TransportBase.DEF_CONNECT_TIMEOUT,
+                 read_timeout: float = TransportBase.DEF_READ_TIMEOUT,
+                 compress_threshold: int or None = TransportBase.DEF_COMPRESS_THRESHOLD, codec=JSONCodec):
+        """
+        Initialise the transport, connections are opened lazily as requests are made.
+        :param server: address of the server that contains the database
+        :param pool_size: optional, the maximum number of connections (and so concurrent requests) to the server
+        :param keep_alive: optional, the number of seconds an idle connection is kept before it is closed
+        :param connect_timeout: optional, the number of seconds to wait while establishing a connection
+        :param read_timeout: optional, the number of seconds to wait for the server to send a response
+        :param compress_threshold: optional, the size in bytes from which requests are compressed, or None to disable
+        compression in both directions
+        :param codec: optional, the codec bodies are encoded with, see smartscheduler.codec
+        """
+
+        super().__init__(server, pool_size, keep_alive, connect_timeout, read_timeout, compress_threshold, codec)
+        url = urlsplit(server)
+        self._host: str = url.hostname
+        self._port: int = url.port or (443 if url.scheme == "https" else 80)
+        self._ssl: bool = url.scheme == "https"
+        self._path: str = url.path or "/"
+        self._idle: list = []
+        self._slots: asyncio.Semaphore or None = None
+
+    async def __connect__(self) -> tuple:
+        """
+        Borrow an idle connection from the pool, or open a new one if none are usable.
+        :return: a tuple containing the connection's StreamReader and StreamWriter, and whether it was reused
+        """
+
+        while self._idle:
+            reader, writer, last_used = self._idle.pop()
+            if monotonic() - last_used <= self.keep_alive and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self._host, self._port, ssl=self._ssl),
+                                                self.connect_timeout)
+        return reader, writer, False
+
+    @staticmethod
+    async def __read_response__(reader: asyncio.StreamReader) -> tuple:
+        """
+        Read a HTTP response from a connection.
+        :param reader: the connection's StreamReader
+        :return: a tuple containing the status code, the headers as a dictionary with lower case keys, and the body
+        """
+
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        if "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                chunk_len = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await reader.readexactly(chunk_len + 2)
+                if chunk_len == 0:
+                    break
+                body += chunk[:-2]
+        else:
+            body = await reader.read()
+            headers["connection"] = "close"
+        return status, headers, body
+
+    async def __round_trip__(self, request: bytes) -> tuple:
+        """
+        Send a raw HTTP request over a pooled connection and read the response.
+
+        If a reused connection turns out to have been closed by the server, the request is retried once on a new one.
+        :param request: the raw HTTP request
+        :return: a tuple containing the status code, the headers and the body of the response
+        """
+
+        while True:
+            reader, writer, reused = await self.__connect__()
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, headers, body = await asyncio.wait_for(self.__read_response__(reader), self.read_timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if headers.get("connection", "").lower() == "close":
+                writer.close()
+            else:
+                self._idle.append((reader, writer, monotonic()))
+            return status, headers, body
+
+    async def post(self, request_json: dict, sizes: dict = None) -> dict:
+        """
+        Send a request to the server over a pooled connection.
+
+        Raises OSError, asyncio.TimeoutError or AsyncHTTPError if the request fails, or ValueError if the response
+        cannot be decompressed or decoded.
+        :param request_json: the request body
+        :param sizes: optional, a dictionary whose "sent" and "received" byte counts are increased by the size of the
+        request and response bodies, as sent over the wire
+        :return: the decoded response body
+        """
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        body, headers = self.__encode__(request_json)
+        headers.update({"Host": f"{self._host}:{self._port}", "Content-Length": str(len(body)),
+                        "Connection": "keep-alive"})
+        request = (f"POST {self._path} HTTP/1.1\r\n" + "".join(f"{key}: {value}\r\n" for key, value in headers.items())
+                   + "\r\n").encode("latin-1") + body
+        async with self._slots:
+            status, resp_headers, resp_body = await self.__round_trip__(request)
+        if sizes is not None:
+            sizes["sent"] += len(body)
+            sizes["received"] += len(resp_body)
+        if status >= 400:
+            raise AsyncHTTPError(f"{status} Error for url: {self.server}", status)
+        self.__negotiate__(resp_headers.get("accept-encoding"))
+        if resp_headers.get("content-encoding", "").lower() == "gzip":
+            try:
+                resp_body = gzip.decompress(resp_body)
+            except (OSError, EOFError, zlib.error) as e:
+                # gzip.BadGzipFile is an OSError, which callers take for a connection failure
+                raise ValueError(f"Corrupt compressed response: {e}")
+        return self.__decode__(resp_headers.get("content-type"), resp_body)
+
+    async def close(self):
+        """Close all pooled connections."""
+
+        while self._idle:
+            _, writer, _ = self._idle.pop()
+            writer.close()
+
+
+class EmbeddedTransport:
+    """
+    A transport that executes requests in process with a SQLiteEngine, against a local database file, instead of
+    sending them to a server. Nothing is encoded or sent over the network, so it has no timeouts or compression.
+
+    It is selected by a server address of the form "sqlite:///path/to/database.db", optionally followed by
+    "?subjects=path/to/subjects.csv" to sync the list of available subjects from a local CSV file.
+    """
+
+    SCHEME: str = "sqlite"
+
+    def __init__(self, path: str, subjects_file: str = None, pool_size: int = TransportBase.DEF_POOL_SIZE,
+                 profile: StorageProfile = None):
+        """
+        Initialise the transport.
+        :param path: the path of the database file
+        :param subjects_file: optional, the path of the CSV file the list of available subjects is synced from
+        :param pool_size: optional, the maximum number of requests executed at once, and of connections kept open to
+        the database file
+        :param profile: optional, the storage profile applied to the database file's connections
+        """
+
+        self.server: str = f"{self.SCHEME}:///{path}"
+        self.pool_size: int = pool_size
+        self.engine: SQLiteEngine = SQLiteEngine(path, subjects_file, pool_size, profile)
+
+    @classmethod
+    def from_url(cls, server: str, **kwargs):
+        """
+        Create a transport from a "sqlite:///" server address.
+        :param server: the server address
+        :param kwargs: any other arguments of the transport's constructor
+        :return: the new transport
+        """
+
+        url = urlsplit(server)
+        subjects_file = parse_qs(url.query).get("subjects", [None])[0]
+        return cls(url.path[1:], subjects_file, **kwargs)
+
+    def post(self, request_json: dict, sizes: dict = None) -> dict:
+        """
+        Execute a request.
+        :param request_json: the request body
+        :param sizes: optional, left as it is since no bytes are sent or received
+        :return: the response body
+        """
+
+        return self.engine.execute(request_json)
+
+    def stream(self, request_json: dict):
+        """
+        Execute a query and return its rows as they are read, see HTTPTransport.stream().
+        :param request_json: the request body
+        :return: a generator that yields each row, followed by the trailer dictionary
+        """
+
+        for rows in self.engine.stream(request_json):
+            if type(rows) is dict:
+                yield rows
+            else:
+                yield from rows
+
+    def close(self):
+        """Close the engine's connections to the database file."""
+
+        self.engine.close()
+
+
+class AsyncEmbeddedTransport(EmbeddedTransport):
+    """The asyncio counterpart of EmbeddedTransport, requests are executed in the event loop's default executor."""
+
+    async def post(self, request_json: dict, sizes: dict = None) -> dict:
+        """
+        Execute a request without blocking the event loop.
+        :param request_json: the request body
+        :param sizes: optional, left as it is since no bytes are sent or received
+        :return: the response body
+        """
+
+        return await asyncio.get_running_loop().run_in_executor(None, self.engine.execute, request_json)
+
+    async def close(self):
+        """Close the engine's connections to the database file."""
+
+        self.engine.close()
+
+
+def transport_for(server: str) -> HTTPTransport or EmbeddedTransport:
+    """
+    Create the transport for a server address.
+    :param server: a "http(s)://" address of a database server, or a "sqlite:///" address of a local database file
+    :return: an EmbeddedTransport for a local database file, or a HTTPTransport otherwise
+    """
+
+    if urlsplit(server).scheme == EmbeddedTransport.SCHEME:
+        return EmbeddedTransport.from_url(server)
+    return HTTPTransport(server)
+
+
+def async_transport_for(server: str) -> AsyncHTTPTransport or AsyncEmbeddedTransport:
+    """
+    Create the asyncio transport for a server address, see transport_for().
+    :param server: a "http(s)://" address of a database server, or a "sqlite:///" address of a local database file
+    :return: an AsyncEmbeddedTransport for a local database file, or an AsyncHTTPTransport otherwise
+    """
+
+    if urlsplit(server).scheme == EmbeddedTransport.SCHEME:
+        return AsyncEmbeddedTransport.from_url(server)
+    return AsyncHTTPTransport(server)
+
+
+if __name__ == "__main__":
+    # for quick testing
+
+    pass
@@ -0,0 +1,17 @@
+from os import remove
+
+
+def remove_db(db_path: str):
+    """
+    Remove a test database file, along with the -wal and -shm files SQLite keeps next to a database in WAL mode. These
+    are left behind when the database is removed while a connection, such as one pooled by the test server, still has
+    it open.
+    :param db_path: the path of the database file
+    """
+
+    remove(db_path)
+    for sidecar_path in (db_path + "-wal", db_path + "-shm"):
+        try:
+            remove(sidecar_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,115 @@
+"""
+Benchmark of the test server's threaded and asyncio modes under a login storm.
+
+Run from the repository root: python test/benchmarks/bench_async_server.py [--clients N] [--duration S] [--workers N]
+The test server is started on port 8765 once in each mode. Each time, many concurrent clients, each over its own
+keep-alive connection, repeatedly log in (reading their account and writing its session ID) for a fixed duration. The
+requests per second, latency percentiles, failed requests and the peak number of server threads are reported.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from glob import glob
+from os import path, remove
+from random import randint
+from threading import Event, Thread
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..", "..")))
+
+from smartscheduler.database import SmartSchedulerDB  # noqa: E402
+from smartscheduler.engine import ConnectionPool  # noqa: E402
+from smartscheduler.exceptions import CommonDatabaseError  # noqa: E402
+from smartscheduler.transport import HTTPTransport  # noqa: E402
+
+
+ROOT = path.abspath(path.join(path.dirname(__file__), "..", ".."))
+TEST_SERVER = "http://127.0.0.1:8765/"
+TEST_DB = path.join(ROOT, "test", "test_server", "Test.db")
+
+
+def thread_count(pid: int) -> int:
+    """Return the number of threads of a process, or 0 if it cannot be read (only Linux is supported)."""
+
+    try:
+        with open(f"/proc/{pid}/status") as status_f:
+            return next(int(line.split()[1]) for line in status_f if line.startswith("Threads:"))
+    except (OSError, StopIteration):
+        return 0
+
+
+def client(db: SmartSchedulerDB, s_id: str, stop: Event, latencies: list, errors: list):
+    """Log in to an account over and over until stopped, recording the latency of each login."""
+
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            db.query_account(s_id)
+            db.update_account_info(s_id, db.COL_SESSION_ID, str(randint(0, 10 ** 9)))
+        except CommonDatabaseError:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def run(mode: str, clients: int, duration: float, workers: int) -> dict:
+    """Start the test server in a mode and return the throughput, latencies and peak threads of the workload."""
+
+    server_proc = subprocess.Popen([sys.executable, "test/test_server/test_server.py", "--mode", mode,
+                                    "--pool-size", str(workers)], cwd=ROOT, stdout=subprocess.DEVNULL)
+    time.sleep(1)
+    try:
+        seed_db = SmartSchedulerDB(TEST_SERVER)
+        s_ids = [str(10 ** 9 + i) for i in range(clients)]
+        seed_db.batch([seed_db.new_account_stmt(s_id, "bench_hash", str({}), str({})) for s_id in s_ids],
+                      transaction=True)
+        seed_db.close()
+        dbs = [SmartSchedulerDB(TEST_SERVER, transport=HTTPTransport(TEST_SERVER, pool_size=1))
+               for _ in range(clients)]
+        stop = Event()
+        latencies = [[] for _ in range(clients)]
+        errors = []
+        threads = [Thread(target=client, args=(dbs[i], s_ids[i], stop, latencies[i], errors))
+                   for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        peak_threads = 0
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            peak_threads = max(peak_threads, thread_count(server_proc.pid))
+            time.sleep(0.1)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for db in dbs:
+            db.close()
+    finally:
+        server_proc.terminate()
+        server_proc.wait()
+        for db_file in glob(TEST_DB + "*"):
+            remove(db_file)
+    times = sorted(latency for client_latencies in latencies for latency in client_latencies)
+    return {"logins": len(times), "per_second": len(times) / duration, "p50": statistics.median(times) * 1000,
+            "p99": times[int(len(times) * 0.99)] * 1000, "errors": len(errors), "threads": peak_threads}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=128, help="number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds each mode is run for")
+    parser.add_argument("--workers", type=int, default=ConnectionPool.DEF_SIZE,
+                        help="database connections, and executor workers in asyncio mode")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients, {args.duration:.0f} s per mode, {args.workers} database connections\n")
+    print(f"{'mode':<10}{'logins':>10}{'logins/s':>10}{'p50':>12}{'p99':>12}{'errors':>8}{'threads':>9}")
+    for mode in ("threaded", "asyncio"):
+        result = run(mode, args.clients, args.duration, args.workers)
+        print(f"{mode:<10}{result['logins']:>10}{result['per_second']:>10.0f}{result['p50']:>9.1f} ms"
+              f"{result['p99']:>9.1f} ms{result['errors']:>8}{result['threads']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark of the JSON and binary codecs on response bodies shaped like the test server's.
+
+Run from the repository root: python test/benchmarks/bench_codec.py [--accounts N]
+Reports the encoded size (raw and gzip compressed) and the encode and decode CPU time of each codec.
+"""
+
+import argparse
+import gzip
+import sys
+import timeit
+from os import path
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..", "..")))
+
+from smartscheduler.codec import JSONCodec, BinaryCodec  # noqa: E402
+
+
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def account_row(s_id: int) -> list:
+    """Build an accounts table row with a full weekday schedule and five registered subjects."""
+
+    subs = ["EMT1016", "EEL1166", "ECE1016", "EEE1016", "EPH1056"]
+    schedule = {day: [f"{subs[hour % 5]}_Lecture_{day}_{hour:02d}00_{hour + 2:02d}00" for hour in (8, 10, 14, 16)]
+                if day not in ("Saturday", "Sunday") else [] for day in DAYS}
+    reg_subjects = {f"{sub}_Lecture": "abc-defg-hij" for sub in subs}
+    pswrd_hash = "$pbkdf2-sha256$29000$" + "N" * 22 + "$" + "x" * 43
+    return [str(s_id), pswrd_hash, str(schedule), str(reg_subjects), "0"]
+
+
+def measure(codec, body: dict, number: int) -> tuple:
+    """Return the raw size, the gzip compressed size and the encode and decode times in microseconds."""
+
+    data = codec.encode(body)
+    assert codec.decode(data) == body
+    encode_time = timeit.timeit(lambda: codec.encode(body), number=number) / number * 1e6
+    decode_time = timeit.timeit(lambda: codec.decode(data), number=number) / number * 1e6
+    return len(data), len(gzip.compress(data, 6)), encode_time, decode_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=1000, help="number of rows in the retrieve_all body")
+    args = parser.parse_args()
+
+    rows = [account_row(10 ** 9 + i) for i in range(args.accounts)]
+    bodies = {
+        f"retrieve_all ({args.accounts} rows)": ({"db_ret": rows, "db_err": False}, 50),
+        "account snapshot": ({"db_ret": rows[:1], "db_err": False}, 20000),
+        "subjects catalog": ({"db_ret": [[f"EMT{1000 + i}", f"Engineering Subject {i}"] for i in range(60)],
+                              "db_err": False, "etag": "f" * 40}, 5000),
+    }
+    print(f"{'body':<26}{'codec':<8}{'bytes':>10}{'gzipped':>10}{'encode':>14}{'decode':>14}")
+    for name, (body, number) in bodies.items():
+        for codec in (JSONCodec, BinaryCodec):
+            size, gz_size, encode_time, decode_time = measure(codec, body, number)
+            print(f"{name:<26}{codec.__name__[:-5]:<8}{size:>10}{gz_size:>10}{encode_time:>11.1f} us"
+                  f"{decode_time:>11.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmark of payload compression between SmartSchedulerDB and the test server over a throttled local link.
+
+Run from the repository root: python test/benchmarks/bench_compression.py [--server URL] [--kbps N] [--latency MS]
+The test server is started on port 8765 unless --server is given. Requests are relayed through a local proxy that
+limits bandwidth and adds latency in each direction, and counts the bytes that cross it.
+"""
+
+import argparse
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from os import path, remove
+from random import choice, randint
+from threading import Lock, Thread
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..", "..")))
+
+from smartscheduler.database import SmartSchedulerDB  # noqa: E402
+from smartscheduler.transport import HTTPTransport  # noqa: E402
+
+
+ROOT = path.abspath(path.join(path.dirname(__file__), "..", ".."))
+TEST_SERVER = "http://127.0.0.1:8765/"
+TEST_DB = path.join(ROOT, "test", "test_server", "Test.db")
+
+
+class ThrottledProxy:
+    """A TCP relay that limits bandwidth, adds latency and counts the bytes sent in each direction."""
+
+    def __init__(self, upstream: tuple, bytes_per_sec: float, latency: float):
+        self.upstream = upstream
+        self.bytes_per_sec = bytes_per_sec
+        self.latency = latency
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self._lock = Lock()
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen()
+        Thread(target=self.__accept__, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:%d/" % self._sock.getsockname()[1]
+
+    def __accept__(self):
+        while True:
+            client, _ = self._sock.accept()
+            server = socket.create_connection(self.upstream)
+            for sock in (client, server):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            Thread(target=self.__pump__, args=(client, server, True), daemon=True).start()
+            Thread(target=self.__pump__, args=(server, client, False), daemon=True).start()
+
+    def __pump__(self, src: socket.socket, dst: socket.socket, up: bool):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                time.sleep(self.latency + len(data) / self.bytes_per_sec)
+                with self._lock:
+                    if up:
+                        self.bytes_up += len(data)
+                    else:
+                        self.bytes_down += len(data)
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (src, dst):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def reset(self):
+        with self._lock:
+            self.bytes_up = self.bytes_down = 0
+
+
+def full_schedule() -> str:
+    """Build a realistic schedule with a couple of classes on every weekday."""
+
+    subs = ["EMT1016", "EEL1166", "ECE1016", "EEE1016", "EPH1056"]
+    schedule = {day: [] for day in ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")}
+    for day in list(schedule.keys())[:5]:
+        schedule[day] = [f"{choice(subs)}_{choice(['Lecture', 'Tutorial', 'Lab'])}_{day}_{hour}00_{hour + 2}00"
+                         for hour in (8, 10, 14, 16)]
+    return str(schedule)
+
+
+def run(db: SmartSchedulerDB, proxy: ThrottledProxy, s_ids: list) -> dict:
+    """Run the workload once and return the bytes on the wire and per-operation latencies."""
+
+    proxy.reset()
+    latencies = {"retrieve_all": [], "query_account": [], "update_schedule": [], "batch_update": []}
+    for _ in range(3):
+        start = time.perf_counter()
+        db.retrieve_all(db.TAB_ACCOUNTS)
+        latencies["retrieve_all"].append(time.perf_counter() - start)
+    for s_id in s_ids[:20]:
+        start = time.perf_counter()
+        db.query_account(s_id)
+        latencies["query_account"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        db.update_account_info(s_id, db.COL_SCHEDULE, full_schedule())
+        latencies["update_schedule"].append(time.perf_counter() - start)
+    for _ in range(3):
+        start = time.perf_counter()
+        db.batch([db.update_account_info_stmt(s_id, db.COL_SCHEDULE, full_schedule()) for s_id in s_ids[:20]],
+                 transaction=True)
+        latencies["batch_update"].append(time.perf_counter() - start)
+    return {"bytes_up": proxy.bytes_up, "bytes_down": proxy.bytes_down,
+            **{op: statistics.median(times) * 1000 for op, times in latencies.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", default=None, help="address of an already running test server")
+    parser.add_argument("--kbps", type=float, default=1000.0, help="link bandwidth in kilobits per second")
+    parser.add_argument("--latency", type=float, default=20.0, help="one way latency in milliseconds")
+    parser.add_argument("--accounts", type=int, default=100, help="number of accounts to seed")
+    args = parser.parse_args()
+
+    server_proc = None
+    if args.server is None:
+        server_proc = subprocess.Popen([sys.executable, "test/test_server/test_server.py"], cwd=ROOT,
+                                       stdout=subprocess.DEVNULL)
+        time.sleep(1)
+    server = args.server or TEST_SERVER
+    host, port = server.split("//")[1].strip("/").split(":")
+    proxy = ThrottledProxy((host, int(port)), args.kbps * 1000 / 8, args.latency / 1000)
+    try:
+        seed_db = SmartSchedulerDB(server)
+        s_ids = [str(randint(10 ** 9, 10 ** 10 - 1)) for _ in range(args.accounts)]
+        seed_db.batch([seed_db.new_account_stmt(s_id, "bench_hash", full_schedule(), str({})) for s_id in s_ids],
+                      transaction=True)
+        print(f"Link: {args.kbps:.0f} kbit/s, {args.latency:.0f} ms one way, {args.accounts} accounts\n")
+        print(f"{'mode':<12}{'bytes up':>12}{'bytes down':>12}{'retrieve_all':>16}{'query_account':>16}"
+              f"{'update_sch':>14}{'batch_update':>16}")
+        for mode, threshold in (("identity", None), ("gzip", HTTPTransport.DEF_COMPRESS_THRESHOLD)):
+            db = SmartSchedulerDB(proxy.url, transport=HTTPTransport(proxy.url, compress_threshold=threshold))
+            result = run(db, proxy, s_ids)
+            print(f"{mode:<12}{result['bytes_up']:>12}{result['bytes_down']:>12}{result['retrieve_all']:>13.1f} ms"
+                  f"{result['query_account']:>13.1f} ms{result['update_schedule']:>11.1f} ms"
+                  f"{result['batch_update']:>13.1f} ms")
+            db.close()
+        for s_id in s_ids:
+            seed_db.delete_account(s_id)
+        seed_db.close()
+    finally:
+        if server_proc is not None:
+            server_proc.terminate()
+            server_proc.wait()
+            if path.exists(TEST_DB):
+                remove(TEST_DB)
+
+
+if __name__ == "__main__":
+    main()
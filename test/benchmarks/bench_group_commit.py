@@ -0,0 +1,94 @@
+"""
+Benchmark of the test server's write throughput with and without group commit.
+
+Run from the repository root: python test/benchmarks/bench_group_commit.py [--clients N] [--duration S] [--batch N]
+The test server is started on port 8765 once committing every write on its own and once with group commit. Each time,
+concurrent clients repeatedly write their account's session ID and schedule, as at the start of a class period, for a
+fixed duration. The database is synced on every commit (--synchronous full) unless another level is given. The writes
+per second and their latency percentiles are reported.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from glob import glob
+from os import path, remove
+from random import randint
+from threading import Event, Thread
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..", "..")))
+
+from smartscheduler.database import SmartSchedulerDB  # noqa: E402
+from smartscheduler.engine import StorageProfile, WriteCoalescer  # noqa: E402
+
+
+ROOT = path.abspath(path.join(path.dirname(__file__), "..", ".."))
+TEST_SERVER = "http://127.0.0.1:8765/"
+TEST_DB = path.join(ROOT, "test", "test_server", "Test.db")
+
+
+def client(db: SmartSchedulerDB, s_id: str, stop: Event, latencies: list):
+    """Write an account's session ID and schedule until stopped, recording the latency of each write."""
+
+    while not stop.is_set():
+        for col in (db.COL_SESSION_ID, db.COL_SCHEDULE):
+            start = time.perf_counter()
+            db.update_account_info(s_id, col, str(randint(0, 10 ** 9)))
+            latencies.append(time.perf_counter() - start)
+
+
+def run(group_commit: int, synchronous: str, clients: int, duration: float) -> dict:
+    """Start the test server with a group commit size and return the throughput and latencies of the writes."""
+
+    server_proc = subprocess.Popen([sys.executable, "test/test_server/test_server.py", "--synchronous", synchronous,
+                                    "--group-commit", str(group_commit), "--pool-size", str(clients)],
+                                   cwd=ROOT, stdout=subprocess.DEVNULL)
+    time.sleep(1)
+    try:
+        seed_db = SmartSchedulerDB(TEST_SERVER)
+        s_ids = [str(10 ** 9 + i) for i in range(clients)]
+        seed_db.batch([seed_db.new_account_stmt(s_id, "bench_hash", str({}), str({})) for s_id in s_ids],
+                      transaction=True)
+        seed_db.close()
+        dbs = [SmartSchedulerDB(TEST_SERVER) for _ in range(clients)]
+        stop = Event()
+        latencies = [[] for _ in range(clients)]
+        threads = [Thread(target=client, args=(dbs[i], s_ids[i], stop, latencies[i])) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for db in dbs:
+            db.close()
+    finally:
+        server_proc.terminate()
+        server_proc.wait()
+        for db_file in glob(TEST_DB + "*"):
+            remove(db_file)
+    times = sorted(latency for client_latencies in latencies for latency in client_latencies)
+    return {"writes": len(times), "per_second": len(times) / duration, "p50": statistics.median(times) * 1000,
+            "p99": times[int(len(times) * 0.99)] * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32, help="number of concurrent writers")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds each configuration is run for")
+    parser.add_argument("--batch", type=int, default=WriteCoalescer.DEF_MAX_BATCH, help="maximum group commit size")
+    parser.add_argument("--synchronous", default="full", choices=StorageProfile.SYNCHRONOUS_LEVELS)
+    args = parser.parse_args()
+
+    print(f"{args.clients} writers, {args.duration:.0f} s per configuration, synchronous={args.synchronous}\n")
+    print(f"{'group commit':<14}{'writes':>10}{'writes/s':>10}{'p50':>12}{'p99':>12}")
+    for name, group_commit in (("off", 0), (f"up to {args.batch}", args.batch)):
+        result = run(group_commit, args.synchronous, args.clients, args.duration)
+        print(f"{name:<14}{result['writes']:>10}{result['per_second']:>10.0f}{result['p50']:>9.1f} ms"
+              f"{result['p99']:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
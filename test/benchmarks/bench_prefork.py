@@ -0,0 +1,109 @@
+"""
+Benchmark of the test server's throughput scaling across pre-forked worker processes.
+
+Run from the repository root: python test/benchmarks/bench_prefork.py [--workers 1,2,4,8] [--clients N] [--duration S]
+The test server is started on port 8765 with each number of worker processes, all of which share the port and the same
+SQLite database. Each time, client processes (so that the load generator is not held back by a single interpreter)
+run concurrent clients that repeatedly log in, reading their account and writing its session ID, for a fixed duration.
+The logins per second, their latency percentiles and the failed logins are reported. Throughput can only scale up to
+the number of CPU cores, which the client processes share with the workers.
+"""
+
+import argparse
+import multiprocessing
+import statistics
+import subprocess
+import sys
+import time
+from glob import glob
+from os import cpu_count, path, remove
+from random import randint
+from threading import Event, Thread
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..", "..")))
+
+from smartscheduler.database import SmartSchedulerDB  # noqa: E402
+from smartscheduler.exceptions import CommonDatabaseError  # noqa: E402
+
+
+ROOT = path.abspath(path.join(path.dirname(__file__), "..", ".."))
+TEST_SERVER = "http://127.0.0.1:8765/"
+TEST_DB = path.join(ROOT, "test", "test_server", "Test.db")
+
+
+def client(db: SmartSchedulerDB, s_id: str, stop: Event, latencies: list, errors: list):
+    """Log in to an account over and over until stopped, recording the latency of each login."""
+
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            db.query_account(s_id)
+            db.update_account_info(s_id, db.COL_SESSION_ID, str(randint(0, 10 ** 9)))
+        except CommonDatabaseError:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def client_process(s_ids: list, duration: float) -> tuple:
+    """Run a client thread for each account for a duration, and return the login latencies and failed logins."""
+
+    dbs = [SmartSchedulerDB(TEST_SERVER) for _ in s_ids]
+    stop = Event()
+    latencies = []
+    errors = []
+    threads = [Thread(target=client, args=(dbs[i], s_ids[i], stop, latencies, errors)) for i in range(len(s_ids))]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    for db in dbs:
+        db.close()
+    return latencies, len(errors)
+
+
+def run(workers: int, clients: int, client_procs: int, duration: float) -> dict:
+    """Start the test server with a number of workers and return the throughput and latencies of the workload."""
+
+    server_proc = subprocess.Popen([sys.executable, "test/test_server/test_server.py", "--workers", str(workers),
+                                    "--quiet"], cwd=ROOT, stdout=subprocess.DEVNULL)
+    time.sleep(1 + workers * 0.1)
+    try:
+        seed_db = SmartSchedulerDB(TEST_SERVER)
+        s_ids = [str(10 ** 9 + i) for i in range(clients)]
+        seed_db.batch([seed_db.new_account_stmt(s_id, "bench_hash", str({}), str({})) for s_id in s_ids],
+                      transaction=True)
+        seed_db.close()
+        with multiprocessing.Pool(client_procs) as pool:
+            results = pool.starmap(client_process, [(s_ids[i::client_procs], duration) for i in range(client_procs)])
+    finally:
+        server_proc.terminate()
+        server_proc.wait()
+        for db_file in glob(TEST_DB + "*"):
+            remove(db_file)
+    times = sorted(latency for latencies, _ in results for latency in latencies)
+    return {"logins": len(times), "per_second": len(times) / duration, "p50": statistics.median(times) * 1000,
+            "p99": times[int(len(times) * 0.99)] * 1000, "errors": sum(errors for _, errors in results)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4,8", help="comma separated numbers of worker processes")
+    parser.add_argument("--clients", type=int, default=32, help="number of concurrent clients")
+    parser.add_argument("--client-procs", type=int, default=4, help="number of processes the clients are spread over")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds each number of workers is run for")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients in {args.client_procs} processes, {args.duration:.0f} s per run, "
+          f"{cpu_count()} CPU cores\n")
+    print(f"{'workers':<10}{'logins':>10}{'logins/s':>10}{'p50':>12}{'p99':>12}{'errors':>8}")
+    for workers in map(int, args.workers.split(",")):
+        result = run(workers, args.clients, args.client_procs, args.duration)
+        print(f"{workers:<10}{result['logins']:>10}{result['per_second']:>10.0f}{result['p50']:>9.1f} ms"
+              f"{result['p99']:>9.1f} ms{result['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark of the test server's result cache on concurrent subjects catalog reads.
+
+Run from the repository root: python test/benchmarks/bench_result_cache.py [--clients N] [--duration S] [--subjects N]
+The test server is started on port 8765 once with the result cache disabled and once with it enabled. Each time, the
+catalog is seeded with extra subjects and concurrent clients repeatedly retrieve it, as every refresh and editor open
+does, for a fixed duration, while one more client logs in every 50 ms so that the accounts table keeps being written.
+The catalog reads per second and their latency percentiles are reported.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from glob import glob
+from os import path, remove
+from random import randint
+from threading import Event, Thread
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..", "..")))
+
+from smartscheduler.database import SmartSchedulerDB  # noqa: E402
+from smartscheduler.engine import ResultCache  # noqa: E402
+from smartscheduler.statements import Op  # noqa: E402
+
+
+ROOT = path.abspath(path.join(path.dirname(__file__), "..", ".."))
+TEST_SERVER = "http://127.0.0.1:8765/"
+TEST_DB = path.join(ROOT, "test", "test_server", "Test.db")
+
+
+def reader(db: SmartSchedulerDB, stop: Event, latencies: list):
+    """Retrieve the subjects catalog until stopped, recording the latency of each retrieval."""
+
+    while not stop.is_set():
+        start = time.perf_counter()
+        db.retrieve_all(db.TAB_SUB_INFO)
+        latencies.append(time.perf_counter() - start)
+
+
+def writer(db: SmartSchedulerDB, s_id: str, stop: Event):
+    """Log in to an account every 50 ms until stopped."""
+
+    while not stop.wait(0.05):
+        db.update_account_info(s_id, db.COL_SESSION_ID, str(randint(0, 10 ** 9)))
+
+
+def run(cache_bytes: int, clients: int, duration: float, subjects: int) -> dict:
+    """Start the test server with a result cache size and return the throughput and latencies of catalog reads."""
+
+    server_proc = subprocess.Popen([sys.executable, "test/test_server/test_server.py",
+                                    "--result-cache-bytes", str(cache_bytes)], cwd=ROOT, stdout=subprocess.DEVNULL)
+    time.sleep(1)
+    try:
+        seed_db = SmartSchedulerDB(TEST_SERVER)
+        seed_db.batch([(Op("subjects.upsert"), [f"BEN{i:04d}", f"Benchmark Subject {i}"]) for i in range(subjects)],
+                      transaction=True)
+        seed_db.new_account("1000000000", "bench_hash", str({}), str({}))
+        dbs = [SmartSchedulerDB(TEST_SERVER) for _ in range(clients)]
+        stop = Event()
+        latencies = [[] for _ in range(clients)]
+        threads = [Thread(target=reader, args=(dbs[i], stop, latencies[i])) for i in range(clients)]
+        threads.append(Thread(target=writer, args=(seed_db, "1000000000", stop)))
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for db in dbs:
+            db.close()
+        seed_db.close()
+    finally:
+        server_proc.terminate()
+        server_proc.wait()
+        for db_file in glob(TEST_DB + "*"):
+            remove(db_file)
+    times = sorted(latency for client_latencies in latencies for latency in client_latencies)
+    return {"reads": len(times), "per_second": len(times) / duration, "p50": statistics.median(times) * 1000,
+            "p99": times[int(len(times) * 0.99)] * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16, help="number of concurrent catalog readers")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds each configuration is run for")
+    parser.add_argument("--subjects", type=int, default=500, help="number of extra subjects in the catalog")
+    args = parser.parse_args()
+
+    print(f"{args.clients} readers, {args.duration:.0f} s per configuration, {args.subjects} extra subjects\n")
+    print(f"{'result cache':<14}{'reads':>10}{'reads/s':>10}{'p50':>12}{'p99':>12}")
+    for name, cache_bytes in (("disabled", 0), ("enabled", ResultCache.DEF_MAX_BYTES)):
+        result = run(cache_bytes, args.clients, args.duration, args.subjects)
+        print(f"{name:<14}{result['reads']:>10}{result['per_second']:>10.0f}{result['p50']:>9.1f} ms"
+              f"{result['p99']:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
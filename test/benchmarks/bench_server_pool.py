@@ -0,0 +1,89 @@
+"""
+Benchmark of the test server's throughput with and without persistent pooled database connections.
+
+Run from the repository root: python test/benchmarks/bench_server_pool.py [--clients N] [--duration S] [--pool-size N]
+The test server is started on port 8765 once with --pool-size 0, which opens a database connection for every request,
+and once with the given pool size. Each time, concurrent clients query accounts for a fixed duration, and the
+requests per second and latency percentiles are reported.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from os import path, remove
+from random import choice, randint
+from threading import Event, Thread
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..", "..")))
+
+from smartscheduler.database import SmartSchedulerDB  # noqa: E402
+from smartscheduler.engine import ConnectionPool  # noqa: E402
+
+
+ROOT = path.abspath(path.join(path.dirname(__file__), "..", ".."))
+TEST_SERVER = "http://127.0.0.1:8765/"
+TEST_DB = path.join(ROOT, "test", "test_server", "Test.db")
+
+
+def client(s_ids: list, stop: Event, latencies: list):
+    """Query random accounts until stopped, recording the latency of each request."""
+
+    db = SmartSchedulerDB(TEST_SERVER)
+    while not stop.is_set():
+        start = time.perf_counter()
+        db.query_account(choice(s_ids))
+        latencies.append(time.perf_counter() - start)
+    db.close()
+
+
+def run(pool_size: int, clients: int, duration: float, accounts: int) -> dict:
+    """Start the test server with a pool size, seed it and return the throughput and latencies of the workload."""
+
+    server_proc = subprocess.Popen([sys.executable, "test/test_server/test_server.py", "--pool-size", str(pool_size)],
+                                   cwd=ROOT, stdout=subprocess.DEVNULL)
+    time.sleep(1)
+    try:
+        seed_db = SmartSchedulerDB(TEST_SERVER)
+        s_ids = [str(randint(10 ** 9, 10 ** 10 - 1)) for _ in range(accounts)]
+        seed_db.batch([seed_db.new_account_stmt(s_id, "bench_hash", str({}), str({})) for s_id in s_ids],
+                      transaction=True)
+        seed_db.close()
+        stop = Event()
+        latencies = [[] for _ in range(clients)]
+        threads = [Thread(target=client, args=(s_ids, stop, latencies[i])) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        server_proc.terminate()
+        server_proc.wait()
+        if path.exists(TEST_DB):
+            remove(TEST_DB)
+    times = sorted(latency for client_latencies in latencies for latency in client_latencies)
+    return {"requests": len(times), "per_second": len(times) / duration,
+            "p50": statistics.median(times) * 1000, "p99": times[int(len(times) * 0.99)] * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8, help="number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds each configuration is run for")
+    parser.add_argument("--pool-size", type=int, default=ConnectionPool.DEF_SIZE, help="pool size to compare with")
+    parser.add_argument("--accounts", type=int, default=1000, help="number of accounts to seed")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients, {args.duration:.0f} s per configuration, {args.accounts} accounts\n")
+    print(f"{'pool size':<12}{'requests':>10}{'req/s':>10}{'p50':>12}{'p99':>12}")
+    for pool_size in (0, args.pool_size):
+        result = run(pool_size, args.clients, args.duration, args.accounts)
+        print(f"{pool_size:<12}{result['requests']:>10}{result['per_second']:>10.0f}{result['p50']:>9.2f} ms"
+              f"{result['p99']:>9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Concurrency stress test of the test server's database with SQLite's default settings and with the tuned storage profile.
+
+Run from the repository root: python test/benchmarks/bench_storage_profile.py [--clients N] [--duration S]
+The test server is started on port 8765 once with SQLite's defaults (rollback journal, no busy timeout, FULL
+synchronisation) and once with the default StorageProfile (WAL, busy timeout, NORMAL synchronisation). Each time,
+concurrent clients repeatedly log in, writing their account's session ID and reading another account, for a fixed
+duration. The writes per second and the number of requests that failed with "database is locked" are reported.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from glob import glob
+from os import path, remove
+from random import randint
+from threading import Event, Thread
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..", "..")))
+
+from smartscheduler.database import SmartSchedulerDB  # noqa: E402
+from smartscheduler.engine import StorageProfile  # noqa: E402
+from smartscheduler.exceptions import CommonDatabaseError  # noqa: E402
+
+
+ROOT = path.abspath(path.join(path.dirname(__file__), "..", ".."))
+TEST_SERVER = "http://127.0.0.1:8765/"
+TEST_DB = path.join(ROOT, "test", "test_server", "Test.db")
+
+
+def server_args(profile: StorageProfile) -> list:
+    """Build the test server's command line arguments for a storage profile."""
+
+    return ["--journal-mode", profile.journal_mode, "--busy-timeout", str(profile.busy_timeout),
+            "--synchronous", profile.synchronous, "--cache-size", str(profile.cache_size),
+            "--mmap-size", str(profile.mmap_size)]
+
+
+def client(db: SmartSchedulerDB, s_id: str, other_id: str, stop: Event, counts: dict):
+    """Log in to an account over and over until stopped, counting the writes made and the lock errors."""
+
+    while not stop.is_set():
+        try:
+            db.update_account_info(s_id, db.COL_SESSION_ID, str(randint(0, 10 ** 9)))
+            counts["writes"] += 1
+            db.query_account(other_id)
+        except CommonDatabaseError as e:
+            if "locked" not in str(e):
+                raise
+            counts["locked"] += 1
+
+
+def run(profile: StorageProfile, clients: int, duration: float) -> dict:
+    """Start the test server with a storage profile and return the writes and lock errors of the workload."""
+
+    server_proc = subprocess.Popen([sys.executable, "test/test_server/test_server.py", *server_args(profile)],
+                                   cwd=ROOT, stdout=subprocess.DEVNULL)
+    time.sleep(1)
+    try:
+        seed_db = SmartSchedulerDB(TEST_SERVER)
+        s_ids = [str(10 ** 9 + i) for i in range(clients)]
+        seed_db.batch([seed_db.new_account_stmt(s_id, "bench_hash", str({}), str({})) for s_id in s_ids],
+                      transaction=True)
+        seed_db.close()
+        dbs = [SmartSchedulerDB(TEST_SERVER) for _ in range(clients)]
+        stop = Event()
+        counts = [{"writes": 0, "locked": 0} for _ in range(clients)]
+        threads = [Thread(target=client, args=(dbs[i], s_ids[i], s_ids[i - 1], stop, counts[i]))
+                   for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for db in dbs:
+            db.close()
+    finally:
+        server_proc.terminate()
+        server_proc.wait()
+        for db_file in glob(TEST_DB + "*"):
+            remove(db_file)
+    writes = sum(client_counts["writes"] for client_counts in counts)
+    return {"writes": writes, "per_second": writes / duration,
+            "locked": sum(client_counts["locked"] for client_counts in counts)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16, help="number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds each profile is run for")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients, {args.duration:.0f} s per profile\n")
+    print(f"{'profile':<18}{'writes':>10}{'writes/s':>10}{'locked':>10}")
+    for name, profile in (("sqlite defaults", StorageProfile.sqlite_defaults()), ("tuned", StorageProfile())):
+        result = run(profile, args.clients, args.duration)
+        print(f"{name:<18}{result['writes']:>10}{result['per_second']:>10.0f}{result['locked']:>10}")
+
+
+if __name__ == "__main__":
+    main()
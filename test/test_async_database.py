@@ -0,0 +1,99 @@
+import asyncio
+import unittest
+from random import randint
+
+from smartscheduler.async_database import AsyncSmartSchedulerDB
+from smartscheduler.database import AccountSnapshot
+from smartscheduler.exceptions import CommonDatabaseError
+from smartscheduler.resilience import CircuitBreaker
+from smartscheduler.transport import AsyncHTTPTransport
+from test import remove_db
+
+
+class AsyncSmartSchedulerDBTest(unittest.IsolatedAsyncioTestCase):
+    """TEST A.2"""
+
+    test_db = "./test/test_server/Test.db"
+    test_server = "http://127.0.0.1:8765/"
+
+    async def asyncSetUp(self):
+        self.transport = AsyncHTTPTransport(self.test_server, pool_size=4)
+        self.db = await AsyncSmartSchedulerDB.create(self.test_server, transport=self.transport)
+
+    async def test_a21_account_lifecycle(self):
+        """TEST_CASE_ID A.2.1"""
+        test_data = [str(randint(10 ** 9, 10 ** 10 - 1)), "test_pass_hash", "test_sch", "test_subs"]
+        await self.db.new_account(*test_data)
+        with self.assertRaises(CommonDatabaseError):
+            await self.db.new_account(*test_data)
+        await self.db.update_account_info(test_data[0], self.db.COL_SCHEDULE, "updated_sch")
+        self.assertEqual(await self.db.query_account(test_data[0]),
+                         AccountSnapshot(test_data[0], "test_pass_hash", "updated_sch", "test_subs", "0"))
+        await self.db.delete_account(test_data[0])
+        self.assertEqual(await self.db.query_account_info(test_data[0], self.db.COL_STU_ID), [])
+
+    async def test_a22_concurrent_requests(self):
+        """TEST_CASE_ID A.2.2"""
+        s_ids = [str(randint(10 ** 9, 10 ** 10 - 1)) for _ in range(20)]
+        await asyncio.gather(*[self.db.new_account(s_id, "hash", f"sch_{s_id}", "subs") for s_id in s_ids])
+        schedules = await asyncio.gather(*[self.db.query_account_info(s_id, self.db.COL_SCHEDULE) for s_id in s_ids])
+        self.assertEqual(schedules, [[f"sch_{s_id}"] for s_id in s_ids])
+        self.assertLessEqual(len(self.transport._idle), self.transport.pool_size)
+
+    async def test_a23_compression(self):
+        """TEST_CASE_ID A.2.3"""
+        test_data = [str(randint(10 ** 9, 10 ** 10 - 1)), "test_pass_hash", "test_sch" * 1000, "test_subs"]
+        self.assertEqual(self.transport.server_accepts_gzip, True)
+        await self.db.new_account(*test_data)
+        self.assertEqual(await self.db.query_account(test_data[0]), AccountSnapshot(*test_data, "0"))
+        await self.db.delete_account(test_data[0])
+
+    async def test_a24_paginated_retrieval(self):
+        """TEST_CASE_ID A.2.4"""
+        s_ids = sorted({str(randint(10 ** 9, 10 ** 10 - 1)) for _ in range(20)})
+        await self.db.batch([self.db.new_account_stmt(s_id, "test_pass_hash", "test_sch", "test_subs")
+                             for s_id in s_ids], transaction=True)
+        all_rows = sorted(await self.db.retrieve_all(self.db.TAB_ACCOUNTS))
+        self.assertEqual([row async for row in self.db.iter_all(self.db.TAB_ACCOUNTS, page_size=6)], all_rows)
+        await self.db.batch([self.db.delete_account_stmt(s_id) for s_id in s_ids], transaction=True)
+
+    async def test_a25_cancelled_trial_request(self):
+        """TEST_CASE_ID A.2.5"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+        db = await AsyncSmartSchedulerDB.create(self.test_server, timeout=0.1, transport=self.transport,
+                                                breaker=breaker)
+
+        async def stalled_post(*_):
+            await asyncio.sleep(60)
+        breaker.record_failure()
+        self.transport.post = stalled_post
+        with self.assertRaises(CommonDatabaseError):
+            await db.update_account_info("0000000000", db.COL_SCHEDULE, "sch")
+        self.assertEqual(breaker.times_opened, 2)
+        del self.transport.post
+        self.assertEqual(await db.query_account_info("0000000000", db.COL_STU_ID), [])
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_a26_corrupt_response(self):
+        """TEST_CASE_ID A.2.6"""
+        round_trips = []
+
+        async def corrupt_round_trip(*_):
+            round_trips.append(1)
+            return 200, {"content-type": "application/json", "content-encoding": "gzip"}, b"not gzip"
+        self.transport.__round_trip__ = corrupt_round_trip
+        with self.assertRaisesRegex(CommonDatabaseError, "could not be decoded"):
+            await self.db.query_account_info("0000000000", self.db.COL_STU_ID)
+        self.assertEqual(len(round_trips), 1)
+        del self.transport.__round_trip__
+
+    async def asyncTearDown(self):
+        await self.db.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        remove_db(cls.test_db)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+from random import randint
+
+from smartscheduler.async_main import AsyncSmartScheduler
+from smartscheduler.exceptions import CommonError
+from smartscheduler.main import Schedule
+from test import remove_db
+
+
+class AsyncSmartSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    """TEST C.5"""
+
+    test_db = "./test/test_server/Test.db"
+    test_server = "http://127.0.0.1:8765/"
+
+    async def asyncSetUp(self):
+        self.smart_sch = await AsyncSmartScheduler.create(self.test_server)
+
+    async def test_c51_account_operations(self):
+        """TEST_CASE_ID C.5.1"""
+        student_id, pswrd = str(randint(10 ** 9, 10 ** 10 - 1)), "test_password"
+        await self.smart_sch.sign_up(student_id, pswrd, pswrd)
+        with self.assertRaises(CommonError):
+            await self.smart_sch.login(student_id, pswrd.upper())
+        await self.smart_sch.login(student_id, pswrd)
+        self.assertEqual(await self.smart_sch.get_schedule(), Schedule.empty_schedule())
+        await self.smart_sch.update_reg_subjects({"EMT1016_Lecture": "link"})
+        self.assertEqual(await self.smart_sch.get_reg_subjects(), {"EMT1016_Lecture": "link"})
+        await self.smart_sch.logout(remote_student_id=student_id)
+        with self.assertRaises(CommonError):
+            await self.smart_sch.get_schedule()
+
+    async def test_c52_concurrent_sessions(self):
+        """TEST_CASE_ID C.5.2"""
+        sessions = [AsyncSmartScheduler(self.smart_sch.db) for _ in range(5)]
+        accounts = [(str(randint(10 ** 9, 10 ** 10 - 1)), "test_password") for _ in sessions]
+        await asyncio.gather(*[session.sign_up(s_id, pswrd, pswrd) for session, (s_id, pswrd) in
+                               zip(sessions, accounts)])
+        await asyncio.gather(*[session.login(s_id, pswrd) for session, (s_id, pswrd) in zip(sessions, accounts)])
+        snapshots = await asyncio.gather(*[session.get_account_snapshot() for session in sessions])
+        self.assertEqual([snapshot.session_id for snapshot in snapshots], [session.session_id for session in sessions])
+        await asyncio.gather(*[session.delete_acc() for session in sessions])
+
+    async def asyncTearDown(self):
+        await self.smart_sch.db.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        remove_db(cls.test_db)
+
+
+if __name__ == '__main__':
+    unittest.main()
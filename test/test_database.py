@@ -1,9 +1,31 @@
+import asyncio
+import csv
+import os
+import requests
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from os import remove
 from random import randint
+from threading import Thread
 
-from smartscheduler.database import SmartSchedulerDB
+from smartscheduler.codec import BinaryCodec
+from smartscheduler.database import SmartSchedulerDB, AccountSnapshot
+from smartscheduler.engine import ConnectionPool, ResultCache, SQLiteEngine, StorageProfile, WriteCoalescer
 from smartscheduler.exceptions import CommonDatabaseError
+from smartscheduler.metrics import LatencyHistogram, Metrics, ServerMetrics
+from smartscheduler.resilience import RetryPolicy, CircuitBreaker
+from smartscheduler.statements import Op, access, resolve
+from smartscheduler.transport import EmbeddedTransport, HTTPTransport
+from test import remove_db
+
+EMPTY_SCHEDULE = {"Monday": [], "Tuesday": [], "Wednesday": [], "Thursday": [], "Friday": [], "Saturday": [],
+                  "Sunday": []}
 
 
 class SmartSchedulerDBTest(unittest.TestCase):
@@ -19,12 +41,12 @@ class SmartSchedulerDBTest(unittest.TestCase):
     def test_a11_create_tables(self):
         """TEST_CASE_ID A.1.1"""
         db = SmartSchedulerDB(self.test_server)
-        db.__db_cmd__("SELECT name FROM sqlite_master WHERE type = 'table'", None, False)
-        tables = [res[0] for res in db.db_ret]
-        db.__db_cmd__(f"SELECT name FROM pragma_table_info('{db.TAB_ACCOUNTS}')", None, False)
-        retrieved_accounts_cols = [res[0] for res in db.db_ret]
-        db.__db_cmd__(f"SELECT name FROM pragma_table_info('{db.TAB_SUB_INFO}')", None, False)
-        retrieved_sub_info_cols = [res[0] for res in db.db_ret]
+        db_ret, _ = db.__db_cmd__(Op("schema.tables"), None, False)
+        tables = [res[0] for res in db_ret]
+        db_ret, _ = db.__db_cmd__(Op("schema.columns"), [db.TAB_ACCOUNTS], False)
+        retrieved_accounts_cols = [res[0] for res in db_ret]
+        db_ret, _ = db.__db_cmd__(Op("schema.columns"), [db.TAB_SUB_INFO], False)
+        retrieved_sub_info_cols = [res[0] for res in db_ret]
         account_cols = [db.COL_STU_ID, db.COL_PSWRD_HASH, db.COL_SCHEDULE, db.COL_SUBJECTS, db.COL_SESSION_ID]
         sub_info_cols = [db.COL_SUB_CODE, db.COL_SUB_NAME]
         self.assertIn(db.TAB_ACCOUNTS, tables)
@@ -69,9 +91,637 @@ class SmartSchedulerDBTest(unittest.TestCase):
                           (db.COL_STU_ID, db.COL_PSWRD_HASH, db.COL_SCHEDULE, db.COL_SUBJECTS)]
         self.assertEqual(all([i == [] for i in retrieved_data]), True)
 
+    def test_a15_cmd_timeout(self):
+        """TEST_CASE_ID A.1.5"""
+        with socket.socket() as silent_server:
+            silent_server.bind(("127.0.0.1", 0))
+            silent_server.listen()
+            silent_addr = "http://127.0.0.1:%d/" % silent_server.getsockname()[1]
+            self.assertRaises(CommonDatabaseError, SmartSchedulerDB, silent_addr, timeout=0.5)
+
+    def test_a16_persistent_connection(self):
+        """TEST_CASE_ID A.1.6"""
+        transport = HTTPTransport(self.test_server, pool_size=1)
+        db = SmartSchedulerDB(self.test_server, transport=transport)
+        for _ in range(5):
+            db.retrieve_all(db.TAB_SUB_INFO)
+        pool_manager = transport.session.get_adapter(self.test_server).poolmanager
+        self.assertEqual(sum(pool_manager.pools[key].num_connections for key in pool_manager.pools.keys()), 1)
+        transport.close()
+
+    def test_a17_batch(self):
+        """TEST_CASE_ID A.1.7"""
+        db = SmartSchedulerDB(self.test_server)
+        test_data = self.test_a12_add_one_data()
+        upd_stmt = db.update_account_info_stmt(test_data[0], db.COL_SCHEDULE, "batch_sch")
+        bad_stmt = db.update_account_info_stmt(test_data[0], "Non_existent_column", "value")
+        query_stmt = db.query_account_info_stmt(test_data[0], db.COL_SCHEDULE)
+        results = db.batch([upd_stmt, bad_stmt, query_stmt])
+        self.assertEqual([db_err for _, db_err in results], [False, True, False])
+        self.assertEqual(results[2][0], [["batch_sch"]])
+        rollback_stmt = db.update_account_info_stmt(test_data[0], db.COL_SCHEDULE, "rolled_back_sch")
+        self.assertRaises(CommonDatabaseError, db.batch, [rollback_stmt, bad_stmt], transaction=True)
+        self.assertEqual(db.query_account_infos(test_data[0], [db.COL_STU_ID, db.COL_SCHEDULE]),
+                         [[test_data[0]], ["batch_sch"]])
+
+    def test_a18_account_snapshot(self):
+        """TEST_CASE_ID A.1.8"""
+        db = SmartSchedulerDB(self.test_server)
+        test_data = self.test_a12_add_one_data()
+        self.assertEqual(db.query_account(test_data[0]), AccountSnapshot(*test_data, "0"))
+        db.delete_account(test_data[0])
+        self.assertIsNone(db.query_account(test_data[0]))
+
+    def test_a19_revalidate_all(self):
+        """TEST_CASE_ID A.1.9"""
+        db = SmartSchedulerDB(self.test_server)
+        test_data_id = self.test_a12_add_one_data()[0]
+        rows, etag = db.revalidate_all(db.TAB_ACCOUNTS, None)
+        self.assertIn(test_data_id, [row[0] for row in rows])
+        self.assertEqual(db.revalidate_all(db.TAB_ACCOUNTS, etag), (None, etag))
+        db.delete_account(test_data_id)
+        rows, new_etag = db.revalidate_all(db.TAB_ACCOUNTS, etag)
+        self.assertNotEqual(new_etag, etag)
+        self.assertNotIn(test_data_id, [row[0] for row in rows])
+
+    def test_a110_session_conditional_write(self):
+        """TEST_CASE_ID A.1.10"""
+        db = SmartSchedulerDB(self.test_server)
+        test_data_id = self.test_a12_add_one_data()[0]
+        self.assertEqual(db.update_session_account_info(test_data_id, "1234", db.COL_SCHEDULE, "stale_sch"), False)
+        self.assertEqual(db.delete_session_account(test_data_id, "1234"), False)
+        self.assertEqual(db.query_account_info(test_data_id, db.COL_SCHEDULE), ["test_sch"])
+        self.assertEqual(db.update_session_account_info(test_data_id, "0", db.COL_SCHEDULE, "new_sch"), True)
+        self.assertEqual(db.query_account_info(test_data_id, db.COL_SCHEDULE), ["new_sch"])
+        self.assertEqual(db.delete_session_account(test_data_id, "0"), True)
+        self.assertIsNone(db.query_account(test_data_id))
+
+    def test_a111_concurrent_reads(self):
+        """TEST_CASE_ID A.1.11"""
+        db = SmartSchedulerDB(self.test_server)
+        test_ids = [self.test_a12_add_one_data()[0] for _ in range(8)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            accounts = list(pool.map(db.query_account, test_ids * 4))
+            infos = list(pool.map(lambda s_id: db.query_account_info(s_id, db.COL_STU_ID), test_ids * 4))
+        self.assertEqual([account.student_id for account in accounts], test_ids * 4)
+        self.assertEqual(infos, [[s_id] for s_id in test_ids * 4])
+        db.close()
+
+    def test_a112_retry_and_circuit_breaker(self):
+        """TEST_CASE_ID A.1.12"""
+        db = SmartSchedulerDB(self.test_server, retry_policy=RetryPolicy(max_retries=2, base_delay=0.01),
+                              breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60.0))
+        with socket.socket() as closed_server:
+            closed_server.bind(("127.0.0.1", 0))
+            closed_addr = "http://127.0.0.1:%d/" % closed_server.getsockname()[1]
+        db.transport = HTTPTransport(closed_addr)
+        self.assertRaises(CommonDatabaseError, db.query_account_info, "0000000000", db.COL_STU_ID)
+        self.assertEqual(db.resilience_stats(), {"breaker_state": CircuitBreaker.OPEN, "consecutive_failures": 3,
+                                                 "breaker_opened": 1, "retries": 2, "retry_giveups": 1})
+        self.assertRaises(CommonDatabaseError, db.update_account_info, "0000000000", db.COL_SCHEDULE, "sch")
+        self.assertEqual(db.breaker.failures, 3)
+        db.breaker.reset_timeout = 0.0
+
+        def corrupt_post(*_):
+            raise requests.exceptions.ContentDecodingError("corrupt gzip stream")
+        db.transport = HTTPTransport(self.test_server)
+        db.transport.post = corrupt_post
+        self.assertRaises(CommonDatabaseError, db.update_account_info, "0000000000", db.COL_SCHEDULE, "sch")
+        self.assertEqual(db.breaker.times_opened, 2)
+        db.transport = HTTPTransport(self.test_server)
+        self.assertEqual(db.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(db.query_account_info("0000000000", db.COL_STU_ID), [])
+        self.assertEqual(db.breaker.state, CircuitBreaker.CLOSED)
+        db.close()
+
+    def test_a113_compression(self):
+        """TEST_CASE_ID A.1.13"""
+        transport = HTTPTransport(self.test_server)
+        db = SmartSchedulerDB(self.test_server, transport=transport)
+        self.assertEqual(transport.server_accepts_gzip, True)
+        test_data = [str(randint(10 ** 9, 10 ** 10 - 1)), "test_pass_hash", "test_sch" * 1000, "test_subs"]
+        self.assertEqual(transport.__encode__({"value": test_data[2]})[1]["Content-Encoding"], "gzip")
+        db.new_account(*test_data)
+        self.assertEqual(db.query_account(test_data[0]), AccountSnapshot(*test_data, "0"))
+        raw_resp = requests.post(self.test_server, json=db.__cmd_json__(*db.query_account_stmt(test_data[0]), False),
+                                 headers={"Accept-Encoding": "gzip"}, stream=True)
+        self.assertEqual(raw_resp.headers["Content-Encoding"], "gzip")
+        self.assertLess(int(raw_resp.headers["Content-Length"]), len(test_data[2]))
+        corrupt_resp = requests.post(self.test_server, data=b"\x1f\x8b\x08\x00corrupt",
+                                     headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+        self.assertEqual(corrupt_resp.status_code, 400)
+        uncompressed_db = SmartSchedulerDB(self.test_server, transport=HTTPTransport(self.test_server,
+                                                                                     compress_threshold=None))
+        self.assertEqual(uncompressed_db.query_account(test_data[0]), AccountSnapshot(*test_data, "0"))
+        db.delete_account(test_data[0])
+        db.close()
+        uncompressed_db.close()
+
+    def test_a114_binary_codec(self):
+        """TEST_CASE_ID A.1.14"""
+        test_objs = [None, True, False, 0, 127, -32, -33, 300, -70000, 2 ** 40, 1.5, "", "é" * 40, "x" * 70000,
+                     [], list(range(20)), {"db_ret": [["a", "b"], ["ü", "d" * 300]], "db_err": False},
+                     [["a", "b"], ["c"]], [["a", 1]], {str(i): i for i in range(20)}]
+        for test_obj in test_objs:
+            self.assertEqual(BinaryCodec.decode(BinaryCodec.encode(test_obj)), test_obj)
+        self.assertRaises(ValueError, BinaryCodec.decode, BinaryCodec.encode([1, 2])[:-1])
+        db = SmartSchedulerDB(self.test_server, transport=HTTPTransport(self.test_server, codec=BinaryCodec))
+        test_data = [str(randint(10 ** 9, 10 ** 10 - 1)), "test_pass_hash", "test_sch", "test_subs"]
+        db.new_account(*test_data)
+        self.assertEqual(db.query_account(test_data[0]), AccountSnapshot(*test_data, "0"))
+        self.assertEqual(db.update_session_account_info(test_data[0], "0", db.COL_SCHEDULE, "new_sch"), True)
+        rows, etag = db.revalidate_all(db.TAB_ACCOUNTS, None)
+        self.assertIn([*test_data[:2], "new_sch", *test_data[3:], "0"], rows)
+        db.delete_account(test_data[0])
+        db.close()
+        unsupported_resp = requests.post(self.test_server, data=b"cmd", headers={"Content-Type": "text/plain"})
+        self.assertEqual(unsupported_resp.status_code, 415)
+        self.assertEqual(requests.post(self.test_server, json={"cmd": "SELECT 1"}).status_code, 400)
+
+    def test_a115_incremental_sub_sync(self):
+        """TEST_CASE_ID A.1.15"""
+        db = SmartSchedulerDB(self.test_server)
+        db.upd_sub_list()
+        with open("./test/test_server/test_subjects.csv") as sub_f:
+            test_subs = sorted([sub["sub_code"], sub["sub_name"]] for sub in csv.DictReader(sub_f))
+        self.assertEqual(sorted(db.retrieve_all(db.TAB_SUB_INFO)), test_subs)
+        db.__exec_cmd__(Op("subjects.upsert"), ["TEST0000", "Stale subject"])
+        db.__exec_cmd__(Op("subjects.upsert"), [test_subs[0][0], "Renamed subject"])
+        db.upd_sub_list()
+        self.assertIn(["TEST0000", "Stale subject"], db.retrieve_all(db.TAB_SUB_INFO))
+        conn = sqlite3.connect(self.test_db)
+        conn.execute(f"UPDATE {SQLiteEngine.TAB_SYNC_STATE} SET Digest=NULL")
+        conn.commit()
+        conn.close()
+        db.upd_sub_list()
+        self.assertEqual(sorted(db.retrieve_all(db.TAB_SUB_INFO)), test_subs)
+        db.close()
+
+    def test_a116_statement_registry(self):
+        """TEST_CASE_ID A.1.16"""
+        self.assertEqual(resolve("account.set_col", SmartSchedulerDB.COL_SCHEDULE),
+                         "UPDATE Accounts SET Schedule=? WHERE Student_ID=?")
+        self.assertRaises(ValueError, resolve, "account.set_col", "Non_existent_column")
+        self.assertRaises(ValueError, resolve, "account.get", SmartSchedulerDB.COL_SCHEDULE)
+        self.assertRaises(ValueError, resolve, "account.drop")
+        db = SmartSchedulerDB(self.test_server)
+        test_data = [str(randint(10 ** 9, 10 ** 10 - 1)), "test_pass_hash", "test_sch", "test_subs"]
+        request_json = db.__cmd_json__(*db.update_account_info_stmt(test_data[0], db.COL_SCHEDULE, "new_sch"), False)
+        self.assertEqual(request_json, {"op": "account.set_col", "name": db.COL_SCHEDULE,
+                                        "cmd_params": ["new_sch", test_data[0]]})
+        db.new_account(*test_data)
+        db.__exec_cmd__(*db.update_account_info_stmt(test_data[0], db.COL_SCHEDULE, "new_sch"))
+        self.assertEqual(db.query_account_info(test_data[0], db.COL_SCHEDULE), ["new_sch"])
+        self.assertRaises(CommonDatabaseError, db.__exec_cmd__, Op("account.drop"), [test_data[0]])
+        self.assertRaises(CommonDatabaseError, db.query_account_info, test_data[0], "Non_existent_column")
+        self.assertRaises(CommonDatabaseError, db.__exec_cmd__, f"DELETE FROM {db.TAB_ACCOUNTS}", None)
+        db.delete_account(test_data[0])
+        db.close()
+
+    def test_a117_paginated_and_streamed_retrieval(self):
+        """TEST_CASE_ID A.1.17"""
+        db = SmartSchedulerDB(self.test_server)
+        s_ids = sorted({str(randint(10 ** 9, 10 ** 10 - 1)) for _ in range(40)})
+        db.batch([db.new_account_stmt(s_id, "test_pass_hash", "test_sch", "test_subs") for s_id in s_ids],
+                 transaction=True)
+        all_rows = sorted(db.retrieve_all(db.TAB_ACCOUNTS))
+        rows, after = db.retrieve_page(db.TAB_ACCOUNTS, limit=7)
+        self.assertEqual((rows, after), (all_rows[:7], all_rows[6][0]))
+        self.assertEqual(db.retrieve_page(db.TAB_ACCOUNTS, after, 7)[0], all_rows[7:14])
+        self.assertEqual(db.retrieve_page(db.TAB_ACCOUNTS, all_rows[-1][0], 7), ([], None))
+        self.assertEqual(list(db.iter_all(db.TAB_ACCOUNTS, page_size=7)), all_rows)
+        self.assertEqual(sorted(db.stream_all(db.TAB_ACCOUNTS)), all_rows)
+        self.assertRaises(CommonDatabaseError, list, db.stream_all("Non_existent_table"))
+        db.batch([db.delete_account_stmt(s_id) for s_id in s_ids], transaction=True)
+        db.close()
+
+    def test_a118_metrics(self):
+        """TEST_CASE_ID A.1.18"""
+        histogram = LatencyHistogram()
+        for latency in range(1, 1001):
+            histogram.record(latency / 1000)
+        for pct in (50, 95, 99):
+            self.assertAlmostEqual(histogram.percentile(pct), pct / 100, delta=pct / 100 * 0.05)
+        metrics = Metrics()
+        db = SmartSchedulerDB(self.test_server, metrics=metrics)
+        test_data = [str(randint(10 ** 9, 10 ** 10 - 1)), "test_pass_hash", "test_sch", "test_subs"]
+        with db.track("lifecycle"):
+            db.new_account(*test_data)
+            db.query_account_infos(test_data[0], [db.COL_SCHEDULE, db.COL_SUBJECTS])
+            self.assertRaises(CommonDatabaseError, db.query_account_info, test_data[0], "Non_existent_column")
+            db.delete_account(test_data[0])
+        ops = metrics.snapshot()["operations"]
+        self.assertEqual(ops["lifecycle"]["round_trips"], 4)
+        self.assertEqual(ops["account.get_col"]["errors"], 1)
+        self.assertEqual(ops["batch(account.get_col)"]["count"], 1)
+        lifecycle_ops = ["account.new", "batch(account.get_col)", "account.get_col", "account.delete"]
+        self.assertEqual(ops["lifecycle"]["bytes_sent"], sum(ops[op]["bytes_sent"] for op in lifecycle_ops))
+        self.assertGreater(ops["account.new"]["bytes_sent"], 0)
+        db.close()
+
+    def test_a119_metrics_endpoint(self):
+        """TEST_CASE_ID A.1.19"""
+        db = SmartSchedulerDB(self.test_server)
+        db.query_account("0000000000")
+        self.assertRaises(CommonDatabaseError, db.query_account_info, "0000000000", "Non_existent_column")
+        db.close()
+        metrics_resp = requests.get(self.test_server + "metrics")
+        self.assertEqual(metrics_resp.status_code, 200)
+        self.assertTrue(metrics_resp.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+        for line in ('smartscheduler_requests_total{op="account.get"}', 'smartscheduler_db_errors_total{type=',
+                     'smartscheduler_request_duration_seconds_bucket{op="account.get",le="+Inf"}',
+                     "smartscheduler_lock_wait_seconds_count", "smartscheduler_requests_in_flight",
+                     "smartscheduler_requests_per_second", "smartscheduler_cache_hit_ratio",
+                     'smartscheduler_pool_connections{state="open"}'):
+            self.assertIn(line, metrics_resp.text)
+        health_resp = requests.get(self.test_server + "health")
+        self.assertEqual((health_resp.status_code, health_resp.text), (200, "ok\n"))
+        self.assertEqual(requests.get(self.test_server + "non_existent").status_code, 404)
+
+    def test_a120_normalized_schedules(self):
+        """TEST_CASE_ID A.1.20"""
+        db = SmartSchedulerDB(self.test_server)
+        s_id = str(randint(10 ** 9, 10 ** 10 - 1))
+        test_sch = {**EMPTY_SCHEDULE, "Monday": ["EEL1166_Lecture_Monday_0900_1100"]}
+        test_subs = {"EEL1166_Lecture": "lecture_link", "EEL1166_Tutorial": "tutorial_link"}
+        db.new_account(s_id, "test_pass_hash", str(test_sch), str(test_subs))
+        for _ in range(2):
+            self.assertIn(s_id, db.class_students("EEL1166", "Lecture", "Monday", "0900"))
+        self.assertIn([s_id, "Lecture"], db.subject_students("EEL1166"))
+        self.assertIn([s_id, "Tutorial"], db.subject_students("EEL1166"))
+        test_sch.update({"Monday": [], "Tuesday": ["EEL1166_Tutorial_Tuesday_1000_1100", "malformed_class_id"]})
+        db.update_account_info(s_id, db.COL_SCHEDULE, str(test_sch))
+        self.assertNotIn(s_id, db.class_students("EEL1166", "Lecture", "Monday", "0900"))
+        self.assertEqual(db.student_classes(s_id), [[s_id, "EEL1166", "Tutorial", "Tuesday", "1000", "1100"]])
+        db.update_account_info(s_id, db.COL_SUBJECTS, "test_subs")
+        self.assertNotIn(s_id, [row[0] for row in db.subject_students("EEL1166")])
+        db.delete_account(s_id)
+        self.assertEqual(db.student_classes(s_id), [])
+        db.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        remove_db(cls.test_db)
+
+
+class EmbeddedSmartSchedulerDBTest(SmartSchedulerDBTest):
+    """TEST A.3"""
+
+    test_db = "./test/Embedded.db"
+    test_server = "sqlite:///./test/Embedded.db?subjects=./test/test_server/test_subjects.csv"
+
+    @unittest.skip("HTTP transport only")
+    def test_a16_persistent_connection(self):
+        pass
+
+    @unittest.skip("HTTP transport only")
+    def test_a112_retry_and_circuit_breaker(self):
+        pass
+
+    @unittest.skip("HTTP transport only")
+    def test_a113_compression(self):
+        pass
+
+    @unittest.skip("HTTP transport only")
+    def test_a114_binary_codec(self):
+        pass
+
+    @unittest.skip("no bytes are transferred in process")
+    def test_a118_metrics(self):
+        pass
+
+    @unittest.skip("HTTP transport only")
+    def test_a119_metrics_endpoint(self):
+        pass
+
+    def test_a37_schedule_migration(self):
+        """TEST_CASE_ID A.3.7"""
+        migrate_db = "./test/Migrate.db"
+        conn = sqlite3.connect(migrate_db)
+        conn.execute(resolve("accounts.create"))
+        test_sch = {**EMPTY_SCHEDULE, "Friday": ["EEL1166_Lecture_Friday_1400_1600"]}
+        conn.executemany(resolve("account.new"), [
+            ["1000000000", "test_hash", str(test_sch), str({"EEL1166_Lecture": "lecture_link"}), "0"],
+            ["1000000001", "test_hash", "test_sch", "test_subs", "0"]
+        ])
+        conn.commit()
+        conn.close()
+        for _ in range(2):
+            db = SmartSchedulerDB(f"sqlite:///{migrate_db}")
+            self.assertEqual(db.student_classes("1000000000"),
+                             [["1000000000", "EEL1166", "Lecture", "Friday", "1400", "1600"]])
+            self.assertEqual(db.subject_students("EEL1166"), [["1000000000", "Lecture"]])
+            self.assertEqual(db.student_classes("1000000001"), [])
+            db.close()
+        conn = sqlite3.connect(migrate_db)
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], 1)
+        conn.execute("UPDATE Accounts SET Schedule=? WHERE Student_ID=?",
+                     [str(EMPTY_SCHEDULE), "1000000000"])
+        conn.commit()
+        conn.close()
+        db = SmartSchedulerDB(f"sqlite:///{migrate_db}")
+        self.assertEqual(db.student_classes("1000000000"), [])
+        self.assertEqual(db.subject_students("EEL1166"), [["1000000000", "Lecture"]])
+        db.close()
+        remove(migrate_db)
+
+    def test_a31_embedded_transport(self):
+        """TEST_CASE_ID A.3.1"""
+        db = SmartSchedulerDB(self.test_server)
+        self.assertIsInstance(db.transport, EmbeddedTransport)
+        self.assertEqual((db.transport.engine.path, db.transport.engine.subjects_file),
+                         (self.test_db, "./test/test_server/test_subjects.csv"))
+        self.assertIsInstance(SmartSchedulerDB(self.test_server.split("?")[0]).transport, EmbeddedTransport)
+        db.close()
+
+    def test_a32_connection_pool(self):
+        """TEST_CASE_ID A.3.2"""
+        pool_db = "./test/Pool.db"
+        pool = ConnectionPool(pool_db, 2)
+        with pool.connection() as conn:
+            conn.execute("CREATE TABLE Pooled (Value text)")
+            with pool.connection() as other_conn:
+                self.assertIsNot(conn, other_conn)
+        with pool.connection() as reused_conn:
+            self.assertIn(reused_conn, (conn, other_conn))
+            reused_conn.execute("BEGIN")
+            reused_conn.execute("INSERT INTO Pooled VALUES ('uncommitted')")
+        self.assertEqual(pool.stats(), {"pool_size": 2, "open_connections": 2, "idle_connections": 2})
+        with pool.connection() as conn:
+            self.assertFalse(conn.in_transaction)
+            self.assertEqual(conn.execute("SELECT * FROM Pooled").fetchall(), [])
+        remove(pool_db)
+        with pool.connection() as new_conn:
+            self.assertNotIn(new_conn, (conn, other_conn))
+            self.assertEqual(new_conn.execute("SELECT name FROM sqlite_master WHERE name='Pooled'").fetchall(), [])
+        pool.close()
+        self.assertEqual(pool.stats()["open_connections"], 0)
+        unpooled = ConnectionPool(pool_db, 0)
+        with unpooled.connection():
+            self.assertEqual(unpooled.stats()["open_connections"], 1)
+        self.assertEqual(unpooled.stats()["open_connections"], 0)
+        remove(pool_db)
+
+    def test_a33_storage_profile(self):
+        """TEST_CASE_ID A.3.3"""
+        profile_db = "./test/Profile.db"
+        with self.assertRaises(ValueError):
+            StorageProfile(journal_mode="fast")
+        pool = ConnectionPool(profile_db, 1, StorageProfile(busy_timeout=1234))
+        with pool.connection() as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchall(), [["wal"]])
+            self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchall(), [[1234]])
+            self.assertEqual(conn.execute("PRAGMA synchronous").fetchall(), [[1]])
+        pool.close()
+        dbs = [SmartSchedulerDB(transport=EmbeddedTransport(profile_db, profile=StorageProfile())) for _ in range(8)]
+        test_ids = [str(10 ** 9 + i) for i in range(len(dbs))]
+        for test_id in test_ids:
+            dbs[0].new_account(test_id, "test_hash", str({}), str({}))
+
+        def log_in_repeatedly(i: int) -> int:
+            errors = 0
+            for session_id in range(50):
+                try:
+                    dbs[i].update_account_info(test_ids[i], dbs[i].COL_SESSION_ID, str(session_id))
+                    dbs[i].query_account(test_ids[i - 1])
+                except CommonDatabaseError:
+                    errors += 1
+            return errors
+
+        with ThreadPoolExecutor(len(dbs)) as executor:
+            self.assertEqual(sum(executor.map(log_in_repeatedly, range(len(dbs)))), 0)
+        self.assertEqual(dbs[0].query_account_info(test_ids[-1], dbs[0].COL_SESSION_ID)[0], "49")
+        for db in dbs:
+            db.close()
+        remove(profile_db)
+
+    def test_a34_result_cache(self):
+        """TEST_CASE_ID A.3.4"""
+        cache_db = "./test/Cache.db"
+        engine = SQLiteEngine(cache_db, cache_bytes=ResultCache.DEF_MAX_BYTES, allow_sql=True)
+        for op in ("accounts.create", "subjects.create"):
+            engine.execute({"op": op, "cmd_params": None})
+        engine.execute({"op": "account.new", "cmd_params": ["1000000000", "test_hash", "test_sch", "test_subs", "0"]})
+        get_subjects = {"op": "subjects.all", "cmd_params": None}
+        get_account = {"op": "account.get", "cmd_params": ["1000000000"]}
+        self.assertEqual(engine.execute(get_subjects), {"db_ret": [], "db_err": False})
+        engine.execute(get_account)["db_ret"][0].append("mutated")
+        self.assertEqual(engine.execute(get_subjects), {"db_ret": [], "db_err": False})
+        self.assertEqual(engine.execute(get_account)["db_ret"], [["1000000000", "test_hash", "test_sch", "test_subs",
+                                                                  "0"]])
+        self.assertEqual({key: engine.stats()["cache"][key] for key in ("hits", "misses", "entries")},
+                         {"hits": 2, "misses": 2, "entries": 2})
+        engine.execute({"op": "subjects.upsert", "cmd_params": ["ECE2056", "Data Comm and Net"]})
+        self.assertEqual(engine.execute(get_subjects)["db_ret"], [["ECE2056", "Data Comm and Net"]])
+        self.assertEqual(engine.execute(get_account)["db_ret"][0][0], "1000000000")
+        self.assertEqual({key: engine.stats()["cache"][key] for key in ("hits", "misses", "invalidations")},
+                         {"hits": 3, "misses": 3, "invalidations": 1})
+        batch_ret = engine.execute({"batch": [{"op": "account.set_col", "name": "Schedule",
+                                               "cmd_params": ["new_sch", "1000000000"]}, get_account],
+                                    "transaction": True})["db_ret"]
+        self.assertEqual(batch_ret[1][0][0][2], "new_sch")
+        self.assertEqual(engine.execute(get_account)["db_ret"][0][2], "new_sch")
+        get_joined = {"cmd": "SELECT Student_ID, Subject_code FROM Accounts, Subjects", "cmd_params": None}
+        self.assertEqual(engine.stats()["cache"]["entries"], 2)
+        self.assertEqual(engine.execute(get_joined)["db_ret"], [["1000000000", "ECE2056"]])
+        self.assertEqual(engine.stats()["cache"]["entries"], 0)
+        engine.execute({"op": "subjects.upsert", "cmd_params": ["EEL1166", "Circuit Theory"]})
+        self.assertEqual(len(engine.execute(get_joined)["db_ret"]), 2)
+        self.assertEqual(access("changes"), (True, frozenset()))
+        self.assertEqual(access("account.new"), (False, frozenset({"Accounts", "Registrations", "Classes"})))
+        engine.close()
+        remove(cache_db)
+        cache = ResultCache(max_bytes=100)
+        generations = cache.generations()
+        cache.invalidate(frozenset({"subjects"}))
+        cache.put("SELECT * FROM Subjects", None, frozenset({"subjects"}), [["stale"]], generations)
+        self.assertIsNone(cache.get("SELECT * FROM Subjects", None))
+        for s_id in range(3):
+            cache.put("SELECT * FROM Accounts WHERE Student_ID=?", [s_id], frozenset({"accounts"}), [["x" * 30]],
+                      cache.generations())
+        self.assertEqual((cache.stats()["entries"], cache.stats()["evictions"]), (1, 2))
+        self.assertEqual(cache.get("SELECT * FROM Accounts WHERE Student_ID=?", [2]), [["x" * 30]])
+        cache.invalidate(None)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_a35_group_commit(self):
+        """TEST_CASE_ID A.3.5"""
+        group_db = "./test/Group.db"
+        engine = SQLiteEngine(group_db, profile=StorageProfile(), group_commit=16, group_commit_delay=0.01)
+        engine.execute({"op": "accounts.create", "cmd_params": None})
+
+        def new_account(i: int) -> bool:
+            return engine.execute({"op": "account.new",
+                                   "cmd_params": [str(10 ** 9 + i % 40), "test_hash", "sch", "subs", "0"]})["db_err"]
+
+        with ThreadPoolExecutor(16) as executor:
+            failed = list(executor.map(new_account, range(64)))
+        self.assertEqual(failed.count(True), 24)
+        self.assertEqual(len(engine.execute({"op": "accounts.all", "cmd_params": None})["db_ret"]), 40)
+        stats = engine.stats()["group_commit"]
+        self.assertEqual(stats["writes"], 65)
+        self.assertLess(stats["batches"], stats["writes"])
+        self.assertLessEqual(stats["largest_batch"], 16)
+        engine.close()
+        self.assertEqual(engine.execute({"op": "account.delete", "cmd_params": ["1000000000"]})["db_err"], True)
+        remove(group_db)
+
+    def test_a36_server_metrics(self):
+        """TEST_CASE_ID A.3.6"""
+        metrics_db = "./test/Metrics.db"
+        engine = SQLiteEngine(metrics_db, profile=StorageProfile(), cache_bytes=ResultCache.DEF_MAX_BYTES)
+        engine.execute({"op": "accounts.create", "cmd_params": None})
+        new_account = {"op": "account.new", "cmd_params": ["1000000000", "test_hash", "sch", "subs", "0"]}
+        self.assertEqual(engine.execute(new_account)["db_err"], False)
+        self.assertEqual(engine.execute(new_account)["db_err"], True)
+        self.assertEqual(engine.execute({"op": "account.drop", "cmd_params": None})["db_err"], True)
+        self.assertEqual(engine.execute({"batch": [{"op": 'x"\n', "cmd_params": None}]})["db_err"], False)
+        engine.execute({"batch": [new_account, {"op": "account.delete", "cmd_params": ["1000000000"]}],
+                        "transaction": True})
+        for _ in range(2):
+            engine.execute({"op": "accounts.all", "cmd_params": None})
+        self.assertEqual(list(engine.stream({"op": "accounts.all", "cmd_params": None}))[-1]["db_ret"], 1)
+        snapshot = engine.metrics.snapshot()["operations"]
+        self.assertEqual((snapshot["account.new"]["count"], snapshot["account.new"]["errors"]), (2, 1))
+        self.assertEqual((snapshot["unknown"]["count"], snapshot["unknown"]["errors"]), (2, 1))
+        self.assertEqual(snapshot["stream(accounts.all)"]["count"], 1)
+        self.assertEqual(engine.metrics.in_flight, 0)
+        exposition = engine.exposition()
+        for line in ('smartscheduler_db_errors_total{type="IntegrityError"} 2',
+                     'smartscheduler_db_errors_total{type="ValueError"} 2',
+                     "smartscheduler_lock_wait_seconds_count 3", "smartscheduler_cache_hits_total 1",
+                     'smartscheduler_requests_total{op="batch(account.new,account.delete)"} 1'):
+            self.assertIn(line + "\n", exposition)
+        self.assertEqual(engine.accepts({"cmd": "SELECT 1", "cmd_params": None}), False)
+        self.assertEqual(engine.execute({"cmd": "SELECT 1", "cmd_params": None})["db_err"], True)
+        self.assertEqual(engine.health(), (True, "ok"))
+        engine.close()
+        remove(metrics_db)
+        metrics = ServerMetrics()
+        for latency in (0.0005, 0.002, 0.2):
+            metrics.finish_request("account.get", metrics.start_request() - latency, False)
+        histogram = [line for line in metrics.exposition().splitlines() if line.startswith(
+            "smartscheduler_request_duration_seconds_bucket")]
+        self.assertEqual(histogram[-1], 'smartscheduler_request_duration_seconds_bucket{op="account.get",le="+Inf"} 3')
+        self.assertIn('smartscheduler_request_duration_seconds_bucket{op="account.get",le="0.001"} 1', histogram)
+        metrics.finish_request('sql\\"\n', metrics.start_request(), True)
+        self.assertIn('smartscheduler_request_failures_total{op="sql\\\\\\"\\n"} 1\n', metrics.exposition())
+
+
+class AsyncServerSmartSchedulerDBTest(SmartSchedulerDBTest):
+    """TEST A.4"""
+
+    test_db = "./test/test_server/Async.db"
+    test_server = "http://127.0.0.1:8766/"
+
+    @classmethod
+    def setUpClass(cls):
+        from test.test_server.test_server import AsyncRequestServer
+        cls.engine = SQLiteEngine(cls.test_db, "./test/test_server/test_subjects.csv", profile=StorageProfile(),
+                                  cache_bytes=ResultCache.DEF_MAX_BYTES, group_commit=WriteCoalescer.DEF_MAX_BATCH)
+        cls.server = AsyncRequestServer(cls.engine, workers=4, quiet=True)
+        cls.loop = asyncio.new_event_loop()
+        cls.loop.run_until_complete(cls.server.start("127.0.0.1", 8766))
+        cls.server_thread = Thread(target=cls.loop.run_forever, daemon=True)
+        cls.server_thread.start()
+        super().setUpClass()
+
+    def test_a41_queue_limit(self):
+        """TEST_CASE_ID A.4.1"""
+        db = SmartSchedulerDB(self.test_server)
+        with ThreadPoolExecutor(16) as executor:
+            results = list(executor.map(lambda _: db.retrieve_all(db.TAB_SUB_INFO), range(64)))
+        self.assertEqual(len(set(map(str, results))), 1)
+        self.assertEqual((self.server.queued, self.server.rejected), (0, 0))
+        self.server.max_queue = 0
+        try:
+            overload_resp = requests.post(self.test_server, json=db.__cmd_json__(*db.changes_stmt(), False))
+            self.assertEqual((overload_resp.status_code, overload_resp.headers["Retry-After"]), (503, "1"))
+            self.assertRaises(CommonDatabaseError, db.retrieve_all, db.TAB_SUB_INFO)
+            self.assertEqual(self.server.rejected, 2)
+        finally:
+            self.server.max_queue = self.server.DEF_MAX_QUEUE
+        self.assertEqual(db.retrieve_all(db.TAB_SUB_INFO), results[0])
+        db.close()
+
+    def test_a42_stalled_client(self):
+        """TEST_CASE_ID A.4.2"""
+        server_timeout, self.server.timeout = self.server.timeout, 0.2
+        try:
+            with socket.create_connection(("127.0.0.1", 8766), timeout=5) as stalled_client:
+                stalled_client.sendall(b"POST / HTTP/1.1\r\nContent-Type: application/json\r\n"
+                                       b"Content-Length: 100\r\n\r\n{")
+                self.assertEqual(stalled_client.recv(1024), b"")
+        finally:
+            self.server.timeout = server_timeout
+        self.assertEqual(self.server.in_flight, 0)
+
+    @classmethod
+    def tearDownClass(cls):
+        asyncio.run_coroutine_threadsafe(cls.server.close(), cls.loop).result()
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.server_thread.join()
+        cls.loop.close()
+        cls.engine.close()
+        super().tearDownClass()
+
+
+@unittest.skipUnless(hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT") and os.path.exists("/proc/self/task"),
+                     "pre-fork workers need fork(), SO_REUSEPORT and /proc")
+class PreforkServerSmartSchedulerDBTest(SmartSchedulerDBTest):
+    """TEST A.5"""
+
+    test_db = "./test/test_server/Prefork.db"
+    test_server = "http://127.0.0.1:8767/"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server_proc = subprocess.Popen([sys.executable, "test/test_server/test_server.py", "--workers", "2",
+                                            "--port", "8767", "--db", cls.test_db, "--quiet", "--drain-timeout", "5"],
+                                           stdout=subprocess.DEVNULL)
+        cls.wait_for_workers(2)
+        super().setUpClass()
+
+    @classmethod
+    def workers(cls) -> list:
+        with open(f"/proc/{cls.server_proc.pid}/task/{cls.server_proc.pid}/children") as children_f:
+            return [int(pid) for pid in children_f.read().split()]
+
+    @classmethod
+    def wait_for_workers(cls, count: int, exited_pid: int = None, timeout: float = 10.0) -> list:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                workers = cls.workers()
+                if len(workers) == count and exited_pid not in workers and \
+                        requests.get(cls.test_server + "health").status_code == 200:
+                    return workers
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.1)
+        raise TimeoutError("Pre-fork workers did not start.")
+
+    def test_a51_worker_restart(self):
+        """TEST_CASE_ID A.5.1"""
+        db = SmartSchedulerDB(self.test_server)
+        test_data = [str(randint(10 ** 9, 10 ** 10 - 1)), "test_pass_hash", "test_sch", "test_subs"]
+        db.new_account(*test_data)
+        crashed_pid = self.workers()[0]
+        os.kill(crashed_pid, signal.SIGKILL)
+        self.assertNotIn(crashed_pid, self.wait_for_workers(2, crashed_pid))
+        for _ in range(8):
+            self.assertEqual(requests.get(self.test_server + "health").text, "ok\n")
+        db.close()
+        db = SmartSchedulerDB(self.test_server)
+        self.assertEqual(db.query_account(test_data[0]), AccountSnapshot(*test_data, "0"))
+        db.delete_account(test_data[0])
+        db.close()
+
     @classmethod
     def tearDownClass(cls):
-        remove(cls.test_db)
+        cls.server_proc.send_signal(signal.SIGTERM)
+        cls.server_proc.wait(15)
+        super().tearDownClass()
 
 
 if __name__ == '__main__':
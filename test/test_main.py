@@ -1,10 +1,15 @@
 import datetime as dt
+import json
+import socket
 import unittest
 from os import remove
 from random import randint
 
 from smartscheduler.main import SmartScheduler, Subjects, Class, Schedule
 from smartscheduler.exceptions import CommonError
+from smartscheduler.metrics import Metrics
+from smartscheduler.transport import HTTPTransport
+from test import remove_db
 
 
 class SmartSchedulerTest(unittest.TestCase):
@@ -12,10 +17,13 @@ class SmartSchedulerTest(unittest.TestCase):
 
     smart_sch = None
     test_db = "./test/test_server/Test.db"
+    test_server = "http://127.0.0.1:8765/"
+    test_journal = "./test/Journal.db"
+    test_metrics = "./test/Metrics.jsonl"
 
     @classmethod
     def setUpClass(cls):
-        cls.smart_sch = SmartScheduler("http://127.0.0.1:8765/")
+        cls.smart_sch = SmartScheduler(cls.test_server)
 
     def setUp(self):
         self.unregistered_id = str(randint(10**9, 10**10 - 1))
@@ -88,9 +96,91 @@ class SmartSchedulerTest(unittest.TestCase):
         self.smart_sch.update_sub_list()
         self.assertEqual(self.smart_sch.db.retrieve_all(self.smart_sch.db.TAB_SUB_INFO), test_subs)
 
+    def test_c17_subjects_cache(self):
+        """TEST_CASE_ID C.1.7"""
+        subjects_info = self.smart_sch.get_subjects_info()
+        etag = self.smart_sch.subjects_cache.etag
+        self.assertEqual(self.smart_sch.db.revalidate_all(self.smart_sch.db.TAB_SUB_INFO, etag), (None, etag))
+        self.assertEqual(self.smart_sch.get_subjects_info(), subjects_info)
+        self.smart_sch.update_sub_list()
+        self.assertIsNone(self.smart_sch.subjects_cache.etag)
+        self.assertEqual(self.smart_sch.get_subjects_info(), subjects_info)
+        etag = self.smart_sch.subjects_cache.etag
+        self.smart_sch.subjects_cache.invalidate()
+        self.assertIsNone(self.smart_sch.subjects_cache.update(None, etag))
+        self.assertIsNone(self.smart_sch.subjects_cache.etag)
+        self.assertEqual(self.smart_sch.get_subjects_info(), subjects_info)
+
+    def test_c18_session_writes(self):
+        """TEST_CASE_ID C.1.8"""
+        student_id, pswrd = self.test_c11_sign_up()
+        self.smart_sch.login(student_id, pswrd)
+        self.smart_sch.update_schedule(Schedule.empty_schedule())
+        SmartScheduler(self.test_server).logout(remote_student_id=student_id)
+        self.assertRaises(CommonError, self.smart_sch.update_schedule, Schedule.empty_schedule())
+        self.assertRaises(CommonError, self.smart_sch.get_schedule)
+        self.assertEqual(self.smart_sch.__logged_in__(student_id), False)
+        self.assertRaises(CommonError, self.smart_sch.delete_acc)
+        self.assertEqual(self.smart_sch.__chk_s_id__(student_id), True)
+
+    def test_c19_write_journal(self):
+        """TEST_CASE_ID C.1.9"""
+        smart_sch = SmartScheduler(self.test_server, journal_path=self.test_journal)
+        student_id, pswrd = self.test_c11_sign_up()
+        smart_sch.login(student_id, pswrd)
+        schedule = Schedule(smart_sch)
+        server_transport = smart_sch.db.transport
+        with socket.socket() as closed_server:
+            closed_server.bind(("127.0.0.1", 0))
+            smart_sch.db.transport = HTTPTransport("http://127.0.0.1:%d/" % closed_server.getsockname()[1])
+        schedule.add_class(Class.from_id("EMT1016_Lecture_Monday_1000_1200"))
+        schedule.update_schedule()
+        self.assertEqual(smart_sch.journal.flush(), False)
+        self.assertEqual(len(smart_sch.journal.pending(student_id)), 1)
+        smart_sch.db.transport = server_transport
+        self.assertEqual(smart_sch.journal.flush(), True)
+        self.assertEqual(smart_sch.db.query_account_info(student_id, smart_sch.db.COL_SCHEDULE),
+                         [str(schedule.db_schedule)])
+        smart_sch.db.update_account_info(student_id, smart_sch.db.COL_SCHEDULE, str(Schedule.empty_schedule()))
+        smart_sch.update_schedule({"Monday": []})
+        self.assertEqual(smart_sch.journal.flush(), True)
+        self.assertEqual([entry.value for entry in smart_sch.journal.conflicts(student_id)], [str({"Monday": []})])
+        self.assertEqual(smart_sch.get_schedule(), Schedule.empty_schedule())
+        smart_sch.journal.record(student_id, smart_sch.session_id, "Bogus_col", "bogus", "bogus")
+        smart_sch.journal.record(student_id, smart_sch.session_id, smart_sch.db.COL_SUBJECTS, "{}", "{}")
+        self.assertEqual(smart_sch.journal.flush(), True)
+        self.assertEqual([entry.column for entry in smart_sch.journal.conflicts(student_id)],
+                         [smart_sch.db.COL_SCHEDULE, "Bogus_col"])
+        self.assertEqual(smart_sch.journal.pending(student_id), [])
+        smart_sch.delete_acc()
+        self.assertEqual(smart_sch.journal.conflicts(student_id), [])
+        smart_sch.journal.close()
+
+    def test_c110_metrics(self):
+        """TEST_CASE_ID C.1.10"""
+        metrics = Metrics(dump_path=self.test_metrics)
+        smart_sch = SmartScheduler(self.test_server, metrics=metrics)
+        student_id, pswrd = self.test_c11_sign_up()
+        smart_sch.login(student_id, pswrd)
+        smart_sch.update_schedule(Schedule.empty_schedule())
+        calls = metrics.snapshot()["operations"]
+        self.assertEqual((calls["login"]["count"], calls["login"]["round_trips"]), (1, 2))
+        self.assertGreater(calls["login"]["bytes_received"], 0)
+        self.assertEqual(calls["update_schedule"]["errors"], 0)
+        self.assertEqual(calls["account.get"]["count"], calls["account.get"]["round_trips"])
+        self.assertLessEqual(calls["login"]["latency_ms"]["p50"], calls["login"]["latency_ms"]["max"])
+        smart_sch.delete_acc()
+        metrics.dump()
+        metrics.reset()
+        self.assertEqual(metrics.snapshot()["operations"], {})
+        with open(self.test_metrics) as metrics_f:
+            self.assertIn("delete_acc", json.loads(metrics_f.readline())["operations"])
+
     @classmethod
     def tearDownClass(cls):
-        remove(cls.test_db)
+        remove_db(cls.test_db)
+        remove(cls.test_journal)
+        remove(cls.test_metrics)
 
 
 class SubjectsTest(unittest.TestCase):
@@ -98,11 +188,12 @@ class SubjectsTest(unittest.TestCase):
 
     smart_sch = None
     test_db = "./test/test_server/Test.db"
+    test_server = "http://127.0.0.1:8765/"
     student_id, pswrd = str(randint(10**9, 10**10 - 1)), "test_password"
 
     @classmethod
     def setUpClass(cls):
-        cls.smart_sch = SmartScheduler("http://127.0.0.1:8765/")
+        cls.smart_sch = SmartScheduler(cls.test_server)
         cls.smart_sch.sign_up(cls.student_id, cls.pswrd, cls.pswrd)
         cls.smart_sch.login(cls.student_id, cls.pswrd)
 
@@ -166,7 +257,7 @@ class SubjectsTest(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
-        remove(cls.test_db)
+        remove_db(cls.test_db)
 
 
 class ClassTest(unittest.TestCase):
@@ -197,12 +288,13 @@ class ScheduleTest(unittest.TestCase):
 
     smart_sch = None
     test_db = "./test/test_server/Test.db"
+    test_server = "http://127.0.0.1:8765/"
     student_id, pswrd = str(randint(10**9, 10**10 - 1)), "test_password"
     test_class_id = "EMT1016_Lecture_Monday_1000_1200"
 
     @classmethod
     def setUpClass(cls):
-        cls.smart_sch = SmartScheduler("http://127.0.0.1:8765/")
+        cls.smart_sch = SmartScheduler(cls.test_server)
         cls.smart_sch.sign_up(cls.student_id, cls.pswrd, cls.pswrd)
         cls.smart_sch.login(cls.student_id, cls.pswrd)
 
@@ -369,9 +461,51 @@ class ScheduleTest(unittest.TestCase):
         self.schedule.update_curr_class_link(test_class_info[0])
         self.assertEqual(self.smart_sch.curr_class_link, "test_link")
 
+    def test_c415_shared_account_data(self):
+        """TEST_CASE_ID C.4.15"""
+        account_data = self.smart_sch.get_account_data()
+        schedule = Schedule(self.smart_sch, account_data)
+        subjects = Subjects(self.smart_sch, account_data)
+        self.assertEqual(schedule.reg_subjects, subjects.reg_subjects)
+        self.assertEqual(schedule.db_schedule, self.smart_sch.get_schedule())
+        self.assertEqual(subjects.subjects_info, self.smart_sch.get_subjects_info())
+
     @classmethod
     def tearDownClass(cls):
-        remove(cls.test_db)
+        remove_db(cls.test_db)
+
+
+class EmbeddedSmartSchedulerTest(SmartSchedulerTest):
+    """TEST C.5"""
+
+    test_db = "./test/Embedded.db"
+    test_server = "sqlite:///./test/Embedded.db?subjects=./test/test_server/test_subjects.csv"
+
+    @unittest.skip("HTTP transport only")
+    def test_c19_write_journal(self):
+        pass
+
+    @unittest.skip("no bytes are transferred in process")
+    def test_c110_metrics(self):
+        pass
+
+    @classmethod
+    def tearDownClass(cls):
+        remove_db(cls.test_db)
+
+
+class EmbeddedSubjectsTest(SubjectsTest):
+    """TEST C.6"""
+
+    test_db = "./test/Embedded.db"
+    test_server = "sqlite:///./test/Embedded.db?subjects=./test/test_server/test_subjects.csv"
+
+
+class EmbeddedScheduleTest(ScheduleTest):
+    """TEST C.7"""
+
+    test_db = "./test/Embedded.db"
+    test_server = "sqlite:///./test/Embedded.db?subjects=./test/test_server/test_subjects.csv"
 
 
 if __name__ == '__main__':
@@ -1,87 +1,541 @@
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-import csv
+from os import path
+from threading import Condition, Thread
+import asyncio
+import gzip
 import json
-import sqlite3
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+import zlib
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..", "..")))
+from smartscheduler.codec import JSONCodec, codec_for  # noqa: E402
+from smartscheduler.engine import (ConnectionPool, ResultCache, SQLiteEngine, StorageProfile,  # noqa: E402
+                                   WriteCoalescer)
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def print_request(args: dict):
+    if "batch" in args:
+        for stmt in args["batch"]:
+            print(f"SQL cmd: {stmt.get('op', stmt.get('cmd', ''))}\n params: {stmt.get('cmd_params', None)}")
+    else:
+        print(f"SQL cmd: {args.get('op', args.get('cmd', ''))}\n params: {args.get('cmd_params', None)}")
+
+
+def encode_db_resp(resp_json: dict, content_type: str or None, accept_encoding: str or None,
+                   compress_threshold: int) -> tuple:
+    codec = codec_for(content_type) or JSONCodec
+    resp_body: bytes = codec.encode(resp_json)
+    content_encoding: str or None = None
+    if len(resp_body) >= compress_threshold and "gzip" in (accept_encoding or ""):
+        resp_body = gzip.compress(resp_body, 6)
+        content_encoding = "gzip"
+    return resp_body, content_encoding, codec.CONTENT_TYPE
+
+
+def encode_stream_item(rows: list or dict) -> bytes:
+    if type(rows) is dict:
+        return (json.dumps(rows) + "\n").encode("utf-8")
+    return "".join(json.dumps(row) + "\n" for row in rows).encode("utf-8")
+
+
+def get_resp(engine: SQLiteEngine, target: str) -> tuple:
+    route: str = target.split("?", 1)[0]
+    if route == "/metrics":
+        return 200, engine.exposition().encode("utf-8"), METRICS_CONTENT_TYPE
+    if route == "/health":
+        healthy, detail = engine.health()
+        return 200 if healthy else 503, (detail + "\n").encode("utf-8"), "text/plain; charset=utf-8"
+    return 404, b"", None
 
 
 class HandleRequests(BaseHTTPRequestHandler):
 
-    @staticmethod
-    def __db_cmd__(cmd: str, params: list, exc_many: bool) -> tuple:
-        conn = None
-        db_err = False
-        db_ret = ""
-        try:
-            conn = sqlite3.connect("./test/test_server/Test.db")
-            curs = conn.cursor()
-            if exc_many:
-                curs.executemany(cmd, params)
-            else:
-                curs.execute(cmd, params) if params is not None else curs.execute(cmd)
-        except (sqlite3.IntegrityError, sqlite3.OperationalError, sqlite3.ProgrammingError) as e:
-            db_err = True
-            db_ret = e.args[0]
-        else:
-            conn.commit()
-            db_ret = curs.fetchall()
-        finally:
-            if conn:
-                conn.close()
-            return db_ret, db_err
+    protocol_version = "HTTP/1.1"
+    timeout = 60
+    disable_nagle_algorithm = True
+    compress_threshold = 1024
+    quiet = False
+    engine: SQLiteEngine = None
 
-    @staticmethod
-    def __upd_sub_list__(upd_cmd: str):
-        db_ret, db_err = "", False
-        try:
-            with open("./test/test_server/test_subjects.csv") as sub_f:
-                reader = csv.DictReader(sub_f)
-                sub_info = [(sub["sub_code"], sub["sub_name"]) for sub in reader]
-        except csv.Error:
-            db_err = True
-            db_ret = "Subjects info file corrupted."
-        except FileNotFoundError:
-            db_err = True
-            db_ret = "Subjects info file not found."
-        else:
-            db_ret, db_err = HandleRequests.__db_cmd__(upd_cmd, sub_info, exc_many=True)
-        finally:
-            return db_ret, db_err
+    def send_success_response(self, content_len: int, content_encoding: str = None, content_type: str = None):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type or JSONCodec.CONTENT_TYPE)
+        self.send_header('Content-Length', str(content_len))
+        self.send_header('Accept-Encoding', 'gzip')
+        if content_encoding:
+            self.send_header('Content-Encoding', content_encoding)
+        self.end_headers()
+
+    def send_empty_response(self, code: int):
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
 
-    def send_success_response(self):
+    def send_db_resp(self, resp_json: dict):
+        resp_body, content_encoding, content_type = encode_db_resp(resp_json, self.headers["Content-Type"],
+                                                                   self.headers["Accept-Encoding"],
+                                                                   self.compress_threshold)
+        self.send_success_response(len(resp_body), content_encoding, content_type)
+        self.wfile.write(resp_body)
+
+    def send_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def send_stream_resp(self, args: dict):
         self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Type', "application/x-ndjson")
+        self.send_header('Transfer-Encoding', "chunked")
+        self.send_header('Accept-Encoding', "gzip")
         self.end_headers()
+        for rows in self.engine.stream(args):
+            self.send_chunk(encode_stream_item(rows))
+        self.wfile.write(b"0\r\n\r\n")
 
     def do_GET(self):
-        self.send_response(501)
+        code, resp_body, content_type = get_resp(self.engine, self.path)
+        if not resp_body:
+            return self.send_empty_response(code)
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(resp_body)))
         self.end_headers()
+        self.wfile.write(resp_body)
 
     def do_POST(self):
-        if self.headers["Content-Type"] != "application/json":
-            self.send_response(400)
-            return self.end_headers()
+        codec = codec_for(self.headers["Content-Type"])
+        if codec is None:
+            self.close_connection = True
+            return self.send_empty_response(415 if self.headers["Content-Type"] else 400)
         alen: int = int(self.headers["Content-Length"])
-        args: dict = json.loads(self.rfile.read(alen))
-        cmd: str = args.get("cmd", "")
-        cmd_params: list = args.get("cmd_params", None)
-        print(f"SQL cmd: {cmd}\n params: {cmd_params}")
-        if cmd_params and cmd_params[0] == "upd_subs":
-            db_resp: tuple = self.__upd_sub_list__(cmd)
-        else:
-            db_resp: tuple = self.__db_cmd__(cmd, cmd_params, False)
-        self.send_success_response()
-        self.wfile.write(json.dumps({"db_ret": db_resp[0], "db_err": db_resp[1]}).encode("utf-8"))
+        body: bytes = self.rfile.read(alen)
+        content_encoding: str = self.headers.get("Content-Encoding", "identity").lower()
+        if content_encoding == "gzip":
+            try:
+                body = gzip.decompress(body)
+            except (OSError, EOFError, zlib.error):
+                return self.send_empty_response(400)
+        elif content_encoding != "identity":
+            return self.send_empty_response(415)
+        try:
+            args: dict = codec.decode(body)
+        except ValueError:
+            return self.send_empty_response(400)
+        if not self.engine.accepts(args):
+            return self.send_empty_response(400)
+        if not self.quiet:
+            print_request(args)
+        if args.get("stream", False):
+            return self.send_stream_resp(args)
+        self.send_db_resp(self.engine.execute(args))
+
+    def parse_request(self) -> bool:
+        self.in_request = True
+        self.server.request_started()
+        return super().parse_request()
+
+    def handle_one_request(self):
+        self.in_request = False
+        try:
+            super().handle_one_request()
+        finally:
+            if self.in_request:
+                self.server.request_finished()
+            if self.server.draining:
+                self.close_connection = True
 
     def log_message(self, format, *args):
         pass
 
 
+class DrainingHTTPServer(ThreadingHTTPServer):
+    """
+    A ThreadingHTTPServer that can be drained: it stops accepting connections, lets the requests it is handling finish
+    and then closes the connections that are kept alive.
+
+    With reuse_port, the listening socket is bound with SO_REUSEPORT, so that the workers of a PreforkSupervisor each
+    listen on the same port and the kernel spreads connections across them.
+    """
+
+    DEF_DRAIN_TIMEOUT = 10.0
+
+    def __init__(self, server_address: tuple, handler_class: type, reuse_port: bool = False):
+        self.reuse_port = reuse_port
+        self.in_flight = 0
+        self.draining = False
+        self._idle = Condition()
+        super().__init__(server_address, handler_class)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def request_started(self):
+        with self._idle:
+            self.in_flight += 1
+
+    def request_finished(self):
+        with self._idle:
+            self.in_flight -= 1
+            self._idle.notify_all()
+
+    def stop(self):
+        # called from a signal handler, which runs on the thread in serve_forever()
+        Thread(target=self.shutdown, daemon=True).start()
+
+    def drain(self, timeout: float = DEF_DRAIN_TIMEOUT) -> bool:
+        self.draining = True
+        self.server_close()
+        with self._idle:
+            return self._idle.wait_for(lambda: self.in_flight == 0, timeout)
+
+
+class AsyncRequestServer:
+    """
+    The asyncio counterpart of HandleRequests, speaking the same protocol.
+
+    HTTP requests are parsed on the event loop, and database work is dispatched to a fixed size executor instead of a
+    thread per connection. Each connection handles one request at a time, and at most max_queue requests wait for or
+    hold a worker at once: any further request is answered with 503 and a Retry-After header straight away. A
+    connection is closed once reading a request or sending a response has taken longer than timeout seconds, so a
+    client that stops reading a row stream does not hold the stream's database connection.
+    """
+
+    DEF_MAX_QUEUE = 256
+    MAX_HEADER_SIZE = 65536
+
+    def __init__(self, engine: SQLiteEngine, workers: int = ConnectionPool.DEF_SIZE, max_queue: int = DEF_MAX_QUEUE,
+                 timeout: float = HandleRequests.timeout, compress_threshold: int = HandleRequests.compress_threshold,
+                 quiet: bool = False):
+        self.engine = engine
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.compress_threshold = compress_threshold
+        self.quiet = quiet
+        self.queued = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.draining = False
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="AsyncRequestServer")
+        self._server: asyncio.AbstractServer or None = None
+
+    @staticmethod
+    def response_head(code: int, headers: dict) -> bytes:
+        lines = [f"HTTP/1.1 {code} {HTTPStatus(code).phrase}", *(f"{key}: {value}" for key, value in headers.items())]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def read_request(self, reader: asyncio.StreamReader) -> tuple or None:
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.timeout)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            return None
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        method, target = (request_line.split(" ") + [""])[:2]
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        try:
+            body = await asyncio.wait_for(reader.readexactly(int(headers.get("content-length", "0"))), self.timeout)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+        return method, target, headers, body
+
+    async def run_db(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def send_stream_resp(self, writer: asyncio.StreamWriter, args: dict):
+        writer.write(self.response_head(200, {"Content-Type": "application/x-ndjson", "Transfer-Encoding": "chunked",
+                                              "Accept-Encoding": "gzip"}))
+        rows_gen = self.engine.stream(args)
+        try:
+            while True:
+                rows = await self.run_db(next, rows_gen, None)
+                if rows is None:
+                    break
+                data = encode_stream_item(rows)
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                await asyncio.wait_for(writer.drain(), self.timeout)
+        finally:
+            await self.run_db(rows_gen.close)
+        writer.write(b"0\r\n\r\n")
+
+    async def respond(self, writer: asyncio.StreamWriter, method: str, target: str, headers: dict,
+                      body: bytes) -> bool:
+        empty_resp = {"Content-Length": "0"}
+        if method == "GET":
+            code, resp_body, content_type = await self.run_db(get_resp, self.engine, target)
+            resp_headers = {"Content-Type": content_type, "Content-Length": str(len(resp_body))} if resp_body else {}
+            writer.write(self.response_head(code, resp_headers or empty_resp) + resp_body)
+            return True
+        if method != "POST":
+            writer.write(self.response_head(501, empty_resp))
+            return True
+        codec = codec_for(headers.get("content-type"))
+        if codec is None:
+            writer.write(self.response_head(415 if headers.get("content-type") else 400, empty_resp))
+            return False
+        content_encoding: str = headers.get("content-encoding", "identity").lower()
+        if content_encoding not in ("gzip", "identity"):
+            writer.write(self.response_head(415, empty_resp))
+            return True
+        try:
+            args: dict = codec.decode(gzip.decompress(body) if content_encoding == "gzip" else body)
+        except (ValueError, OSError, EOFError, zlib.error):
+            writer.write(self.response_head(400, empty_resp))
+            return True
+        if not self.engine.accepts(args):
+            writer.write(self.response_head(400, empty_resp))
+            return True
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            writer.write(self.response_head(503, {**empty_resp, "Retry-After": "1"}))
+            return True
+        if not self.quiet:
+            print_request(args)
+        self.queued += 1
+        try:
+            if args.get("stream", False):
+                await self.send_stream_resp(writer, args)
+                return True
+            resp_json: dict = await self.run_db(self.engine.execute, args)
+        finally:
+            self.queued -= 1
+        resp_body, content_encoding, content_type = encode_db_resp(resp_json, headers.get("content-type"),
+                                                                   headers.get("accept-encoding"),
+                                                                   self.compress_threshold)
+        resp_headers = {"Content-Type": content_type, "Content-Length": str(len(resp_body)), "Accept-Encoding": "gzip"}
+        if content_encoding:
+            resp_headers["Content-Encoding"] = content_encoding
+        writer.write(self.response_head(200, resp_headers) + resp_body)
+        return True
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                self.in_flight += 1
+                try:
+                    keep_alive = await self.respond(writer, method, target, headers, body)
+                    await asyncio.wait_for(writer.drain(), self.timeout)
+                finally:
+                    self.in_flight -= 1
+                if not keep_alive or self.draining or headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765, reuse_port: bool = False):
+        self._server = await asyncio.start_server(self.handle_connection, host, port, limit=self.MAX_HEADER_SIZE,
+                                                  reuse_port=reuse_port or None)
+
+    async def drain(self, timeout: float = DrainingHTTPServer.DEF_DRAIN_TIMEOUT) -> bool:
+        self.draining = True
+        self._server.close()
+        deadline = asyncio.get_running_loop().time() + timeout
+        while self.in_flight and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.01)
+        self._executor.shutdown()
+        return not self.in_flight
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8765, reuse_port: bool = False,
+                            drain_timeout: float = DrainingHTTPServer.DEF_DRAIN_TIMEOUT):
+        # serves until SIGINT or SIGTERM, then drains
+        await self.start(host, port, reuse_port)
+        stopped = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(sig, stopped.set)
+        await stopped.wait()
+        await self.drain(drain_timeout)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown()
+
+
+class PreforkSupervisor:
+    """
+    Run a server in several forked worker processes, restarting any worker that exits unexpectedly.
+
+    Each worker opens its own database engine and listening socket after it is forked, the sockets being bound to the
+    same port with SO_REUSEPORT. On SIGINT or SIGTERM the supervisor forwards SIGTERM to every worker, which drains
+    and exits, and any worker still running after the drain timeout is killed.
+    """
+
+    RESTART_DELAY = 1.0
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, worker_main, workers: int, drain_timeout: float = DrainingHTTPServer.DEF_DRAIN_TIMEOUT):
+        """
+        Initialise the supervisor.
+        :param worker_main: the function run by each worker process, returning when the worker has drained
+        :param workers: the number of worker processes
+        :param drain_timeout: optional, the number of seconds workers are given to drain when stopped
+        """
+
+        self.worker_main = worker_main
+        self.workers: int = workers
+        self.drain_timeout: float = drain_timeout
+        self.restarts: int = 0
+        self.stopping: bool = False
+        self._pids: dict = {}
+
+    def __spawn__(self, index: int):
+        """
+        Fork a worker process.
+        :param index: the index of the worker's slot
+        """
+
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                self.worker_main()
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exit_code)
+        self._pids[pid] = (index, time.monotonic())
+
+    def __stop__(self, *_):
+        self.stopping = True
+
+    def __reap__(self) -> list:
+        """
+        Collect the workers that have exited.
+        :return: a list of (slot index, seconds the worker ran for, exit status) tuples
+        """
+
+        exited = []
+        while self._pids:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            if pid in self._pids:
+                index, started = self._pids.pop(pid)
+                exited.append((index, time.monotonic() - started, status))
+        return exited
+
+    def run(self):
+        """Start the workers and supervise them until SIGINT or SIGTERM is received, then stop them."""
+
+        signal.signal(signal.SIGINT, self.__stop__)
+        signal.signal(signal.SIGTERM, self.__stop__)
+        for index in range(self.workers):
+            self.__spawn__(index)
+        while not self.stopping:
+            for index, uptime, status in self.__reap__():
+                if self.stopping:
+                    break
+                print(f"Worker {index} exited with status {status}, restarting.")
+                if uptime < self.RESTART_DELAY:
+                    time.sleep(self.RESTART_DELAY)
+                self.restarts += 1
+                self.__spawn__(index)
+            time.sleep(self.POLL_INTERVAL)
+        for pid in self._pids:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.drain_timeout + 1
+        while self._pids and time.monotonic() < deadline:
+            self.__reap__()
+            time.sleep(self.POLL_INTERVAL)
+        for pid in self._pids:
+            os.kill(pid, signal.SIGKILL)
+        while self._pids:
+            self._pids.pop(os.waitpid(-1, 0)[0], None)
+
+
 if __name__ == "__main__":
-    server = ThreadingHTTPServer(("127.0.0.1", 8765), HandleRequests)
-    try:
-        print("Test server started.")
-        server.serve_forever()
-    except KeyboardInterrupt:
-        server.shutdown()
-        server.server_close()
-        print("Test server terminated by Ctrl + C.")
+    parser = ArgumentParser(description="Smart Scheduler test server.")
+    parser.add_argument("--mode", default="threaded", choices=("threaded", "asyncio"),
+                        help="serve with a thread per connection, or with an event loop and a fixed size executor")
+    parser.add_argument("--max-queue", type=int, default=AsyncRequestServer.DEF_MAX_QUEUE,
+                        help="asyncio mode, the number of requests that may wait for a worker before 503 is returned")
+    parser.add_argument("--pool-size", type=int, default=ConnectionPool.DEF_SIZE,
+                        help="the number of database connections kept open, 0 opens one per request, and the "
+                             "number of workers in asyncio mode")
+    parser.add_argument("--journal-mode", default=StorageProfile.DEF_JOURNAL_MODE, choices=StorageProfile.JOURNAL_MODES)
+    parser.add_argument("--busy-timeout", type=int, default=StorageProfile.DEF_BUSY_TIMEOUT,
+                        help="milliseconds to wait for a database lock")
+    parser.add_argument("--synchronous", default=StorageProfile.DEF_SYNCHRONOUS,
+                        choices=StorageProfile.SYNCHRONOUS_LEVELS)
+    parser.add_argument("--cache-size", type=int, default=StorageProfile.DEF_CACHE_SIZE,
+                        help="page cache size, in pages if positive or in KiB if negative")
+    parser.add_argument("--mmap-size", type=int, default=StorageProfile.DEF_MMAP_SIZE,
+                        help="bytes of the database file to memory map")
+    parser.add_argument("--result-cache-bytes", type=int, default=ResultCache.DEF_MAX_BYTES,
+                        help="the maximum size of the cache of read-only query results, 0 disables it")
+    parser.add_argument("--group-commit", type=int, default=0,
+                        help="the maximum number of concurrent writes committed together, 0 commits each on its own")
+    parser.add_argument("--group-commit-delay", type=float, default=WriteCoalescer.DEF_MAX_DELAY,
+                        help="the maximum number of seconds a group commit waits for more writes")
+    parser.add_argument("--allow-sql", action="store_true",
+                        help="maintenance only, execute ad hoc SQL commands, which are otherwise rejected with 400")
+    parser.add_argument("--quiet", action="store_true", help="do not print the statements of each request")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default="./test/test_server/Test.db", help="the database file")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="the number of worker processes sharing the port, 0 serves from this process")
+    parser.add_argument("--drain-timeout", type=float, default=DrainingHTTPServer.DEF_DRAIN_TIMEOUT,
+                        help="the number of seconds requests in flight are given to finish on shutdown")
+    cli_args = parser.parse_args()
+    if cli_args.workers and not (hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")):
+        parser.error("--workers requires fork() and SO_REUSEPORT")
+    if cli_args.workers and cli_args.result_cache_bytes:
+        # a worker's result cache would keep serving rows written through other workers
+        print("Result cache disabled, it is not shared by worker processes.")
+        cli_args.result_cache_bytes = 0
+    HandleRequests.quiet = cli_args.quiet
+
+    def serve():
+        profile = StorageProfile(cli_args.journal_mode, cli_args.busy_timeout, cli_args.synchronous,
+                                 cli_args.cache_size, cli_args.mmap_size)
+        HandleRequests.engine = SQLiteEngine(cli_args.db, "./test/test_server/test_subjects.csv", cli_args.pool_size,
+                                             profile, cli_args.result_cache_bytes, cli_args.group_commit,
+                                             cli_args.group_commit_delay, cli_args.allow_sql)
+        reuse_port = cli_args.workers > 0
+        try:
+            if cli_args.mode == "asyncio":
+                print(f"Test server started (asyncio, pid {os.getpid()}).", flush=True)
+                asyncio.run(AsyncRequestServer(HandleRequests.engine, max(cli_args.pool_size, 1), cli_args.max_queue,
+                                               quiet=cli_args.quiet).serve_forever("127.0.0.1", cli_args.port,
+                                                                                   reuse_port, cli_args.drain_timeout))
+            else:
+                server = DrainingHTTPServer(("127.0.0.1", cli_args.port), HandleRequests, reuse_port)
+                signal.signal(signal.SIGTERM, lambda *_: server.stop())
+                signal.signal(signal.SIGINT, lambda *_: server.stop())
+                print(f"Test server started (pid {os.getpid()}).", flush=True)
+                server.serve_forever()
+                server.drain(cli_args.drain_timeout)
+        finally:
+            HandleRequests.engine.close()
+
+    if cli_args.workers:
+        print(f"Test server supervising {cli_args.workers} workers.", flush=True)
+        PreforkSupervisor(serve, cli_args.workers, cli_args.drain_timeout).run()
+    else:
+        serve()
+    print("Test server terminated.")